@@ -171,6 +171,8 @@ def tests(session: Session) -> None:
         "beautifulsoup4",
         "types-beautifulsoup4",
         "html5lib",
+        "lxml",
+        "brotli",
         "jinja2",
         "markdown-it-py",
         "python-frontmatter",
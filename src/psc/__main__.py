@@ -1,18 +1,32 @@
 """Command-line interface for PSC."""
 import os
-import tarfile
 from pathlib import Path
-from shutil import copytree
-from tempfile import TemporaryDirectory
+from shutil import copyfile
 
 import typer
-import uvicorn
-from starlette.testclient import TestClient
-from urllib3 import HTTPResponse
 from urllib3 import PoolManager
 
+from psc import settings
+from psc.build import build_site
+from psc.compact import get_memory_report
+from psc.compression import CompressionReport
+from psc.compression import write_sidecars
+from psc.download import fetch_all
+from psc.download import get_artifacts
+from psc.download import install_pyodide
 from psc.here import HERE
+from psc.here import LOCKFILE
+from psc.here import PYODIDE
+from psc.here import PYSCRIPT
+from psc.here import STATIC
+from psc.lock import PYPI_URL
+from psc.lock import get_repodata
+from psc.lock import lock_packages
+from psc.lock import write_lockfile
 from psc.resources import get_resources
+from psc.server import get_config
+from psc.server import serve
+from psc.snapshot import write_snapshot
 
 
 app = typer.Typer()
@@ -31,117 +45,181 @@ def rmtree(root: Path) -> None:
 
 @app.command()
 def download(
-    dry_run: bool = typer.Option(False, "--dry-run")
+    dry_run: bool = typer.Option(False, "--dry-run"),
+    allow_unverified: bool = typer.Option(
+        False,
+        "--allow-unverified",
+        help="Trust Pyodide without PSC_PYODIDE_SHA256, as first downloaded.",
+    ),
 ) -> None:  # pragma: no cover
     """Download Pyodide and PyScript distributions into project dir."""
     http = PoolManager()
+    artifacts = get_artifacts(
+        settings.DOWNLOAD_CACHE,
+        settings.DOWNLOAD_MIRROR,
+        settings.PYSCRIPT_VERSION,
+        settings.PYODIDE_SHA256,
+        allow_unverified,
+    )
+    paths = fetch_all(http, artifacts)
+
+    # Unpack Pyodide, and copy PyScript, from the cache
+    install_pyodide(paths.pop("pyodide"), PYODIDE, dry_run)
+    if not dry_run:
+        print("Downloaded Pyodide")
+        for name, path in paths.items():
+            copyfile(path, PYSCRIPT / name)
+        print("Downloaded PyScript")
+        compress()
 
-    # Get Pyodide first
-    pyodide_url_prefix = "https://github.com/pyodide/pyodide/releases/download"
-    pyodide_url = f"{pyodide_url_prefix}/0.21.3/pyodide-build-0.21.3.tar.bz2"
-    pyodide_request: HTTPResponse = http.request("GET", pyodide_url)  # type: ignore
-    with TemporaryDirectory() as tmp_dir_name:
-        os.chdir(tmp_dir_name)
-        tmp_dir = Path(tmp_dir_name)
-        temp_file = tmp_dir / "pyodide.tar.bz2"
-        temp_file.write_bytes(pyodide_request.data)
-        tar = tarfile.open(temp_file)
-        tar.extractall()
-        target = HERE / "pyodide"
-        if not dry_run:
-            copytree(tmp_dir / "pyodide", target, dirs_exist_ok=True)
-            print("Downloaded Pyodide")
-
-    # Next, PyScript
-    filenames = ("pyscript.js", "pyscript.js.map")
-    for fn in filenames:
-        pyscript_url = f"https://pyscript.net/latest/{fn}"
-        pyscript_request: HTTPResponse = http.request(
-            "GET", pyscript_url
-        )  # type: ignore
-        if not dry_run:
-            target = HERE / "pyscript"
-            if not dry_run:
-                with open(target / fn, "wb") as pyscript_output:
-                    pyscript_output.write(pyscript_request.data)
-
-            print("Downloaded PyScript")
+
+@app.command()
+def lock(
+    index_url: str = typer.Option(PYPI_URL, help="PyPI, or a mirror of it.")
+) -> None:  # pragma: no cover
+    """Pin each example's packages to exact wheels in the lockfile."""
+    http = PoolManager()
+    repodata = get_repodata(http)
+    examples = {}
+    for example in get_resources(lazy=True).examples.values():
+        if example.packages:
+            locked = lock_packages(example.packages, repodata, http, index_url)
+            examples[example.name] = (example.packages, locked)
+    write_lockfile(examples)
+    count = sum(len(locked) for _, locked in examples.values())
+    print(f"Locked {count} packages for {len(examples)} examples in {LOCKFILE}")
 
 
 @app.command()
-def build() -> None:  # pragma: no cover
+def compress() -> None:
+    """Write .br and .gz sidecars for the static, PyScript and Pyodide files."""
+    report = CompressionReport()
+    for root in (STATIC, PYSCRIPT, PYODIDE):
+        if root.exists():
+            write_sidecars(root, report)
+    saved = report.original_bytes - report.compressed_bytes
+    print(f"Compressed {report.written} files, {report.skipped} already done")
+    print(f"Saved {saved:,} bytes")
+
+
+@app.command()
+def build(
+    jobs: int = typer.Option(
+        os.cpu_count() or 1, "--jobs", "-j", help="Processes rendering pages."
+    ),
+    clean: bool = typer.Option(False, help="Remove the last build first."),
+    link: bool = typer.Option(
+        False, help="Hardlink the runtime files instead of copying them."
+    ),
+    minify: bool = typer.Option(False, help="Minify the HTML, CSS and JS."),
+    compress: bool = typer.Option(False, help="Write .gz and .br siblings."),
+    all_packages: bool = typer.Option(
+        False, help="Publish every Pyodide package, not just those used."
+    ),
+    verbose: bool = typer.Option(
+        False, "--verbose", "-v", help="List each file written, copied or removed."
+    ),
+) -> None:
     """Write the export to a public directory."""
     print("Building to the public directory")
 
-    # If the target directory exists, remove it, then copy everything
-    # under src/psc to the target
+    # Only what changed since the last build is written, unless cleaning
     public = HERE.parent.parent / "dist/public"
-    if public.exists():
+    if clean and public.exists():
         rmtree(public)
-    copytree(HERE, public)
-
-    # Setup test client async with our app
-    from psc.app import app as web_app
-
-    with TestClient(web_app) as test_client:
-        # Render the home page then write to the output directory
-        response = test_client.get("/")
-        assert response.status_code == 200
-        html = response.text
-        output = public / "index.html"
-        output.write_text(html)
-
-        # Same for gallery page
-        response = test_client.get("/gallery/index.html")
-        assert response.status_code == 200
-        html = response.text
-        with open(public / "gallery/index.html", "w") as f:
-            f.write(html)
-
-        # Now for each page
-        resources = get_resources()
-        for page in resources.pages.values():
-            response = test_client.get(f"/pages/{page.name}.html")
-            output = public / f"pages/{page.name}.html"
-            output.write_text(response.text)
-
-        # Now for authors and each author
-        response = test_client.get("/authors/index.html")
-        assert response.status_code == 200
-        html = response.text
-        with open(public / "gallery/authors/index.html", "w") as f:
-            f.write(html)
-        for author in resources.authors.values():
-            response = test_client.get(f"/authors/{author.name}.html")
-            output = public / f"gallery/authors/{author.name}.html"
-            output.write_text(response.text)
-
-        for page in resources.pages.values():
-            response = test_client.get(f"/pages/{page.name}.html")
-            output = public / f"pages/{page.name}.html"
-            output.write_text(response.text)
-
-        # And for each example
-        for example in resources.examples.values():
-            url = f"/gallery/examples/{example.name}/index.html"
-            response = test_client.get(url)
-            output = public / f"gallery/examples/{example.name}/index.html"
-            output.write_text(response.text)
-
-            # Now build the code page
-            url = f"/gallery/examples/{example.name}/code.html"
-            response = test_client.get(url)
-            output = public / f"gallery/examples/{example.name}/code.html"
-            output.write_text(response.text)
+
+    report = build_site(public, jobs, link, minify, compress, all_packages)
+    if verbose:
+        for action, paths in (
+            ("Rendered", report.written),
+            ("Copied", report.copied),
+            ("Removed", report.removed),
+        ):
+            for path in paths:
+                print(f"{action} {path}")
+    print(
+        f"Rendered {len(report.written)} pages and copied {len(report.copied)}"
+        f" files in {report.seconds:.2f}s"
+    )
+    print(
+        f"Skipped {len(report.skipped)} unchanged,"
+        f" removed {len(report.removed)} no longer built"
+    )
+    if report.unused:
+        print(f"Left out {len(report.unused)} unused Pyodide package files")
+    if report.missing:
+        print(f"Installed from PyPI at runtime: {', '.join(report.missing)}")
+    if report.unlocked and not all_packages:
+        print(
+            f"Kept every Pyodide package, as {', '.join(report.unlocked)}"
+            " may need any of them. Run psc lock to pin their dependencies."
+        )
+    for suffix, savings in sorted(report.savings.items()):
+        sizes = [f"{savings.original:,} bytes"]
+        if minify:
+            sizes.append(f"minified {savings.minified:,}")
+        if compress:
+            sizes.extend(f"{e} {n:,}" for e, n in savings.compressed.items())
+        print(f"{suffix or '(none)'}: {savings.files} files, {', '.join(sizes)}")
+
+
+@app.command()
+def memory() -> None:
+    """Report the memory used per example, regular vs. compact models."""
+    report = get_memory_report(get_resources())
+    print(f"Examples: {report['examples']:.0f}")
+    print(f"Regular: {report['regular']:,.0f} bytes per example")
+    print(f"Compact: {report['compact']:,.0f} bytes per example")
+
+
+@app.command()
+def snapshot(
+    output: Path = typer.Option(
+        None, "--output", help="Where to write, defaults to PSC_SNAPSHOT."
+    )
+) -> None:
+    """Save the loaded resources, for the app to read at startup."""
+    target = output or settings.SNAPSHOT_PATH
+    resources = get_resources(
+        loader=settings.LOADER, max_workers=settings.LOADER_WORKERS
+    )
+    size = write_snapshot(resources, target)
+    print(f"Wrote {size:,} bytes to {target}")
 
 
 # @app.callback(invoke_without_command=True)
 @app.command()
-def start(dry_run: bool = typer.Option(False, "--dry-run")) -> None:  # pragma: no cover
+def start(
+    dry_run: bool = typer.Option(False, "--dry-run"),
+    watch: bool = typer.Option(False, "--watch", help="Reload changed resources."),
+    production: bool = typer.Option(
+        False, help="No debugging, resources loaded once before forking workers."
+    ),
+    host: str = typer.Option(settings.HOST),
+    port: int = typer.Option(settings.PORT),
+    workers: int = typer.Option(settings.WORKERS, min=1),
+    loop: str = typer.Option("auto", help="auto, asyncio or uvloop."),
+    http: str = typer.Option("auto", help="auto, h11 or httptools."),
+    keep_alive: int = typer.Option(
+        settings.KEEP_ALIVE, help="Seconds to hold an idle connection open."
+    ),
+    graceful_timeout: float = typer.Option(
+        settings.GRACEFUL_TIMEOUT, help="Seconds for workers to finish on shutdown."
+    ),
+) -> None:
     """Default command, used to start the server."""
+    if watch:
+        # The settings were read at import, so set the setting itself
+        settings.WATCH = True
+    if workers > 1 and not hasattr(os, "fork"):  # pragma: no cover
+        raise typer.BadParameter("Several workers need os.fork", param_hint="workers")
+    config = get_config(host, port, loop, http, keep_alive)
+    mode = "production" if production else "debug"
+    summary = f"{mode} mode, {workers} worker(s) on http://{host}:{port}"
+
     # If running from the test, we don't want to actually start server
     if dry_run:
-        print("Skipping server startup")
+        print(f"Skipping server startup: {summary}")
     else:
-        print("Starting server")
-        uvicorn.run("psc:app", port=3000, log_level="info")  # pragma: no cover
+        print(f"Starting server: {summary}")
+        serve(config, workers, graceful_timeout, production)  # pragma: no cover
@@ -1,33 +1,73 @@
 """Provide a web server to browse the examples."""
 import contextlib
+from collections.abc import Iterable
 from collections.abc import Iterator
+from time import perf_counter
 from typing import AsyncContextManager
 
+import anyio
 from starlette.applications import Starlette
+from starlette.exceptions import HTTPException
+from starlette.middleware import Middleware
 from starlette.requests import Request
 from starlette.responses import FileResponse
+from starlette.responses import JSONResponse
+from starlette.responses import Response
+from starlette.responses import StreamingResponse
 from starlette.routing import Mount
 from starlette.routing import Route
-from starlette.staticfiles import StaticFiles
-from starlette.templating import Jinja2Templates
 from starlette.templating import _TemplateResponse
 
+from psc import settings
+from psc.cache import ResourceCache
+from psc.compact import compact_resources
+from psc.compression import PrecompressedStaticFiles
+from psc.fingerprint import FingerprintedStaticFiles
+from psc.fingerprint import add_digest
+from psc.fingerprint import asset
+from psc.fingerprint import fingerprint_references
+from psc.fingerprint import fingerprints
 from psc.here import HERE
 from psc.here import PYODIDE
 from psc.here import PYSCRIPT
+from psc.metrics import MetricsMiddleware
+from psc.metrics import TimedTemplates
+from psc.metrics import metrics_page
+from psc.metrics import record_resources_load
+from psc.page_cache import PageCache
+from psc.page_cache import cached_page
+from psc.profiling import ProfilingMiddleware
+from psc.reload import ResourceWatcher
 from psc.resources import Example
 from psc.resources import Resources
 from psc.resources import get_resources
+from psc.runtime import IMMUTABLE
+from psc.runtime import RuntimeFiles
+from psc.snapshot import load_snapshot
 
 
-templates = Jinja2Templates(directory=HERE / "templates")
+templates = TimedTemplates(directory=HERE / "templates", auto_reload=settings.DEBUG)
+templates.env.globals["asset"] = asset
+GALLERY_SUBTITLE = (
+    "Curated examples, runnable from this website or locally installable."
+)
 
 
 async def favicon(request: Request) -> FileResponse:
-    """Handle the favicon."""
-    return FileResponse(HERE / "favicon.png")
-
-
+    """Handle the favicon, cached for good under its fingerprinted name."""
+    digest = request.path_params.get("digest")
+    if digest is None:
+        return FileResponse(HERE / "favicon.png")
+    fingerprinted = add_digest("favicon.png", digest)
+    if fingerprints.resolve(fingerprinted) is None:
+        raise HTTPException(status_code=404)
+    headers = {}
+    if fingerprints.is_current(fingerprinted, "favicon.png"):
+        headers["cache-control"] = IMMUTABLE
+    return FileResponse(HERE / "favicon.png", headers=headers)
+
+
+@cached_page()
 async def homepage(request: Request) -> _TemplateResponse:
     """Handle the home page."""
     index_file = HERE / "index.html"
@@ -44,25 +84,63 @@ async def homepage(request: Request) -> _TemplateResponse:
     )
 
 
-async def gallery(request: Request) -> _TemplateResponse:
-    """Handle the gallery listing page."""
-    resources = request.app.state.resources
-    these_examples: Iterator[Example] = resources.examples.values()
-    root_path = ".."
-    these_authors = resources.authors
+def render_gallery(
+    request: Request,
+    these_examples: Iterable[Example],
+    root_path: str,
+    subtitle: str = GALLERY_SUBTITLE,
+) -> _TemplateResponse:
+    """Render the gallery listing for some or all of the examples."""
+    resources: Resources = request.app.state.resources
 
     return templates.TemplateResponse(
         "gallery.jinja2",
         dict(
             title="Gallery",
+            subtitle=subtitle,
             examples=these_examples,
             root_path=root_path,
             request=request,
-            authors=these_authors,
+            authors=resources.authors,
+            tags=resources.tag_examples,
+            packages=resources.package_examples,
         ),
     )
 
 
+@cached_page()
+async def gallery(request: Request) -> _TemplateResponse:
+    """Handle the gallery listing page."""
+    resources: Resources = request.app.state.resources
+    return render_gallery(request, resources.examples.values(), "..")
+
+
+@cached_page()
+async def gallery_tag(request: Request) -> _TemplateResponse:
+    """Handle the gallery, filtered to the examples with a tag."""
+    tag = request.path_params["tag"]
+    resources: Resources = request.app.state.resources
+    if tag not in resources.tag_examples:
+        raise HTTPException(status_code=404)
+    these_examples = [resources.examples[n] for n in resources.tag_examples[tag]]
+    return render_gallery(request, these_examples, "../..", f"Examples tagged {tag}.")
+
+
+@cached_page()
+async def gallery_package(request: Request) -> _TemplateResponse:
+    """Handle the gallery, filtered to the examples using a package."""
+    package = request.path_params["package"]
+    resources: Resources = request.app.state.resources
+    if package not in resources.package_examples:
+        raise HTTPException(status_code=404)
+    these_examples = [
+        resources.examples[n] for n in resources.package_examples[package]
+    ]
+    subtitle = f"Examples using {package}."
+    return render_gallery(request, these_examples, "../..", subtitle)
+
+
+@cached_page()
 async def authors(request: Request) -> _TemplateResponse:
     """Handle the author listing page."""
     these_authors: Iterator[Example] = request.app.state.resources.authors.values()
@@ -79,30 +157,37 @@ async def authors(request: Request) -> _TemplateResponse:
     )
 
 
+@cached_page()
 async def author(request: Request) -> _TemplateResponse:
     """Handle an author page."""
     author_name = request.path_params["author_name"]
     resources: Resources = request.app.state.resources
     this_author = resources.authors[author_name]
+    these_examples = [
+        resources.examples[n] for n in resources.author_examples.get(author_name, ())
+    ]
     root_path = "../.."
 
     return templates.TemplateResponse(
-        "example.jinja2",
+        "author.jinja2",
         dict(
             title=this_author.title,
             body=this_author.body,
+            examples=these_examples,
             request=request,
             root_path=root_path,
         ),
     )
 
 
+@cached_page(vary=lambda request: request.headers.get("user-agent") == "testclient")
 async def example(request: Request) -> _TemplateResponse:
     """Handle an example page."""
     example_name = request.path_params["example_name"]
     resources: Resources = request.app.state.resources
     this_example = resources.examples[example_name]
     root_path = "../../.."
+    directory = f"gallery/examples/{example_name}"
     author_name = this_example.author
     if author_name:
         this_author = resources.authors.get(author_name, None)
@@ -122,8 +207,8 @@ async def example(request: Request) -> _TemplateResponse:
         dict(
             title=this_example.title,
             subtitle=this_example.subtitle,
-            extra_head=this_example.extra_head,
-            body=this_example.body,
+            extra_head=fingerprint_references(this_example.extra_head, directory),
+            body=fingerprint_references(this_example.body, directory),
             request=request,
             root_path=root_path,
             pyscript_url=pyscript_url,
@@ -132,25 +217,56 @@ async def example(request: Request) -> _TemplateResponse:
     )
 
 
-async def example_code(request: Request) -> _TemplateResponse:
+@cached_page()
+async def example_code(request: Request) -> Response:
     """Handle the linked files for the code example."""
     example_name = request.path_params["example_name"]
     resources: Resources = request.app.state.resources
     this_example = resources.examples[example_name]
     root_path = "../../.."
+    context = dict(
+        title=f"{this_example.title} Code",
+        extra_head=this_example.extra_head,
+        request=request,
+        root_path=root_path,
+        linked_files=this_example.linked_files,
+        max_size=settings.LINKED_FILE_MAX_SIZE,
+    )
+
+    if settings.STREAM_LINKED_FILES:
+        # Send the page as the linked files get read, not all at once
+        template = templates.get_template("example_code.jinja2")
+        return StreamingResponse(template.generate(context), media_type="text/html")
+    return templates.TemplateResponse("example_code.jinja2", context)
+
+
+async def search(request: Request) -> _TemplateResponse:
+    """Handle the search page, with results when there is a query."""
+    query = request.query_params.get("q", "").strip()
+    resources: Resources = request.app.state.resources
+    results = resources.search_index.search(query) if query else []
+    root_path = ".."
 
     return templates.TemplateResponse(
-        "example_code.jinja2",
+        "search.jinja2",
         dict(
-            title=f"{this_example.title} Code",
-            extra_head=this_example.extra_head,
-            request=request,
+            title="Search",
+            query=query,
+            results=results,
             root_path=root_path,
-            linked_files=this_example.linked_files,
+            request=request,
         ),
     )
 
 
+@cached_page()
+async def search_index(request: Request) -> JSONResponse:
+    """Handle the prebuilt index, used for searching the static site."""
+    resources: Resources = request.app.state.resources
+    return JSONResponse(resources.search_index.to_json())
+
+
+@cached_page()
 async def content_page(request: Request) -> _TemplateResponse:
     """Handle a content page."""
     page_name = request.path_params["page_name"]
@@ -172,32 +288,73 @@ routes = [
     Route("/", homepage),
     Route("/index.html", homepage),
     Route("/favicon.png", favicon),
+    Route("/favicon.{digest}.png", favicon),
     Route("/gallery/index.html", gallery),
     Route("/gallery", gallery),
+    Route("/gallery/tags/{tag}.html", gallery_tag),
+    Route("/gallery/packages/{package}.html", gallery_package),
     Route("/authors/index.html", authors),
     Route("/authors", authors),
     Route("/authors/{author_name}.html", author),
+    Route("/search/index.html", search),
+    Route("/search/index.json", search_index),
+    Route("/search", search),
     Route("/gallery/examples/{example_name}/index.html", example),
     Route("/gallery/examples/{example_name}/code.html", example_code),
     Route("/gallery/examples/{example_name}/", example),
     Route("/pages/{page_name}.html", content_page),
-    Mount("/gallery", StaticFiles(directory=HERE / "gallery")),
-    Mount("/static", StaticFiles(directory=HERE / "static")),
+    Route("/metrics", metrics_page),
+    Mount("/gallery", FingerprintedStaticFiles(directory=HERE / "gallery")),
+    Mount("/static", FingerprintedStaticFiles(directory=HERE / "static")),
 ]
 if PYODIDE.exists():
-    routes.append(Mount("/pyscript", StaticFiles(directory=PYSCRIPT)))
-    routes.append(Mount("/pyodide", StaticFiles(directory=PYODIDE)))
+    routes.append(Mount("/pyscript", PrecompressedStaticFiles(directory=PYSCRIPT)))
+    routes.append(Mount("/pyodide", RuntimeFiles(directory=PYODIDE)))
+
+
+def get_app_resources(cache: ResourceCache | None = None) -> Resources:
+    """Load the resources as the settings say, from a snapshot if current."""
+    resources = load_snapshot(settings.SNAPSHOT_PATH) or get_resources(
+        loader=settings.LOADER,
+        max_workers=settings.LOADER_WORKERS,
+        cache=cache,
+        lazy=settings.LAZY,
+    )
+    if settings.COMPACT:
+        resources = compact_resources(resources)
+    return resources
 
 
 @contextlib.asynccontextmanager  # type: ignore
 async def lifespan(a: Starlette) -> AsyncContextManager:  # type: ignore
     """Run the resources factory at startup and make available to views."""
-    a.state.resources = get_resources()
-    yield
+    cache = ResourceCache(settings.CACHE_DIR) if settings.CACHE_ENABLED else None
+    preloaded: Resources | None = getattr(a.state, "preloaded", None)
+    if preloaded is not None:
+        a.state.resources = preloaded
+    else:
+        started = perf_counter()
+        a.state.resources = get_app_resources(cache)
+        record_resources_load(perf_counter() - started)
+    use_page_cache = not a.debug if settings.PAGE_CACHE is None else settings.PAGE_CACHE
+    a.state.page_cache = PageCache(settings.PAGE_CACHE_SIZE) if use_page_cache else None
+    async with anyio.create_task_group() as task_group:
+        if settings.WATCH:
+            watcher = ResourceWatcher(a.state.resources, cache, settings.LAZY)
+            task_group.start_soon(watcher.watch, settings.WATCH_INTERVAL)
+        yield
+        task_group.cancel_scope.cancel()
 
 
 app = Starlette(
-    debug=True,
+    debug=settings.DEBUG,
     routes=routes,
     lifespan=lifespan,
+    middleware=[Middleware(MetricsMiddleware), Middleware(ProfilingMiddleware)],
 )
+
+
+def configure_app(debug: bool) -> None:
+    """Turn on or off debug tracebacks, and reloading changed templates."""
+    app.debug = debug
+    templates.env.auto_reload = debug
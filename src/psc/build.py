@@ -0,0 +1,650 @@
+"""Render the whole site to static files, concurrently and incrementally.
+
+The resources are loaded once, exactly as the app's lifespan does,
+then every URL is rendered by calling the ASGI app directly and written
+out from worker threads. With more than one job, the URLs are split
+across forked processes which inherit the loaded resources, so the
+rendering scales with cores.
+
+A manifest in the output directory maps each output file to the hashes
+of the files it was made from: sources, templates, and for listings
+every example. Only outputs with a changed input are made again, and
+any other file in the output directory, in the manifest or not, is
+removed. A change to PSC itself, or to a setting that changes the
+output, rebuilds everything.
+
+Only the files the site serves are published, not the Python sources
+or templates. The manifest keeps each input's size and modification
+time, so a file is only hashed again when those change, and the large
+runtime directories may be hardlinked instead of copied.
+
+Static and example assets are also published under fingerprinted
+names, which the rendered pages refer to. Optionally, each file written
+is then minified and given ``.gz`` and ``.br`` siblings, so a CDN can
+send them as they are.
+"""
+import json
+import multiprocessing
+import os
+import shutil
+from collections.abc import Collection
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dataclasses import field
+from hashlib import sha256
+from pathlib import Path
+from time import perf_counter
+from typing import Any
+
+import anyio
+from starlette.types import ASGIApp
+from starlette.types import Message
+
+from psc import settings
+from psc.app import app as web_app
+from psc.app import get_app_resources
+from psc.compression import ENCODINGS
+from psc.compression import SKIP_SUFFIXES
+from psc.compression import get_available_encodings
+from psc.compression import write_file_sidecars
+from psc.fingerprint import fingerprints
+from psc.fingerprint import is_asset
+from psc.here import HERE
+from psc.lock import get_locked_names
+from psc.lock import read_lockfile
+from psc.minify import minify as minify_text
+from psc.packages import Resolution
+from psc.packages import get_unused_files
+from psc.packages import load_repodata
+from psc.packages import resolve_packages
+from psc.resources import Author
+from psc.resources import Example
+from psc.resources import Page
+from psc.resources import Resources
+from psc.resources import is_local
+
+
+# The example view links the CDN PyScript for this user agent
+BUILD_USER_AGENT = "testclient"
+# Requests in flight at once, per process.
+CONCURRENCY = 16
+MANIFEST = ".psc-manifest.json"
+# Bump when the manifest layout changes.
+MANIFEST_FORMAT = 2
+# The files and directories served as they are, and so published.
+PUBLISHED = ("favicon.png", "static", "gallery/examples", "pyscript", "pyodide")
+# Never published, even under a published directory.
+UNPUBLISHED_NAMES = {"__pycache__", "__init__.py"}
+# Hardlinked, when asked, as they are large and never edited in place.
+LINKED = ("pyscript", "pyodide")
+
+
+@dataclass(frozen=True)
+class Target:
+    """One URL of the site, the file it is written to, and its inputs.
+
+    The inputs are paths relative to the package directory.
+    """
+
+    url: str
+    output: str
+    inputs: tuple[str, ...] = ()
+
+
+@dataclass
+class Savings:
+    """Bytes before and after optimizing the files of one type.
+
+    ``compressed`` is what a client accepting each encoding receives.
+    """
+
+    files: int = 0
+    original: int = 0
+    minified: int = 0
+    compressed: dict[str, int] = field(default_factory=dict)
+
+
+@dataclass
+class Optimized:
+    """What optimizing one output did."""
+
+    original: int
+    minified: int
+    compressed: dict[str, int]
+
+
+@dataclass
+class BuildReport:
+    """What ``build_site`` did, by output path, and savings by suffix.
+
+    ``unused`` has the Pyodide package files left out. ``missing`` has
+    the packages micropip installs from PyPI instead, and ``unlocked``
+    those of them the lockfile doesn't cover, which keep every package.
+    """
+
+    written: list[str] = field(default_factory=list)
+    copied: list[str] = field(default_factory=list)
+    skipped: list[str] = field(default_factory=list)
+    removed: list[str] = field(default_factory=list)
+    unused: list[str] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+    unlocked: list[str] = field(default_factory=list)
+    savings: dict[str, Savings] = field(default_factory=dict)
+    seconds: float = 0.0
+
+    def add_savings(self, relative: str, optimized: Optimized) -> None:
+        """Count one optimized output under its file type."""
+        savings = self.savings.setdefault(Path(relative).suffix, Savings())
+        savings.files += 1
+        savings.original += optimized.original
+        savings.minified += optimized.minified
+        for encoding in get_available_encodings():
+            size = optimized.compressed.get(encoding, optimized.minified)
+            savings.compressed[encoding] = savings.compressed.get(encoding, 0) + size
+
+
+def get_relative_paths(paths: Iterable[Path]) -> list[str]:
+    """Paths relative to the package directory, as in the manifest."""
+    return [p.relative_to(HERE).as_posix() for p in paths]
+
+
+def get_build_targets(resources: Resources) -> list[Target]:
+    """Every rendered URL of the site, with its output path and inputs."""
+    # Templates refer to static files by fingerprinted name
+    static = [
+        relative
+        for relative in get_relative_paths(sorted((HERE / "static").rglob("*")))
+        if is_asset(relative)
+    ]
+
+    def templates(name: str) -> list[str]:
+        layout = ["templates/layout.jinja2", "favicon.png", *static]
+        return [*layout, f"templates/{name}"]
+
+    authors = [p for a in resources.authors for p in Author.source_paths(a)]
+    author_inputs = get_relative_paths(authors)
+    # Listings show the metadata, tags, and packages of every example
+    example_metadata = get_relative_paths(
+        HERE / "gallery/examples" / e / f
+        for e in resources.examples
+        for f in ("index.md", "index.html")
+    )
+    example_sources = {
+        e: get_relative_paths(Example.source_paths(e)) for e in resources.examples
+    }
+    listing = [*example_metadata, *author_inputs]
+    targets = [
+        Target(
+            "/",
+            "index.html",
+            (
+                "index.html",
+                "gallery/examples/altair/screenshot.png",
+                *templates("homepage.jinja2"),
+            ),
+        ),
+        Target(
+            "/gallery/index.html",
+            "gallery/index.html",
+            (*templates("gallery.jinja2"), *listing),
+        ),
+        Target(
+            "/authors/index.html",
+            "gallery/authors/index.html",
+            (*templates("authors.jinja2"), *author_inputs),
+        ),
+        Target(
+            "/search/index.html", "search/index.html", tuple(templates("search.jinja2"))
+        ),
+        Target(
+            "/search/index.json",
+            "search/index.json",
+            (*[p for paths in example_sources.values() for p in paths], *author_inputs),
+        ),
+    ]
+    for filter_name, index in (
+        ("tags", resources.tag_examples),
+        ("packages", resources.package_examples),
+    ):
+        for key in index:
+            path = f"gallery/{filter_name}/{key}.html"
+            inputs = (*templates("gallery.jinja2"), *listing)
+            targets.append(Target(f"/{path}", path, inputs))
+    for page_name in resources.pages:
+        path = f"pages/{page_name}.html"
+        inputs = (
+            *templates("page.jinja2"),
+            *get_relative_paths(Page.source_paths(page_name)),
+        )
+        targets.append(Target(f"/{path}", path, inputs))
+    for author_name in resources.authors:
+        url = f"/authors/{author_name}.html"
+        author_paths = get_relative_paths(Author.source_paths(author_name))
+        # The page lists the author's examples, which any example may join
+        inputs = (*templates("author.jinja2"), *author_paths, *example_metadata)
+        targets.append(Target(url, f"gallery/authors/{author_name}.html", inputs))
+    for example_name in resources.examples:
+        example_author = resources.examples[example_name].author
+        author_paths = get_relative_paths(
+            Author.source_paths(example_author)
+            if example_author in resources.authors
+            else []
+        )
+        for page, template in (
+            ("index.html", "example.jinja2"),
+            ("code.html", "example_code.jinja2"),
+        ):
+            path = f"gallery/examples/{example_name}/{page}"
+            inputs = (
+                *templates(template),
+                *example_sources[example_name],
+                *author_paths,
+            )
+            targets.append(Target(f"/{path}", path, inputs))
+    return targets
+
+
+def is_sidecar(path: Path) -> bool:
+    """Whether a file is a compressed copy of the file next to it."""
+    suffixes = [suffix for _, suffix in ENCODINGS]
+    return path.suffix in suffixes and path.with_suffix("").exists()
+
+
+def get_sidecar_base(relative: str) -> str | None:
+    """The file a sidecar path is a compressed copy of, if it is one."""
+    for _, suffix in ENCODINGS:
+        if relative.endswith(suffix):
+            return relative.removesuffix(suffix)
+    return None
+
+
+def get_asset_targets(
+    rendered: set[str], sidecars: bool = True, unused: Collection[str] = ()
+) -> list[Target]:
+    """The published files, copied as they are unless rendered instead.
+
+    Without ``sidecars``, compressed copies are left for the build to make.
+    Files in ``unused``, and their sidecars, are left out.
+    """
+    paths: list[Path] = []
+    for published in PUBLISHED:
+        root = HERE / published
+        paths.extend([root] if root.is_file() else root.rglob("*"))
+    targets = []
+    for path in sorted(paths):
+        relative = path.relative_to(HERE).as_posix()
+        if not path.is_file() or relative in rendered:
+            continue
+        if not sidecars and is_sidecar(path):
+            continue
+        if relative in unused or get_sidecar_base(relative) in unused:
+            continue
+        if settings.FINGERPRINT_ASSETS and is_asset(relative):
+            fingerprinted = fingerprints.get_name(relative)
+            targets.append(Target("", fingerprinted, (relative,)))
+        if UNPUBLISHED_NAMES.intersection(path.relative_to(HERE).parts):
+            continue
+        targets.append(Target("", relative, (relative,)))
+    return targets
+
+
+def get_build_fingerprint(*options: object) -> str:
+    """Hash the PSC code, the settings that change the output, and options."""
+    digest = sha256(f"{MANIFEST_FORMAT}".encode())
+    for module_path in sorted(HERE.glob("*.py")):
+        digest.update(module_path.read_bytes())
+    options = (
+        is_local(),
+        settings.STREAM_LINKED_FILES,
+        settings.LINKED_FILE_MAX_SIZE,
+        settings.COMPACT,
+        settings.FINGERPRINT_ASSETS,
+        get_available_encodings(),
+        *options,
+    )
+    digest.update(repr(options).encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class Manifest:
+    """The inputs of each output file, with their hashes, from a build.
+
+    ``files`` has the size, modification time and hash of each input.
+    """
+
+    fingerprint: str = ""
+    outputs: dict[str, dict[str, str]] = field(default_factory=dict)
+    files: dict[str, tuple[int, int, str]] = field(default_factory=dict)
+
+    @classmethod
+    def load(cls, public: Path) -> "Manifest":
+        """The manifest of the last build, or an empty one."""
+        try:
+            data = json.loads((public / MANIFEST).read_text())
+        except (OSError, ValueError):
+            return cls()
+        if data.get("format") != MANIFEST_FORMAT:
+            return cls()
+        files = {k: (size, mtime, h) for k, (size, mtime, h) in data["files"].items()}
+        return cls(data["fingerprint"], data["outputs"], files)
+
+    def save(self, public: Path) -> None:
+        """Write the manifest, replacing the old one in one step."""
+        data = dict(
+            format=MANIFEST_FORMAT,
+            fingerprint=self.fingerprint,
+            outputs=self.outputs,
+            files=self.files,
+        )
+        temporary = public / f"{MANIFEST}.tmp"
+        temporary.write_text(json.dumps(data, indent=1, sort_keys=True))
+        os.replace(temporary, public / MANIFEST)
+
+
+def hash_file(path: Path) -> str:
+    """The SHA-256 of a file, read a block at a time."""
+    digest = sha256()
+    with path.open("rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+@dataclass
+class InputHashes:
+    """Hash each input file at most once per build.
+
+    A file with the size and modification time the last build saw keeps
+    its hash from then, and a file whose size changed is hashed again.
+    """
+
+    known: dict[str, tuple[int, int, str]] = field(default_factory=dict)
+    files: dict[str, tuple[int, int, str]] = field(default_factory=dict)
+
+    def __call__(self, inputs: Iterable[str]) -> dict[str, str]:
+        """The hash of each input, by path."""
+        result = {}
+        for relative in inputs:
+            if relative not in self.files:
+                stat = (HERE / relative).stat()
+                size, mtime = stat.st_size, stat.st_mtime_ns
+                known = self.known.get(relative)
+                if known and known[:2] == (size, mtime):
+                    digest = known[2]
+                else:
+                    digest = hash_file(HERE / relative)
+                self.files[relative] = (size, mtime, digest)
+            result[relative] = self.files[relative][2]
+        return result
+
+
+async def fetch(asgi_app: ASGIApp, url: str) -> tuple[int, bytes]:
+    """GET a URL from the app in this process, returning status and body."""
+    path, _, query = url.partition("?")
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [
+            (b"host", b"localhost"),
+            (b"user-agent", BUILD_USER_AGENT.encode()),
+        ],
+        "client": ("127.0.0.1", 0),
+        "server": ("localhost", 80),
+    }
+    status = 500
+    chunks: list[bytes] = []
+    requested = False
+    finished = anyio.Event()
+
+    async def receive() -> Message:
+        nonlocal requested
+        if not requested:
+            requested = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Streaming responses listen for a disconnect until they finish
+        await finished.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: Message) -> None:
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                finished.set()
+
+    await asgi_app(scope, receive, send)
+    finished.set()
+    return status, b"".join(chunks)
+
+
+async def render_targets(
+    asgi_app: ASGIApp, targets: list[Target], public: Path
+) -> list[str]:
+    """Render the targets concurrently, writing each from a worker thread."""
+    limiter = anyio.CapacityLimiter(CONCURRENCY)
+    written: list[str] = []
+
+    async def render(target: Target) -> None:
+        async with limiter:
+            status, body = await fetch(asgi_app, target.url)
+            if status != 200:
+                raise RuntimeError(f"{target.url} returned {status}")
+            output = public / target.output
+            await anyio.to_thread.run_sync(write_file, output, body)
+            written.append(target.output)
+
+    async with anyio.create_task_group() as task_group:
+        for target in targets:
+            task_group.start_soon(render, target)
+    return written
+
+
+def write_file(output: Path, body: bytes) -> None:
+    """Write one rendered file, making its directory as needed."""
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(body)
+
+
+def render_chunk(targets: list[Target], public: Path) -> list[str]:
+    """Render some targets with the app of this process."""
+    written: list[str] = anyio.run(render_targets, web_app, targets, public)
+    return written
+
+
+def render_all(targets: list[Target], public: Path, jobs: int) -> list[str]:
+    """Render the targets, split across ``jobs`` processes.
+
+    Processes are forked, so each starts with the loaded resources.
+    Where fork is not available, everything renders in this process.
+    """
+    if jobs < 2 or "fork" not in multiprocessing.get_all_start_methods():
+        return render_chunk(targets, public)
+    # Round robin, so each process gets a mix of heavy and light pages
+    chunks = [targets[i::jobs] for i in range(jobs)]
+    context: Any = multiprocessing.get_context("fork")
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context) as executor:
+        results = executor.map(render_chunk, chunks, [public] * jobs)
+        return [output for result in results for output in result]
+
+
+def copy_file(target: Target, public: Path, link: bool = False) -> None:
+    """Publish the package file a target names as its one input.
+
+    With ``link``, files under the runtime directories are hardlinked,
+    falling back to a copy across file systems.
+    """
+    source = HERE / target.inputs[0]
+    output = public / target.output
+    output.parent.mkdir(parents=True, exist_ok=True)
+    # Never write through an old hardlink into the package
+    output.unlink(missing_ok=True)
+    if link and target.output.startswith(tuple(f"{d}/" for d in LINKED)):
+        try:
+            os.link(source, output)
+            return
+        except OSError:
+            pass
+    shutil.copy2(source, output)
+
+
+def remove_output(relative: str, public: Path) -> None:
+    """Remove an output file, and any directories it leaves empty."""
+    output = public / relative
+    output.unlink(missing_ok=True)
+    for parent in output.parents:
+        if parent == public or any(parent.iterdir()):
+            break
+        parent.rmdir()
+
+
+def get_stale_outputs(public: Path, outputs: Collection[str]) -> list[str]:
+    """The files in the output directory that aren't outputs of this build."""
+    stale = []
+    for path in public.rglob("*"):
+        relative = path.relative_to(public).as_posix()
+        if path.is_file() and relative not in outputs and relative != MANIFEST:
+            stale.append(relative)
+    return sorted(stale)
+
+
+def optimize_output(
+    relative: str, public: Path, minify: bool, compress: bool
+) -> Optimized:
+    """Minify one output in place, then write its compressed siblings.
+
+    The runtime is already minified, and may be hardlinked, so it is
+    only compressed.
+    """
+    output = public / relative
+    data = original = output.read_bytes()
+    if minify and not relative.startswith(tuple(f"{d}/" for d in LINKED)):
+        try:
+            text = original.decode()
+        except UnicodeDecodeError:
+            text = ""
+        minified = minify_text(output.name, text).encode() if text else original
+        if len(minified) < len(original):
+            # Replace rather than write, in case the output is a hardlink
+            temporary = output.with_name(f"{output.name}.tmp")
+            temporary.write_bytes(minified)
+            os.replace(temporary, output)
+            data = minified
+    compressed: dict[str, int] = {}
+    if compress and output.suffix not in SKIP_SUFFIXES:
+        compressed = write_file_sidecars(output, data)
+    return Optimized(len(original), len(data), compressed)
+
+
+def optimize_outputs(
+    made: list[str],
+    public: Path,
+    jobs: int,
+    minify: bool,
+    compress: bool,
+    report: BuildReport,
+    manifest: Manifest,
+) -> None:
+    """Optimize the outputs made in threads, recording their sidecars."""
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        results = executor.map(
+            optimize_output,
+            made,
+            [public] * len(made),
+            [minify] * len(made),
+            [compress] * len(made),
+        )
+        for relative, optimized in zip(made, results, strict=True):
+            report.add_savings(relative, optimized)
+            for encoding, suffix in ENCODINGS:
+                if encoding in optimized.compressed:
+                    sidecar = f"{relative}{suffix}"
+                    manifest.outputs[sidecar] = manifest.outputs[relative]
+
+
+def build_site(
+    public: Path,
+    jobs: int = 1,
+    link: bool = False,
+    minify: bool = False,
+    compress: bool = False,
+    all_packages: bool = False,
+) -> BuildReport:
+    """Bring the output directory up to date, using ``jobs`` processes.
+
+    Only the Pyodide packages the examples need, as pinned by the
+    lockfile, are published, unless ``all_packages``.
+    """
+    start = perf_counter()
+    web_app.state.resources = get_app_resources()
+    web_app.state.page_cache = None
+    render_targets_ = get_build_targets(web_app.state.resources)
+    rendered = {t.output for t in render_targets_}
+    unused: list[str] = []
+    resolution = Resolution()
+    repodata = load_repodata(HERE / "pyodide")
+    if repodata is not None:
+        examples = web_app.state.resources.examples
+        requested = {name: e.packages for name, e in examples.items()}
+        locked = get_locked_names(requested, read_lockfile())
+        package_examples = web_app.state.resources.package_examples
+        resolution = resolve_packages(package_examples, repodata, locked)
+        if not all_packages:
+            unused_files = get_unused_files(repodata, resolution)
+            unused = sorted(f"pyodide/{file_name}" for file_name in unused_files)
+    # Published sidecars would not match minified files, or clash with ours
+    sidecars = not (minify or compress)
+    asset_targets = get_asset_targets(rendered, sidecars, unused)
+
+    public.mkdir(parents=True, exist_ok=True)
+    fingerprint = get_build_fingerprint(minify, compress)
+    old = Manifest.load(public)
+    # Otherwise every output is made again, but the file hashes still hold
+    reusable = old.outputs if old.fingerprint == fingerprint else {}
+    new = Manifest(fingerprint=fingerprint)
+    get_hashes = InputHashes(known=old.files)
+    report = BuildReport(
+        unused=unused, missing=resolution.missing, unlocked=resolution.unlocked
+    )
+    to_render: list[Target] = []
+    to_copy: list[Target] = []
+    for target in [*render_targets_, *asset_targets]:
+        hashes = get_hashes(target.inputs)
+        new.outputs[target.output] = hashes
+        unchanged = reusable.get(target.output) == hashes
+        if unchanged and (public / target.output).exists():
+            report.skipped.append(target.output)
+            for _, suffix in ENCODINGS:
+                sidecar = f"{target.output}{suffix}"
+                if sidecar in reusable:
+                    new.outputs[sidecar] = hashes
+        elif target.url:
+            to_render.append(target)
+        else:
+            to_copy.append(target)
+
+    for target in to_copy:
+        copy_file(target, public, link)
+    report.copied = [target.output for target in to_copy]
+    report.written = sorted(render_all(to_render, public, jobs))
+    if minify or compress:
+        made = [*report.copied, *report.written]
+        optimize_outputs(made, public, jobs, minify, compress, report, new)
+    for relative in get_stale_outputs(public, new.outputs):
+        remove_output(relative, public)
+        report.removed.append(relative)
+    new.files = get_hashes.files
+    new.save(public)
+    report.seconds = perf_counter() - start
+    return report
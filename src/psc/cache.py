@@ -0,0 +1,89 @@
+"""Keep parsed resources on disk between runs.
+
+Parsing an example means BeautifulSoup, frontmatter, and Markdown.
+Instead, store the finished resource, keyed by a hash of the files it
+came from. An entry goes stale when any of its files change, when the
+local vs. CDN decision, the parser backend, lazy loading, or linked
+file streaming changes, or when any PSC module changes.
+"""
+import os
+import pickle  # noqa: S403
+from dataclasses import dataclass
+from functools import cache
+from hashlib import sha256
+from importlib.metadata import PackageNotFoundError
+from importlib.metadata import version
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+
+from psc import settings
+from psc.here import HERE
+from psc.resources import Resource
+from psc.resources import is_local
+
+
+# Bump when the shape of the stored resources changes.
+CACHE_FORMAT = 2
+
+
+@cache
+def get_psc_fingerprint() -> str:
+    """Identify this PSC, so an upgrade makes every entry stale."""
+    try:
+        psc_version = version("psc")
+    except PackageNotFoundError:  # pragma: no cover
+        psc_version = "unknown"
+    digest = sha256(f"{CACHE_FORMAT}:{psc_version}".encode())
+    # Cover running from a checkout, where the version doesn't change.
+    # Parsing reaches into several modules, so hash them all.
+    for module in sorted(HERE.glob("*.py")):
+        digest.update(module.name.encode())
+        digest.update(module.read_bytes())
+    return digest.hexdigest()
+
+
+def get_cache_key(kind: type[Resource], name: str) -> str:
+    """Hash the source files of a resource with everything else it uses."""
+    digest = sha256(get_psc_fingerprint().encode())
+    options = (
+        f"{is_local()}:{settings.PARSER}:{settings.LAZY}"
+        f":{settings.STREAM_LINKED_FILES}"
+    )
+    digest.update(f"{kind.__name__}:{name}:{options}".encode())
+    for source_path in kind.source_paths(name):
+        digest.update(source_path.relative_to(HERE).as_posix().encode())
+        digest.update(source_path.read_bytes())
+    return digest.hexdigest()
+
+
+@dataclass
+class ResourceCache:
+    """A directory of parsed resources, one pickle per resource."""
+
+    directory: Path
+
+    def get_path(self, kind: type[Resource], name: str) -> Path:
+        """Where the entry for this resource lives."""
+        return self.directory / kind.__name__.lower() / f"{name}.pickle"
+
+    def get(self, kind: type[Resource], name: str) -> Resource | None:
+        """Return the stored resource, or None if it is missing or stale."""
+        try:
+            key = get_cache_key(kind, name)
+            with open(self.get_path(kind, name), "rb") as f:
+                stored_key, resource = pickle.load(f)  # noqa: S301
+        except (OSError, EOFError, pickle.UnpicklingError, AttributeError):
+            return None
+        if stored_key != key or not isinstance(resource, kind):
+            return None
+        return resource
+
+    def put(self, resource: Resource) -> None:
+        """Store the resource, replacing any previous entry atomically."""
+        kind = type(resource)
+        key = get_cache_key(kind, resource.name)
+        target = self.get_path(kind, resource.name)
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with NamedTemporaryFile("wb", dir=target.parent, delete=False) as f:
+            pickle.dump((key, resource), f)
+        os.replace(f.name, target)
@@ -0,0 +1,233 @@
+"""Memory-compact variants of the resource models.
+
+The regular models are plain dataclasses, each with an instance
+``__dict__`` and its own copy of every string. ``compact_resources``
+converts them to slotted, frozen variants:
+
+- No per-instance ``__dict__``.
+- A text equal to one already seen is stored once, through a
+  ``TextPool``, like a head node used by several examples.
+- Short repeated values, like author names and languages, are interned.
+- Lists become tuples and paths become strings.
+
+Only whole, identical strings are shared. Text that merely overlaps is
+held in full each time: an example's ``index.html`` and the body parsed
+out of it, for one. ``psc memory`` measures what this saves.
+
+Converting reads every field, so lazy examples get parsed first.
+"""
+import sys
+from collections.abc import Iterable
+from collections.abc import Iterator
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+from psc.resources import CHUNK_SIZE
+from psc.resources import Author
+from psc.resources import Example
+from psc.resources import LinkedFile
+from psc.resources import Page
+from psc.resources import Resource
+from psc.resources import Resources
+from psc.resources import get_example_path
+
+
+@dataclass
+class TextPool:
+    """Hand back one shared copy of each distinct text.
+
+    Strings are shared only when equal, not when one contains another.
+    """
+
+    texts: dict[str, str] = field(default_factory=dict)
+
+    def __call__(self, text: str) -> str:
+        """Return the pooled copy of this text, adding it if new."""
+        return self.texts.setdefault(text, text)
+
+
+@dataclass(frozen=True, slots=True)
+class CompactLinkedFile:
+    """A ``LinkedFile`` without the ``Path`` and ``__dict__``.
+
+    The path stays absolute, so a streamed file is still read from disk.
+    """
+
+    path: str
+    language: str
+    body: str
+    size: int
+    stream: bool = False
+
+    @property
+    def relative_path(self) -> str:
+        """The path in the example's directory, as the code page shows it."""
+        return get_example_path(self.path)
+
+    def iter_chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+        """Yield the contents a piece at a time, from disk if streaming."""
+        if not self.stream:
+            yield self.body
+            return
+        with open(self.path) as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+
+
+@dataclass(frozen=True, slots=True)
+class CompactExample:
+    """A slotted, read-only ``Example``."""
+
+    name: str
+    title: str
+    subtitle: str
+    description: str
+    author: str
+    tags: tuple[str, ...]
+    packages: tuple[str, ...]
+    body: str
+    extra_head: str
+    linked_files: tuple[CompactLinkedFile, ...]
+
+
+@dataclass(frozen=True, slots=True)
+class CompactAuthor:
+    """A slotted, read-only ``Author``."""
+
+    name: str
+    title: str
+    body: str
+    extra_head: str
+
+
+@dataclass(frozen=True, slots=True)
+class CompactPage:
+    """A slotted, read-only ``Page``."""
+
+    name: str
+    title: str
+    subtitle: str
+    body: str
+    extra_head: str
+
+
+def compact_linked_file(linked_file: LinkedFile, pool: TextPool) -> CompactLinkedFile:
+    """Convert one linked file, sharing its text through the pool."""
+    return CompactLinkedFile(
+        path=sys.intern(linked_file.path.as_posix()),
+        language=sys.intern(linked_file.language),
+        body=pool(linked_file.body),
+        size=linked_file.size,
+        stream=linked_file.stream,
+    )
+
+
+def compact_resource(resource: Resource, pool: TextPool) -> Any:
+    """Convert any kind of resource to its compact variant."""
+    if isinstance(resource, Example):
+        return CompactExample(
+            name=sys.intern(resource.name),
+            title=pool(resource.title),
+            subtitle=pool(resource.subtitle),
+            description=pool(resource.description),
+            author=sys.intern(resource.author),
+            tags=tuple(sys.intern(tag) for tag in resource.tags),
+            packages=tuple(sys.intern(package) for package in resource.packages),
+            body=pool(resource.body),
+            extra_head=pool(resource.extra_head),
+            linked_files=tuple(
+                compact_linked_file(linked_file, pool)
+                for linked_file in resource.linked_files
+            ),
+        )
+    if isinstance(resource, Author):
+        return CompactAuthor(
+            name=sys.intern(resource.name),
+            title=pool(resource.title),
+            body=pool(resource.body),
+            extra_head=pool(resource.extra_head),
+        )
+    if isinstance(resource, Page):
+        return CompactPage(
+            name=sys.intern(resource.name),
+            title=pool(resource.title),
+            subtitle=pool(resource.subtitle),
+            body=pool(resource.body),
+            extra_head=pool(resource.extra_head),
+        )
+    raise ValueError(f"No compact variant for {type(resource).__name__}")
+
+
+@dataclass
+class CompactResources(Resources):
+    """``Resources`` holding compact variants, compacting any replacements.
+
+    The views only read attributes the compact variants also have.
+    """
+
+    pool: TextPool = field(default_factory=TextPool, compare=False, repr=False)
+
+    def replace(self, resource: Resource, load_time: float = 0.0) -> None:
+        """Compact the new resource, then swap it in."""
+        kind_name = f"{type(resource).__name__.lower()}s"
+        compacted = compact_resource(resource, self.pool)
+        self.store(kind_name, resource.name, compacted, load_time)
+
+
+def compact_resources(resources: Resources) -> CompactResources:
+    """Convert all the resources, with one pool for the whole site."""
+    compacted = CompactResources(
+        load_times=resources.load_times,
+        version=resources.version,
+        search_index=resources.search_index,
+        author_examples=resources.author_examples,
+        tag_examples=resources.tag_examples,
+        package_examples=resources.package_examples,
+    )
+    for kind_name in ("authors", "examples", "pages"):
+        setattr(
+            compacted,
+            kind_name,
+            {
+                name: compact_resource(resource, compacted.pool)
+                for name, resource in getattr(resources, kind_name).items()
+            },
+        )
+    return compacted
+
+
+def get_deep_size(obj: object, seen: set[int] | None = None) -> int:
+    """Bytes used by an object and everything it refers to, once each."""
+    seen = set() if seen is None else seen
+    if id(obj) in seen or isinstance(obj, type):
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    children: Iterable[object] = ()
+    if isinstance(obj, dict):
+        children = [*obj.keys(), *obj.values()]
+    elif isinstance(obj, list | tuple | set | frozenset):
+        children = obj
+    elif hasattr(obj, "__dict__"):
+        children = [vars(obj)]
+    slot_values = [
+        getattr(obj, slot)
+        for cls in type(obj).__mro__
+        for slot in getattr(cls, "__slots__", ())
+        if slot not in ("__dict__", "__weakref__") and hasattr(obj, slot)
+    ]
+    children = [*children, *slot_values]
+    return size + sum(get_deep_size(child, seen) for child in children)
+
+
+def get_memory_report(resources: Resources) -> dict[str, float]:
+    """Average bytes per example, for the regular and compact models."""
+    examples = list(resources.examples.values())
+    compacted = compact_resources(resources)
+    count = max(len(examples), 1)
+    return dict(
+        examples=len(examples),
+        regular=get_deep_size(examples) / count,
+        compact=get_deep_size(list(compacted.examples.values())) / count,
+    )
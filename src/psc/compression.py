@@ -0,0 +1,195 @@
+"""Serve precompressed variants of static files.
+
+``psc download`` and ``psc compress`` write a ``.gz`` sidecar, and a
+``.br`` one when Brotli is installed, next to each file that shrinks
+enough. ``PrecompressedStaticFiles`` then sends the best sidecar the
+client accepts, so the large Pyodide files cross the wire compressed
+without compressing on every request.
+"""
+import gzip
+import os
+from collections.abc import Iterator
+from dataclasses import dataclass
+from pathlib import Path
+
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.responses import Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.staticfiles import PathLike
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+from psc.media_types import get_media_type
+
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Preferred first, with the suffix of the sidecar file.
+ENCODINGS = (("br", ".br"), ("gzip", ".gz"))
+# Already compressed, so not worth trying.
+SKIP_SUFFIXES = {
+    ".br",
+    ".gz",
+    ".bz2",
+    ".zip",
+    ".whl",
+    ".png",
+    ".jpg",
+    ".jpeg",
+    ".gif",
+    ".webp",
+    ".woff2",
+}
+# Only keep a sidecar that is at most this share of the original.
+MAX_RATIO = 0.9
+
+
+def get_accepted_encodings(accept_encoding: str) -> set[str]:
+    """The encodings in an ``Accept-Encoding`` header, minus any with q=0."""
+    accepted = set()
+    for item in accept_encoding.split(","):
+        encoding, _, parameters = item.strip().partition(";")
+        quality = parameters.strip().removeprefix("q=")
+        try:
+            if parameters and float(quality) == 0:
+                continue
+        except ValueError:
+            continue
+        accepted.add(encoding.strip().lower())
+    return accepted
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """Compress as small as possible, and the same every time."""
+    if encoding == "br":
+        return bytes(brotli.compress(data, quality=11))
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def get_available_encodings() -> list[str]:
+    """The encodings sidecars can be written in, with Brotli optional."""
+    return [e for e, _ in ENCODINGS if e != "br" or brotli is not None]
+
+
+def iter_compressible(root: Path) -> Iterator[Path]:
+    """The files under a directory that may be worth compressing."""
+    for path in sorted(root.rglob("*")):
+        if path.is_file() and path.suffix not in SKIP_SUFFIXES:
+            yield path
+
+
+def write_file_sidecars(path: Path, data: bytes) -> dict[str, int]:
+    """Write this content's sidecars, returning their sizes by encoding.
+
+    Sidecars that would not shrink the file enough are removed instead.
+    """
+    sizes = {}
+    encodings = get_available_encodings()
+    for encoding, suffix in ENCODINGS:
+        if encoding not in encodings:
+            continue
+        sidecar = path.with_name(path.name + suffix)
+        compressed = compress(data, encoding)
+        if len(compressed) > len(data) * MAX_RATIO:
+            sidecar.unlink(missing_ok=True)
+            continue
+        sidecar.write_bytes(compressed)
+        sizes[encoding] = len(compressed)
+    return sizes
+
+
+@dataclass
+class CompressionReport:
+    """What ``write_sidecars`` did."""
+
+    written: int = 0
+    skipped: int = 0
+    original_bytes: int = 0
+    compressed_bytes: int = 0
+
+
+def write_sidecars(
+    root: Path, report: CompressionReport | None = None
+) -> CompressionReport:
+    """Write a sidecar per encoding for each file under the directory.
+
+    A file whose sidecars are all newer than it is skipped, so running
+    this again only compresses what changed.
+    """
+    report = report or CompressionReport()
+    encodings = get_available_encodings()
+    suffixes = [suffix for encoding, suffix in ENCODINGS if encoding in encodings]
+    for path in iter_compressible(root):
+        sidecars = [path.with_name(path.name + suffix) for suffix in suffixes]
+        mtime = path.stat().st_mtime
+        if all(s.exists() and s.stat().st_mtime >= mtime for s in sidecars):
+            report.skipped += len(sidecars)
+            continue
+        data = path.read_bytes()
+        sizes = write_file_sidecars(path, data)
+        report.written += len(sizes)
+        report.original_bytes += len(data) * len(sizes)
+        report.compressed_bytes += sum(sizes.values())
+    return report
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """``StaticFiles`` that sends a ``.br`` or ``.gz`` sidecar when accepted."""
+
+    def get_headers(self, full_path: PathLike) -> dict[str, str]:
+        """Headers for every response from this mount, including 304s."""
+        return {}
+
+    def file_response(
+        self,
+        full_path: PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        """Swap in the sidecar for the client's best accepted encoding.
+
+        The sidecar has its own ETag, so revalidation works per encoding.
+        """
+        sidecars = []
+        for encoding, suffix in ENCODINGS:
+            try:
+                sidecar_stat = os.stat(f"{full_path}{suffix}")
+            except OSError:
+                continue
+            # A sidecar older than its file is out of date
+            if sidecar_stat.st_mtime >= stat_result.st_mtime:
+                sidecars.append((encoding, f"{full_path}{suffix}", sidecar_stat))
+
+        request_headers = Headers(scope=scope)
+        accepted = get_accepted_encodings(request_headers.get("accept-encoding", ""))
+        media_type = get_media_type(full_path)
+        headers = self.get_headers(full_path)
+        if sidecars:
+            headers["vary"] = "Accept-Encoding"
+        response = FileResponse(
+            full_path,
+            status_code=status_code,
+            media_type=media_type,
+            headers=headers,
+            stat_result=stat_result,
+            method=scope["method"],
+        )
+        for encoding, sidecar, sidecar_stat in sidecars:
+            if encoding in accepted:
+                response = FileResponse(
+                    sidecar,
+                    status_code=status_code,
+                    media_type=media_type,
+                    headers={**headers, "content-encoding": encoding},
+                    stat_result=sidecar_stat,
+                    method=scope["method"],
+                )
+                break
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        return response
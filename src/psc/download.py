@@ -0,0 +1,344 @@
+"""Download Pyodide and PyScript into a shared cache, then install them.
+
+Artifacts are fetched concurrently into a user-level cache, keyed by
+version, so repeated CI jobs and other checkouts reuse them. A partial
+download resumes with an HTTP range request, and every file is checked
+against its SHA-256: the one pinned for it, the one the mirror publishes
+next to it, or else the one recorded when it was first downloaded. The
+Pyodide tarball has to have a pinned one, ``PSC_PYODIDE_SHA256``, as a
+checksum from the same server proves nothing. Only when asked is it
+downloaded without, trusting the first download.
+
+The Pyodide tarball is hundreds of megabytes. It is read a chunk at a
+time into a streaming bzip2 tar reader, and each member written out as
+it arrives, so memory stays bounded whatever the size.
+"""
+import os
+import string
+import sys
+import tarfile
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from dataclasses import field
+from hashlib import sha256
+from pathlib import Path
+from pathlib import PurePosixPath
+from tempfile import TemporaryDirectory
+from time import perf_counter
+from typing import IO
+
+from urllib3 import PoolManager
+from urllib3 import Timeout
+from urllib3.exceptions import HTTPError
+
+
+PYODIDE_VERSION = "0.21.3"
+PYODIDE_URL = (
+    "https://github.com/pyodide/pyodide/releases/download"
+    f"/{PYODIDE_VERSION}/pyodide-build-{PYODIDE_VERSION}.tar.bz2"
+)
+CHUNK_SIZE = 64 * 1024
+# Seconds between progress lines.
+PROGRESS_INTERVAL = 2.0
+PYSCRIPT_FILES = ("pyscript.js", "pyscript.js.map")
+# Attempts per artifact, each resuming where the last stopped.
+ATTEMPTS = 3
+
+
+@dataclass
+class Progress:
+    """Bytes received so far, shown with the rate as they arrive.
+
+    A resumed download starts at ``offset``, left out of the rate.
+    """
+
+    label: str
+    total: int | None = None
+    offset: int = 0
+    received: int = 0
+    output: IO[str] = field(default_factory=lambda: sys.stderr)
+    started: float = field(default_factory=perf_counter)
+    shown: float = 0.0
+
+    def update(self, size: int) -> None:
+        """Count some bytes, showing progress now and then."""
+        self.received += size
+        now = perf_counter()
+        if now - self.shown >= PROGRESS_INTERVAL:
+            self.shown = now
+            self.show()
+
+    def show(self) -> None:
+        """Write a progress line, whole, as downloads run side by side."""
+        megabytes = self.received / 1e6
+        elapsed = max(perf_counter() - self.started, 1e-9)
+        rate = (self.received - self.offset) / 1e6 / elapsed
+        line = f"{self.label}: {megabytes:.1f} MB"
+        if self.total:
+            line += f" of {self.total / 1e6:.1f} MB"
+            line += f" ({100 * self.received // self.total}%)"
+        line += f", {rate:.1f} MB/s"
+        self.output.write(f"{line}\n")
+        self.output.flush()
+
+
+def get_member_path(name: str, strip: str) -> PurePosixPath | None:
+    """Where a member goes, relative to the target, or None to skip it.
+
+    Members outside ``strip``, or that would escape the target, are skipped.
+    """
+    path = PurePosixPath(name)
+    if path.is_absolute() or ".." in path.parts:
+        return None
+    if path.parts[:1] != (strip,) or len(path.parts) < 2:
+        return None
+    return PurePosixPath(*path.parts[1:])
+
+
+def extract_stream(fileobj: IO[bytes], target: Path, strip: str) -> int:
+    """Unpack a bzip2 tar stream's ``strip`` directory into a directory.
+
+    Only regular files and directories are unpacked. Returns the count
+    of files written.
+    """
+    count = 0
+    with tarfile.open(fileobj=fileobj, mode="r|bz2") as tar:
+        for member in tar:
+            relative = get_member_path(member.name, strip)
+            if relative is None or not (member.isfile() or member.isdir()):
+                continue
+            path = target / relative
+            if member.isdir():
+                path.mkdir(parents=True, exist_ok=True)
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            source = tar.extractfile(member)
+            if source is None:  # pragma: no cover
+                continue
+            with source, path.open("wb") as output:
+                while chunk := source.read(CHUNK_SIZE):
+                    output.write(chunk)
+            count += 1
+    return count
+
+
+def move_into(source: Path, target: Path) -> None:
+    """Move every file under a directory into another, replacing files."""
+    for path in sorted(source.rglob("*")):
+        if path.is_file():
+            destination = target / path.relative_to(source)
+            destination.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(path, destination)
+
+
+class ChecksumError(ValueError):
+    """A downloaded file does not have the expected SHA-256."""
+
+
+class StatusError(HTTPError):
+    """The server answered with neither the file nor the rest of it."""
+
+
+@dataclass(frozen=True)
+class Artifact:
+    """A file to download, where it is cached, and whether to reuse it.
+
+    Only a pinned version is reused, "latest" is fetched every time.
+    When ``sha256`` is given, the file must have it, whatever the server
+    publishes. With ``require_sha256``, it must be given.
+    """
+
+    url: str
+    path: Path
+    reuse: bool = True
+    sha256: str | None = None
+    require_sha256: bool = False
+
+    @property
+    def checksum_path(self) -> Path:
+        """The SHA-256 of the cached file, recorded next to it."""
+        return self.path.with_name(self.path.name + ".sha256")
+
+    @property
+    def part_path(self) -> Path:
+        """The partial download, resumed from its size."""
+        return self.path.with_name(self.path.name + ".part")
+
+
+def get_artifacts(
+    cache_dir: Path,
+    mirror: str | None = None,
+    pyscript_version: str = "latest",
+    pyodide_sha256: str | None = None,
+    allow_unverified: bool = False,
+) -> dict[str, Artifact]:
+    """The Pyodide tarball, with its pinned SHA-256, and PyScript files.
+
+    A mirror serves ``pyodide/<version>/<file>`` and
+    ``pyscript/<version>/<file>`` from its base URL. Without
+    ``pyodide_sha256``, the tarball is only downloaded when
+    ``allow_unverified``.
+    """
+    tarball = PYODIDE_URL.rsplit("/", 1)[-1]
+    pyodide_dir = cache_dir / "pyodide" / PYODIDE_VERSION
+    pyscript_dir = cache_dir / "pyscript" / pyscript_version
+    if mirror:
+        base = mirror.rstrip("/")
+        pyodide_url = f"{base}/pyodide/{PYODIDE_VERSION}/{tarball}"
+        pyscript_base = f"{base}/pyscript/{pyscript_version}"
+    elif pyscript_version == "latest":
+        pyodide_url = PYODIDE_URL
+        pyscript_base = "https://pyscript.net/latest"
+    else:
+        pyodide_url = PYODIDE_URL
+        pyscript_base = f"https://pyscript.net/releases/{pyscript_version}"
+    pyodide = Artifact(
+        pyodide_url,
+        pyodide_dir / tarball,
+        sha256=pyodide_sha256,
+        require_sha256=not allow_unverified,
+    )
+    artifacts = dict(pyodide=pyodide)
+    for name in PYSCRIPT_FILES:
+        artifacts[name] = Artifact(
+            f"{pyscript_base}/{name}",
+            pyscript_dir / name,
+            reuse=pyscript_version != "latest",
+        )
+    return artifacts
+
+
+def hash_file(path: Path) -> str:
+    """The SHA-256 of a file, read a chunk at a time."""
+    digest = sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fetch_checksum(http: PoolManager, url: str) -> str | None:
+    """The SHA-256 a server publishes for a file, as ``<url>.sha256``.
+
+    None when there isn't one, or the response isn't one.
+    """
+    response = http.request("GET", f"{url}.sha256", retries=False)
+    if response.status != 200:
+        return None
+    words = response.data.decode(errors="replace").split()
+    digest = words[0].lower() if words else ""
+    if len(digest) != 64 or not set(digest) <= set(string.hexdigits):
+        return None
+    return digest
+
+
+def is_cached(artifact: Artifact) -> bool:
+    """Whether a reusable file is in the cache, intact."""
+    if not artifact.reuse or not artifact.checksum_path.exists():
+        return False
+    if not artifact.path.exists():
+        return False
+    recorded = artifact.checksum_path.read_text().strip()
+    if artifact.sha256 is not None and recorded != artifact.sha256:
+        return False
+    return hash_file(artifact.path) == recorded
+
+
+def fetch_part(http: PoolManager, artifact: Artifact) -> None:
+    """Download the rest of a file into its partial file.
+
+    Asks for the bytes after those already there, and starts again if
+    the server sends the whole file instead.
+    """
+    part = artifact.part_path
+    offset = part.stat().st_size if part.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    response = http.request(
+        "GET",
+        artifact.url,
+        headers=headers,
+        preload_content=False,
+        timeout=Timeout(connect=10, read=60),
+    )
+    try:
+        if response.status == 416:
+            # Nothing after what we have, so check it as it is
+            return
+        if response.status not in (200, 206):
+            raise StatusError(f"{artifact.url} returned {response.status}")
+        resumed = response.status == 206
+        length = response.headers.get("content-length")
+        total = int(length) + (offset if resumed else 0) if length else None
+        start = offset if resumed else 0
+        progress = Progress(artifact.path.name, total, start, start)
+        with part.open("ab" if resumed else "wb") as output:
+            while chunk := response.read(CHUNK_SIZE):
+                output.write(chunk)
+                progress.update(len(chunk))
+        progress.show()
+    finally:
+        response.release_conn()
+
+
+def fetch(http: PoolManager, artifact: Artifact, attempts: int = ATTEMPTS) -> Path:
+    """Download an artifact into the cache, unless it is there already.
+
+    Failed attempts resume; a file with the wrong SHA-256 is discarded.
+    A file that isn't reused starts afresh, as its part may be of an
+    older release.
+    """
+    if artifact.require_sha256 and artifact.sha256 is None:
+        raise ChecksumError(f"No SHA-256 pinned for {artifact.url}")
+    if not artifact.reuse:
+        artifact.part_path.unlink(missing_ok=True)
+    if is_cached(artifact):
+        return artifact.path
+    artifact.path.parent.mkdir(parents=True, exist_ok=True)
+    expected = artifact.sha256
+    checked = expected is not None
+    error: Exception = RuntimeError(f"No attempts to fetch {artifact.url}")
+    for _ in range(attempts):
+        try:
+            if not checked:
+                expected = fetch_checksum(http, artifact.url)
+                checked = True
+            fetch_part(http, artifact)
+        except (OSError, HTTPError) as e:
+            error = e
+            continue
+        actual = hash_file(artifact.part_path)
+        if expected is not None and actual != expected:
+            artifact.part_path.unlink()
+            error = ChecksumError(f"{artifact.url} has SHA-256 {actual}")
+            continue
+        os.replace(artifact.part_path, artifact.path)
+        artifact.checksum_path.write_text(actual)
+        return artifact.path
+    raise error
+
+
+def fetch_all(
+    http: PoolManager, artifacts: dict[str, Artifact], workers: int = 4
+) -> dict[str, Path]:
+    """Download the artifacts concurrently, returning the cached paths."""
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            name: executor.submit(fetch, http, artifact)
+            for name, artifact in artifacts.items()
+        }
+        return {name: future.result() for name, future in futures.items()}
+
+
+def install_pyodide(archive: Path, target: Path, dry_run: bool = False) -> int:
+    """Unpack a Pyodide tarball into a directory, returning the file count.
+
+    Files are unpacked next to the target first, then moved into place,
+    so a failure leaves the old distribution as it was.
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with archive.open("rb") as stream:
+        with TemporaryDirectory(dir=target.parent) as tmp_dir:
+            count = extract_stream(stream, Path(tmp_dir), "pyodide")
+            if not dry_run:
+                move_into(Path(tmp_dir), target)
+    return count
@@ -0,0 +1,175 @@
+"""Give static and example assets content-hashed URLs.
+
+Templates ask for ``asset("static/psc.css")`` and get something like
+``static/psc.1a2b3c4d5e.css``. The name changes whenever the content
+does, so those URLs are served with year-long, immutable caching, in
+the app by ``FingerprintedStaticFiles`` and in the build as copies.
+
+A page rendered before an asset changed still names the old digest.
+Each file's previous digest keeps resolving, to the current content but
+without the immutable caching. ``Fingerprints.generation`` goes up with
+every change seen, so the page cache can drop pages naming old digests.
+"""
+import re
+from dataclasses import dataclass
+from functools import cached_property
+from hashlib import sha256
+from pathlib import Path
+from pathlib import PurePosixPath
+from typing import ClassVar
+
+import anyio
+from starlette.responses import Response
+from starlette.types import Scope
+
+from psc import settings
+from psc.compression import PrecompressedStaticFiles
+from psc.here import HERE
+from psc.runtime import IMMUTABLE
+
+
+DIGEST_LENGTH = 10
+FINGERPRINTED_PATTERN = re.compile(
+    r"^(?P<stem>.+)\.(?P<digest>[0-9a-f]{%d})(?P<suffix>\.[^.]+)$" % DIGEST_LENGTH
+)
+# Relative ``src`` and ``href`` values naming a file next to the page.
+REFERENCE_PATTERN = re.compile(r"""\b(src|href)=(["'])([\w.-]+)\2""")
+# Paths under the package directory whose files get fingerprinted.
+FINGERPRINTED = ("favicon.png", "static", "gallery/examples")
+# Example files that are pages or sources, never referenced as assets.
+NOT_ASSETS = {"index.html", "index.md", "__init__.py"}
+
+
+def is_asset(relative: str) -> bool:
+    """Whether a package file gets a fingerprinted name."""
+    path = PurePosixPath(relative)
+    if path.name in NOT_ASSETS or "__pycache__" in path.parts:
+        return False
+    if path.suffix in (".br", ".gz"):
+        return False
+    return any(relative == f or relative.startswith(f"{f}/") for f in FINGERPRINTED)
+
+
+def add_digest(relative: str, digest: str) -> str:
+    """Put the digest before the suffix, ``a/b.css`` to ``a/b.<digest>.css``."""
+    path = PurePosixPath(relative)
+    return str(path.with_name(f"{path.stem}.{digest}{path.suffix}"))
+
+
+@dataclass
+class Fingerprints:
+    """The digests of the files under a directory, by relative path.
+
+    A digest is kept with the file's size and modification time, and
+    worked out again when those change, replacing the previous one.
+    What is known is shared by every instance, by full path, as the
+    templates and the static mounts look at the same files.
+    """
+
+    root: Path = HERE
+    digests: ClassVar[dict[Path, tuple[int, int, str]]] = {}
+    previous: ClassVar[dict[Path, str]] = {}
+    # Bumped whenever a file's digest is seen to change
+    generation: ClassVar[int] = 0
+
+    def get_digest(self, relative: str) -> str | None:
+        """The content digest of a file, or None if there is no such file."""
+        if ".." in PurePosixPath(relative).parts:
+            return None
+        path = self.root / relative
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        if not path.is_file():
+            return None
+        known = self.digests.get(path)
+        if known and known[:2] == (stat.st_size, stat.st_mtime_ns):
+            return known[2]
+        digest = sha256(path.read_bytes()).hexdigest()[:DIGEST_LENGTH]
+        self.digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        if known and known[2] != digest:
+            self.previous[path] = known[2]
+            Fingerprints.generation += 1
+        return digest
+
+    def get_name(self, relative: str) -> str:
+        """The fingerprinted path of a file, or the path if it is missing."""
+        digest = self.get_digest(relative)
+        return relative if digest is None else add_digest(relative, digest)
+
+    def resolve(self, fingerprinted: str) -> str | None:
+        """The file a fingerprinted path names, if the digest is current.
+
+        The digest the file had before its last change resolves too.
+        """
+        path = PurePosixPath(fingerprinted)
+        match = FINGERPRINTED_PATTERN.match(path.name)
+        if match is None:
+            return None
+        relative = str(path.with_name(match["stem"] + match["suffix"]))
+        digest = self.get_digest(relative)
+        previous = self.previous.get(self.root / relative)
+        if digest is None or match["digest"] not in (digest, previous):
+            return None
+        return relative
+
+    def is_current(self, fingerprinted: str, relative: str) -> bool:
+        """Whether a resolved path has the digest its file was last seen with."""
+        known = self.digests.get(self.root / relative)
+        return known is not None and add_digest(relative, known[2]) == fingerprinted
+
+
+fingerprints = Fingerprints()
+
+
+def asset(relative: str) -> str:
+    """The URL path for a package file, fingerprinted when enabled."""
+    if not settings.FINGERPRINT_ASSETS:
+        return relative
+    return fingerprints.get_name(relative)
+
+
+def fingerprint_references(html: str, directory: str) -> str:
+    """Fingerprint ``src`` and ``href`` values naming files in a directory.
+
+    This is for an example's own HTML, which refers to its files by name.
+    """
+    if not settings.FINGERPRINT_ASSETS:
+        return html
+
+    def replace(match: re.Match[str]) -> str:
+        attribute, quote, name = match.groups()
+        relative = f"{directory}/{name}"
+        if not is_asset(relative):
+            return match[0]
+        fingerprinted = PurePosixPath(fingerprints.get_name(relative)).name
+        return f"{attribute}={quote}{fingerprinted}{quote}"
+
+    return REFERENCE_PATTERN.sub(replace, html)
+
+
+class FingerprintedStaticFiles(PrecompressedStaticFiles):
+    """Static files that also answer to current fingerprinted names.
+
+    Those responses may be cached for good. A name with the previous
+    digest gets the current content, but not cached for good, and any
+    older name is not found.
+    """
+
+    @cached_property
+    def fingerprints(self) -> Fingerprints:
+        """Digests of the files in this mount's directory."""
+        return Fingerprints(Path(str(self.directory)))
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        """Serve a fingerprinted name as its file, cached for good."""
+        fingerprinted = PurePosixPath(path).as_posix()
+        resolve = self.fingerprints.resolve
+        relative = await anyio.to_thread.run_sync(resolve, fingerprinted)
+        if relative is None:
+            return await super().get_response(path, scope)
+        response = await super().get_response(relative, scope)
+        if self.fingerprints.is_current(fingerprinted, relative):
+            response.headers["cache-control"] = IMMUTABLE
+        return response
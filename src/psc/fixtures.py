@@ -7,7 +7,6 @@ from collections.abc import Generator
 from collections.abc import Iterable
 from dataclasses import dataclass
 from dataclasses import field
-from mimetypes import guess_type
 from urllib.parse import urlparse
 
 import pytest
@@ -19,6 +18,7 @@ from starlette.testclient import TestClient
 
 from psc.app import app
 from psc.here import HERE
+from psc.media_types import get_media_type
 
 
 @dataclass
@@ -149,9 +149,7 @@ def route_handler(page: Page, route: Route) -> None:
         this_fs_path = HERE / this_path
         if this_fs_path.exists():
             status = 200
-            mime_type = guess_type(this_fs_path)[0]
-            if mime_type:
-                headers = {"Content-Type": mime_type}
+            headers = {"Content-Type": get_media_type(this_fs_path)}
             body = this_fs_path.read_bytes()
         else:
             status = 404
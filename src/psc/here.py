@@ -1,4 +1,5 @@
 """Paths that can be referenced anywhere and get the right target."""
+import os
 from pathlib import Path
 
 
@@ -6,3 +7,7 @@ HERE = Path(__file__).parent
 STATIC = HERE / "static"
 PYODIDE = HERE / "pyodide"
 PYSCRIPT = HERE / "pyscript"
+LOCKFILE = HERE / "gallery/packages.lock.json"
+CACHE = Path(os.environ.get("XDG_CACHE_HOME", Path.home() / ".cache")) / "psc"
+SNAPSHOT = CACHE / "resources.snapshot"
+DOWNLOADS = CACHE / "downloads"
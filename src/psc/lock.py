@@ -0,0 +1,214 @@
+"""Pin each example's packages to exact wheels, for a faster Pyodide boot.
+
+``psc lock`` resolves the packages in every example's ``<py-config>``,
+with their dependencies, to wheel URLs for both the CDN and the local
+runtime, and writes them to a lockfile. The rendered ``<py-config>``
+then lists those URLs, so the browser fetches wheels straight away
+instead of resolving dependencies on every page load.
+
+Packages Pyodide has come from its ``repodata.json``. Others are pinned
+to the newest pure-Python wheel on PyPI, and what that wheel requires
+in Pyodide is pinned in turn, the same way. So micropip has nothing
+left to resolve.
+"""
+import json
+from collections.abc import Iterable
+from dataclasses import asdict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from packaging.requirements import Requirement
+from urllib3 import PoolManager
+
+from psc.download import PYODIDE_VERSION
+from psc.here import LOCKFILE
+from psc.here import PYODIDE
+from psc.packages import canonicalize
+from psc.packages import load_repodata
+from psc.packages import resolve_packages
+
+
+LOCK_FORMAT = 2
+CDN_BASE = f"https://cdn.jsdelivr.net/pyodide/v{PYODIDE_VERSION}/full"
+# From an example page, as in ``py_config.local.toml``.
+LOCAL_BASE = "../../../pyodide"
+PYPI_URL = "https://pypi.org"
+MODES = ("cdn", "local")
+# What requirement markers see in the browser, for Pyodide 0.21's Python.
+PYODIDE_ENVIRONMENT = dict(
+    extra="",
+    implementation_name="cpython",
+    platform_machine="wasm32",
+    platform_system="Emscripten",
+    python_full_version="3.10.2",
+    python_version="3.10",
+    sys_platform="emscripten",
+)
+
+
+@dataclass(frozen=True)
+class LockedPackage:
+    """One wheel, pinned, with where to get it in each mode."""
+
+    name: str
+    version: str
+    urls: dict[str, str]
+
+
+def get_pyodide_package(name: str, package: dict[str, Any]) -> LockedPackage:
+    """Pin a package from Pyodide's repodata."""
+    file_name = package["file_name"]
+    urls = dict(cdn=f"{CDN_BASE}/{file_name}", local=f"{LOCAL_BASE}/{file_name}")
+    return LockedPackage(name, package["version"], urls)
+
+
+def get_requirements(requires_dist: list[str] | None) -> list[str]:
+    """The names of the requirements that apply in Pyodide, without extras."""
+    names = []
+    for line in requires_dist or []:
+        requirement = Requirement(line)
+        marker = requirement.marker
+        if marker is None or marker.evaluate(PYODIDE_ENVIRONMENT):
+            names.append(canonicalize(requirement.name))
+    return names
+
+
+def get_pypi_package(
+    http: PoolManager, name: str, index_url: str = PYPI_URL
+) -> tuple[LockedPackage, list[str]]:
+    """Pin the newest pure-Python wheel of a package on PyPI.
+
+    The names of the packages it requires in Pyodide come with it.
+    """
+    response = http.request("GET", f"{index_url}/pypi/{name}/json")
+    if response.status != 200:
+        raise LookupError(f"{name} is not on {index_url}")
+    metadata = json.loads(response.data)
+    for release_file in metadata["urls"]:
+        if release_file["filename"].endswith("-none-any.whl"):
+            info = metadata["info"]
+            urls = {mode: release_file["url"] for mode in MODES}
+            locked = LockedPackage(name, info["version"], urls)
+            return locked, get_requirements(info.get("requires_dist"))
+    raise LookupError(f"{name} has no pure-Python wheel on {index_url}")
+
+
+def get_repodata(
+    http: PoolManager, pyodide_dir: Path = PYODIDE
+) -> dict[str, dict[str, Any]]:
+    """The local Pyodide's packages, or else the CDN's for the same release."""
+    repodata = load_repodata(pyodide_dir)
+    if repodata is not None:
+        return repodata
+    response = http.request("GET", f"{CDN_BASE}/repodata.json")
+    if response.status != 200:
+        raise LookupError(f"No repodata.json for Pyodide {PYODIDE_VERSION}")
+    packages: dict[str, dict[str, Any]] = json.loads(response.data)["packages"]
+    return packages
+
+
+def lock_packages(
+    requested: Iterable[str],
+    repodata: dict[str, dict[str, Any]],
+    http: PoolManager,
+    index_url: str = PYPI_URL,
+) -> list[LockedPackage]:
+    """Pin some packages and their dependencies, sorted by name.
+
+    A package from PyPI may require more, from Pyodide or PyPI, so this
+    goes on until nothing new is missing from Pyodide. What PyScript
+    loads for itself is left out, it is there already.
+    """
+    pending = list(requested)
+    pypi: dict[str, LockedPackage] = {}
+    while True:
+        resolution = resolve_packages(pending, repodata)
+        new = [name for name in resolution.missing if name not in pypi]
+        if not new:
+            break
+        for name in new:
+            pypi[name], requirements = get_pypi_package(http, name, index_url)
+            pending.extend(requirements)
+    preloaded = set(resolve_packages([], repodata).packages)
+    locked = [
+        get_pyodide_package(name, repodata[name])
+        for name in resolution.packages
+        if name not in preloaded
+    ]
+    locked.extend(pypi.values())
+    return sorted(locked, key=lambda package: package.name)
+
+
+def write_lockfile(
+    examples: dict[str, tuple[list[str], list[LockedPackage]]],
+    path: Path = LOCKFILE,
+) -> None:
+    """Write the requested and pinned packages of each example."""
+    data = dict(
+        format=LOCK_FORMAT,
+        pyodide=PYODIDE_VERSION,
+        examples={
+            name: dict(requested=requested, packages=[asdict(p) for p in locked])
+            for name, (requested, locked) in sorted(examples.items())
+        },
+    )
+    path.write_text(json.dumps(data, indent=2) + "\n")
+
+
+def read_lockfile(path: Path = LOCKFILE) -> dict[str, Any]:
+    """The locked examples by name, empty if there is no current lock.
+
+    A lock for another Pyodide is out of date and so ignored.
+    """
+    try:
+        data = json.loads(path.read_text())
+    except (OSError, ValueError):
+        return {}
+    if data.get("format") != LOCK_FORMAT or data.get("pyodide") != PYODIDE_VERSION:
+        return {}
+    examples: dict[str, Any] = data["examples"]
+    return examples
+
+
+def is_current(entry: dict[str, Any], requested: list[str]) -> bool:
+    """Whether a lock entry is for this list of packages."""
+    return sorted(map(canonicalize, entry["requested"])) == sorted(
+        map(canonicalize, requested)
+    )
+
+
+def get_pinned_urls(
+    example_name: str, requested: list[str], mode: str, locked: dict[str, Any]
+) -> list[str] | None:
+    """The pinned wheel URLs for an example, None if not locked.
+
+    ``locked`` is what ``read_lockfile`` returns. A lock for a different
+    list of packages is out of date and so ignored.
+    """
+    entry = locked.get(example_name)
+    if entry is None or not is_current(entry, requested):
+        return None
+    return [package["urls"][mode] for package in entry["packages"]]
+
+
+def get_locked_names(
+    requested: dict[str, list[str]], locked: dict[str, Any]
+) -> list[str]:
+    """The package names pinned for the examples whose lock is current.
+
+    ``requested`` has each example's packages, by example name.
+    """
+    names: list[str] = []
+    for example_name, packages in requested.items():
+        entry = locked.get(example_name)
+        if entry is not None and is_current(entry, packages):
+            names.extend(package["name"] for package in entry["packages"])
+    return names
+
+
+def format_packages(urls: Iterable[str]) -> str:
+    """A ``<py-config>`` body listing the given packages."""
+    # A JSON string is a TOML basic string too
+    lines = "".join(f"\n    {json.dumps(url)}," for url in urls)
+    return f"\npackages = [{lines}\n]\n"
@@ -0,0 +1,35 @@
+"""Media types for the files PSC serves, independent of the platform.
+
+``mimetypes`` reads the system's tables, which may not know ``.wasm``,
+and browsers refuse ``WebAssembly.instantiateStreaming`` without
+``application/wasm``. The types PyScript and Pyodide depend on are
+fixed here, the rest fall back to ``mimetypes``.
+"""
+import os
+from mimetypes import guess_type
+from pathlib import PurePath
+
+
+MEDIA_TYPES = {
+    ".wasm": "application/wasm",
+    ".js": "text/javascript",
+    ".mjs": "text/javascript",
+    ".json": "application/json",
+    ".map": "application/json",
+    ".data": "application/octet-stream",
+    ".whl": "application/zip",
+    ".zip": "application/zip",
+    ".tar": "application/x-tar",
+    ".py": "text/x-python",
+    ".css": "text/css",
+    ".html": "text/html",
+    ".toml": "application/toml",
+}
+
+
+def get_media_type(path: str | os.PathLike[str]) -> str:
+    """The media type to send a file with."""
+    suffix = PurePath(path).suffix.lower()
+    if suffix in MEDIA_TYPES:
+        return MEDIA_TYPES[suffix]
+    return guess_type(str(path))[0] or "application/octet-stream"
@@ -0,0 +1,305 @@
+"""Count requests and time them, exposed for Prometheus at ``/metrics``.
+
+With ``PSC_METRICS`` on, ``MetricsMiddleware`` records each request
+under the route it matched, so the label set stays as small as the
+route table: a count by method and status, the total latency, and the
+response size. Bytes sent from a static mount are also added up by
+mount. ``TimedTemplates`` times rendering on its own, by template, and
+the lifespan records how long the resources took to load.
+
+Metrics are kept per process, each worker has its own.
+"""
+import threading
+from collections.abc import Iterable
+from collections.abc import Iterator
+from dataclasses import dataclass
+from dataclasses import field
+from time import perf_counter
+from typing import Any
+
+from starlette.exceptions import HTTPException
+from starlette.requests import Request
+from starlette.responses import PlainTextResponse
+from starlette.responses import Response
+from starlette.routing import BaseRoute
+from starlette.routing import Match
+from starlette.routing import Mount
+from starlette.templating import Jinja2Templates
+from starlette.templating import _TemplateResponse
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+from psc import settings
+from psc.profiling import get_timings
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+# Seconds, as the Prometheus clients have them.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes, from 256 bytes to 16 MB by powers of four.
+SIZE_BUCKETS = tuple(float(256 * 4**n) for n in range(9))
+UNMATCHED = "unmatched"
+
+
+def format_labels(names: tuple[str, ...], values: tuple[str, ...]) -> str:
+    """Label pairs in braces, escaped, or nothing without labels."""
+    if not names:
+        return ""
+    pairs = []
+    for name, value in zip(names, values, strict=True):
+        escaped = value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(name + '="' + escaped + '"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value: float) -> str:
+    """A sample value, whole numbers without a decimal point."""
+    return str(int(value)) if value == int(value) else repr(value)
+
+
+@dataclass
+class Counter:
+    """A total that only goes up, one per set of label values."""
+
+    name: str
+    help: str
+    labels: tuple[str, ...] = ()
+    values: dict[tuple[str, ...], float] = field(default_factory=dict)
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        """Add to the total for these label values."""
+        self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def expose(self) -> Iterator[str]:
+        """The lines for this metric in the text format."""
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} counter"
+        for label_values, value in sorted(self.values.items()):
+            labels = format_labels(self.labels, label_values)
+            yield f"{self.name}{labels} {format_value(value)}"
+
+
+@dataclass
+class Gauge:
+    """A value that is set, such as a duration measured once."""
+
+    name: str
+    help: str
+    value: float | None = None
+
+    def set(self, value: float) -> None:
+        """Replace the value."""
+        self.value = value
+
+    def expose(self) -> Iterator[str]:
+        """The lines for this metric, none until it is set."""
+        if self.value is None:
+            return
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} gauge"
+        yield f"{self.name} {format_value(self.value)}"
+
+
+@dataclass
+class Histogram:
+    """Observations counted into buckets, one set per label values."""
+
+    name: str
+    help: str
+    labels: tuple[str, ...] = ()
+    buckets: tuple[float, ...] = LATENCY_BUCKETS
+    counts: dict[tuple[str, ...], list[int]] = field(default_factory=dict)
+    sums: dict[tuple[str, ...], float] = field(default_factory=dict)
+
+    def observe(self, value: float, *label_values: str) -> None:
+        """Count a value in the first bucket it fits, or in +Inf."""
+        counts = self.counts.setdefault(label_values, [0] * (len(self.buckets) + 1))
+        index = next(
+            (i for i, bound in enumerate(self.buckets) if value <= bound),
+            len(self.buckets),
+        )
+        counts[index] += 1
+        self.sums[label_values] = self.sums.get(label_values, 0) + value
+
+    def expose(self) -> Iterator[str]:
+        """The lines for this metric, with cumulative buckets."""
+        yield f"# HELP {self.name} {self.help}"
+        yield f"# TYPE {self.name} histogram"
+        bounds = [*map(format_value, self.buckets), "+Inf"]
+        for label_values, counts in sorted(self.counts.items()):
+            cumulative = 0
+            for bound, count in zip(bounds, counts, strict=True):
+                cumulative += count
+                labels = format_labels((*self.labels, "le"), (*label_values, bound))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = format_labels(self.labels, label_values)
+            total = format_value(self.sums[label_values])
+            yield f"{self.name}_sum{labels} {total}"
+            yield f"{self.name}_count{labels} {cumulative}"
+
+
+@dataclass
+class Metrics:
+    """Everything measured in this process."""
+
+    requests: Counter = field(
+        default_factory=lambda: Counter(
+            "psc_requests_total",
+            "Requests handled, by route, method and status.",
+            ("route", "method", "status"),
+        )
+    )
+    duration: Histogram = field(
+        default_factory=lambda: Histogram(
+            "psc_request_duration_seconds",
+            "Time from request to the last byte of the response, by route.",
+            ("route",),
+        )
+    )
+    render: Histogram = field(
+        default_factory=lambda: Histogram(
+            "psc_template_render_seconds",
+            "Time rendering a template, by template.",
+            ("template",),
+        )
+    )
+    response_size: Histogram = field(
+        default_factory=lambda: Histogram(
+            "psc_response_size_bytes",
+            "Bytes in the response body, by route.",
+            ("route",),
+            SIZE_BUCKETS,
+        )
+    )
+    static_bytes: Counter = field(
+        default_factory=lambda: Counter(
+            "psc_static_bytes_total",
+            "Bytes sent from static files, by mount.",
+            ("mount",),
+        )
+    )
+    resources_load: Gauge = field(
+        default_factory=lambda: Gauge(
+            "psc_resources_load_seconds",
+            "Time to load the resources at startup.",
+        )
+    )
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+    def record_request(
+        self, route: str, method: str, status: int, seconds: float, size: int
+    ) -> None:
+        """Count a finished request."""
+        with self.lock:
+            self.requests.inc(route, method, str(status))
+            self.duration.observe(seconds, route)
+            self.response_size.observe(size, route)
+
+    def record_static(self, mount: str, size: int) -> None:
+        """Add bytes sent from a static mount."""
+        with self.lock:
+            self.static_bytes.inc(mount, amount=size)
+
+    def record_render(self, template: str, seconds: float) -> None:
+        """Add a template rendering."""
+        with self.lock:
+            self.render.observe(seconds, template)
+
+    def expose(self) -> str:
+        """All metrics in the Prometheus text format."""
+        all_metrics = (
+            self.requests,
+            self.duration,
+            self.render,
+            self.response_size,
+            self.static_bytes,
+            self.resources_load,
+        )
+        with self.lock:
+            lines = [line for metric in all_metrics for line in metric.expose()]
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+def record_resources_load(seconds: float) -> None:
+    """Keep how long the resources took to load at startup."""
+    metrics.resources_load.set(seconds)
+
+
+def get_route(routes: Iterable[BaseRoute], scope: Scope) -> BaseRoute | None:
+    """The route a request goes to, or None when nothing matches."""
+    partial = None
+    for route in routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return route
+        if match == Match.PARTIAL and partial is None:
+            partial = route
+    return partial
+
+
+class MetricsMiddleware:
+    """Record every HTTP request, when ``settings.METRICS`` is on."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Wrap an ASGI app."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Pass the request on, timing it and counting the body bytes."""
+        if scope["type"] != "http" or not settings.METRICS:
+            await self.app(scope, receive, send)
+            return
+        route = get_route(scope["app"].routes, scope)
+        label = getattr(route, "path", UNMATCHED) if route else UNMATCHED
+        status = 500
+        size = 0
+        started = perf_counter()
+
+        async def counting_send(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, counting_send)
+        finally:
+            seconds = perf_counter() - started
+            metrics.record_request(label, scope["method"], status, seconds, size)
+            if isinstance(route, Mount):
+                metrics.record_static(label, size)
+
+
+class TimedTemplates(Jinja2Templates):
+    """Templates that record how long each takes to render."""
+
+    def TemplateResponse(  # noqa: N802
+        self, name: str, context: dict[str, Any], *args: Any, **kwargs: Any
+    ) -> _TemplateResponse:
+        """Render a template, timed for the metrics and ``Server-Timing``."""
+        timings = get_timings()
+        if not settings.METRICS and timings is None:
+            return super().TemplateResponse(name, context, *args, **kwargs)
+        started = perf_counter()
+        response = super().TemplateResponse(name, context, *args, **kwargs)
+        seconds = perf_counter() - started
+        if settings.METRICS:
+            metrics.record_render(name, seconds)
+        if timings is not None:
+            timings.add("render", seconds)
+        return response
+
+
+async def metrics_page(request: Request) -> Response:
+    """Handle the metrics, only there when ``settings.METRICS`` is on."""
+    if not settings.METRICS:
+        raise HTTPException(status_code=404)
+    return PlainTextResponse(metrics.expose(), media_type=CONTENT_TYPE)
@@ -0,0 +1,108 @@
+"""Shrink the HTML, CSS and JavaScript the build writes.
+
+These are deliberately conservative text transforms, not parsers: they
+remove indentation, blank lines and comments, and leave anything whose
+whitespace matters alone. Python in ``<py-script>`` and friends keeps
+its indentation, and ``<pre>`` blocks keep their layout.
+"""
+import re
+from collections.abc import Callable
+
+
+# Elements whose content is copied through untouched.
+PRESERVED_ELEMENTS = (
+    "pre",
+    "textarea",
+    "script",
+    "style",
+    "py-script",
+    "py-repl",
+    "py-config",
+)
+PRESERVED_PATTERN = re.compile(
+    r"(<(%s)\b.*?</\2\s*>)" % "|".join(PRESERVED_ELEMENTS),
+    re.DOTALL | re.IGNORECASE,
+)
+# Conditional comments are instructions, so kept.
+HTML_COMMENT_PATTERN = re.compile(r"<!--(?!\[if).*?-->", re.DOTALL)
+LINE_SPACE_PATTERN = re.compile(r"[ \t\r\f\v]*\n\s*")
+# Strings and url() values keep their spaces, comments go.
+CSS_TOKEN_PATTERN = re.compile(
+    r"""("(?:[^"\\]|\\.)*"|'(?:[^'\\]|\\.)*'|url\([^)"']*\)|/\*.*?\*/)""",
+    re.DOTALL | re.IGNORECASE,
+)
+CSS_SPACE_PATTERN = re.compile(r"\s*([{};,])\s*")
+SPACE_PATTERN = re.compile(r"\s+")
+
+
+def minify_html(text: str) -> str:
+    """Drop comments, indentation and blank lines outside preserved elements.
+
+    Each run of whitespace spanning lines becomes one newline, which a
+    browser renders just the same.
+    """
+    parts = PRESERVED_PATTERN.split(text)
+    # The split gives text, element, element name, text, ...
+    for index in range(0, len(parts), 3):
+        outside = HTML_COMMENT_PATTERN.sub("", parts[index])
+        parts[index] = LINE_SPACE_PATTERN.sub("\n", outside)
+    kept = [p for i, p in enumerate(parts) if i % 3 != 2]
+    return "".join(kept).strip() + "\n"
+
+
+def squeeze_css(text: str) -> str:
+    """Collapse whitespace, dropping it around braces and separators."""
+    text = CSS_SPACE_PATTERN.sub(r"\1", SPACE_PATTERN.sub(" ", text))
+    return text.replace(";}", "}")
+
+
+def minify_css(text: str) -> str:
+    """Drop comments and the whitespace around braces and separators.
+
+    Strings and ``url()`` values are copied through untouched.
+    """
+    kept = []
+    outside = ""
+    # The split gives text, token, text, ...
+    for index, part in enumerate(CSS_TOKEN_PATTERN.split(text)):
+        if index % 2 == 0:
+            outside += part
+        elif not part.startswith("/*"):
+            kept.extend([squeeze_css(outside), part])
+            outside = ""
+    kept.append(squeeze_css(outside))
+    return "".join(kept).strip()
+
+
+def minify_js(text: str) -> str:
+    """Drop indentation, blank lines and whole-line comments.
+
+    Lines stay separate, so automatic semicolons still apply. Scripts
+    with template literals or continued strings are left as they are.
+    """
+    lines = text.splitlines()
+    if "`" in text or any(line.endswith("\\") for line in lines):
+        return text
+    kept = [line.strip() for line in lines]
+    return "\n".join(k for k in kept if k and not k.startswith("//")) + "\n"
+
+
+MINIFIERS: dict[str, Callable[[str], str]] = {
+    ".html": minify_html,
+    ".css": minify_css,
+    ".js": minify_js,
+}
+
+
+def is_minified(name: str) -> bool:
+    """Whether a file name says it is minified already."""
+    return ".min." in name
+
+
+def minify(name: str, text: str) -> str:
+    """Minify text by the file name's suffix, or return it unchanged."""
+    suffix = name[name.rfind(".") :] if "." in name else ""
+    minifier = MINIFIERS.get(suffix.lower())
+    if minifier is None or is_minified(name):
+        return text
+    return minifier(text)
@@ -0,0 +1,98 @@
+"""Work out which Pyodide packages the gallery needs.
+
+Examples list packages in their ``<py-config>``. Those, and everything
+they depend on according to Pyodide's ``repodata.json``, are all the
+site has to publish; the rest of the distribution's package files can
+be left out. Packages Pyodide doesn't have are installed by micropip
+from PyPI at runtime, and may in turn need any of Pyodide's packages.
+So the lockfile, which pins their dependencies too, has to cover them,
+or else nothing is left out.
+"""
+import json
+import re
+from collections.abc import Iterable
+from dataclasses import dataclass
+from dataclasses import field
+from pathlib import Path
+from typing import Any
+
+
+# PyScript loads these itself, whatever the examples ask for.
+REQUIRED = ("micropip",)
+# Older Pyodide releases call it packages.json.
+REPODATA_NAMES = ("repodata.json", "packages.json")
+REQUIREMENT_PATTERN = re.compile(r"^\s*([A-Za-z0-9][A-Za-z0-9._-]*)")
+
+
+def canonicalize(name: str) -> str:
+    """The package name from a requirement, normalized as in PEP 503."""
+    match = REQUIREMENT_PATTERN.match(name)
+    project = match[1] if match else name
+    return re.sub(r"[-_.]+", "-", project).lower()
+
+
+def load_repodata(pyodide_dir: Path) -> dict[str, dict[str, Any]] | None:
+    """The packages in a Pyodide distribution, None if it has no repodata."""
+    for name in REPODATA_NAMES:
+        path = pyodide_dir / name
+        if path.exists():
+            packages: dict[str, dict[str, Any]] = json.loads(path.read_text())[
+                "packages"
+            ]
+            return packages
+    return None
+
+
+@dataclass
+class Resolution:
+    """The Pyodide packages needed, and requested ones it doesn't have.
+
+    ``unlocked`` has the missing packages with no known dependencies.
+    """
+
+    packages: list[str] = field(default_factory=list)
+    missing: list[str] = field(default_factory=list)
+    unlocked: list[str] = field(default_factory=list)
+
+
+def resolve_packages(
+    requested: Iterable[str],
+    repodata: dict[str, dict[str, Any]],
+    locked: Iterable[str] = (),
+) -> Resolution:
+    """The requested packages and their dependencies, by repodata name.
+
+    ``locked`` has the names a lockfile pins for the requested packages,
+    the dependencies of those from PyPI included. They are needed too.
+    """
+    by_canonical = {canonicalize(name): name for name in repodata}
+    pinned = {canonicalize(name) for name in locked}
+    pending = [*(canonicalize(name) for name in (*REQUIRED, *requested)), *pinned]
+    needed: set[str] = set()
+    missing: set[str] = set()
+    while pending:
+        canonical = pending.pop()
+        name = by_canonical.get(canonical)
+        if name is None:
+            missing.add(canonical)
+        elif name not in needed:
+            needed.add(name)
+            pending.extend(canonicalize(d) for d in repodata[name]["depends"])
+    return Resolution(sorted(needed), sorted(missing), sorted(missing - pinned))
+
+
+def get_unused_files(
+    repodata: dict[str, dict[str, Any]], resolution: Resolution
+) -> set[str]:
+    """File names of the distribution's packages nothing needs.
+
+    Anything not a package file, such as the runtime itself, is used.
+    An unlocked package from PyPI may need any package, so then every
+    package is used.
+    """
+    if resolution.unlocked:
+        return set()
+    needed = set(resolution.packages)
+    return {
+        package["file_name"] for name, package in repodata.items() if name not in needed
+    }
@@ -0,0 +1,145 @@
+"""Keep rendered pages, and answer revalidation without rendering.
+
+A page only changes when the resources do, or an asset it names by
+digest, so each rendered page is kept under its route plus a version:
+the ``Resources.version`` and the ``Fingerprints.generation`` it came
+from. A reload or an edited asset bumps the version, which empties the
+cache.
+
+Cached pages get a strong ``ETag`` and a ``Last-Modified``. A GET or
+HEAD with a matching ``If-None-Match`` or ``If-Modified-Since`` gets a
+304 with no body.
+"""
+from collections import OrderedDict
+from collections.abc import Awaitable
+from collections.abc import Callable
+from collections.abc import Hashable
+from dataclasses import dataclass
+from dataclasses import field
+from datetime import datetime
+from datetime import timezone
+from email.utils import format_datetime
+from email.utils import parsedate_to_datetime
+from functools import wraps
+from hashlib import sha256
+
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.responses import StreamingResponse
+
+from psc.fingerprint import Fingerprints
+from psc.profiling import timed
+
+
+View = Callable[[Request], Awaitable[Response]]
+
+
+@dataclass(frozen=True)
+class CachedPage:
+    """A rendered page with its validators."""
+
+    body: bytes
+    media_type: str | None
+    etag: str
+    last_modified: datetime
+
+    @classmethod
+    def from_response(cls, response: Response) -> "CachedPage":
+        """Keep the body of a rendered response, stamped with the time."""
+        now = datetime.now(timezone.utc).replace(microsecond=0)
+        etag = '"' + sha256(response.body).hexdigest()[:32] + '"'
+        return cls(response.body, response.media_type, etag, now)
+
+    def is_fresh(self, request: Request) -> bool:
+        """The client already has this page, per its conditional headers."""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # Validating a GET allows the weak comparison
+            etags = [e.strip().removeprefix("W/") for e in if_none_match.split(",")]
+            return "*" in etags or self.etag in etags
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None:
+            return False
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return self.last_modified <= since
+
+    def respond(self, request: Request) -> Response:
+        """The full page, or a 304 when the client's copy is current."""
+        headers = {
+            "etag": self.etag,
+            "last-modified": format_datetime(self.last_modified, usegmt=True),
+            "cache-control": "no-cache",
+        }
+        if request.method in ("GET", "HEAD") and self.is_fresh(request):
+            return Response(status_code=304, headers=headers)
+        return Response(self.body, media_type=self.media_type, headers=headers)
+
+
+@dataclass
+class PageCache:
+    """Rendered pages for one version, least recent evicted."""
+
+    max_entries: int = 1024
+    version: Hashable = 0
+    pages: OrderedDict[Hashable, CachedPage] = field(default_factory=OrderedDict)
+
+    def get(self, key: Hashable, version: Hashable) -> CachedPage | None:
+        """The page for this key, if rendered from this version."""
+        if version != self.version:
+            self.pages.clear()
+            self.version = version
+            return None
+        page = self.pages.get(key)
+        if page is not None:
+            self.pages.move_to_end(key)
+        return page
+
+    def put(self, key: Hashable, version: Hashable, page: CachedPage) -> None:
+        """Keep a page rendered from this version."""
+        if version != self.version:
+            return
+        self.pages[key] = page
+        while len(self.pages) > self.max_entries:
+            self.pages.popitem(last=False)
+
+
+def cached_page(
+    vary: Callable[[Request], Hashable] | None = None
+) -> Callable[[View], View]:
+    """Serve a view from the app's ``PageCache``, when it has one.
+
+    Pass ``vary`` when the page depends on more of the request than
+    its URL. Streamed and non-200 responses are passed through.
+    """
+
+    def decorator(view: View) -> View:
+        @wraps(view)
+        async def cached_view(request: Request) -> Response:
+            page_cache: PageCache | None = getattr(
+                request.app.state, "page_cache", None
+            )
+            if page_cache is None:
+                return await view(request)
+            version = (request.app.state.resources.version, Fingerprints.generation)
+            key = (request.url.path, request.url.query, vary(request) if vary else None)
+            with timed("cache"):
+                page = page_cache.get(key, version)
+            if page is None:
+                response = await view(request)
+                if (
+                    isinstance(response, StreamingResponse)
+                    or response.status_code != 200
+                ):
+                    return response
+                page = CachedPage.from_response(response)
+                page_cache.put(key, version, page)
+            return page.respond(request)
+
+        return cached_view
+
+    return decorator
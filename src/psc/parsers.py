@@ -0,0 +1,77 @@
+"""Parser backends that turn resource HTML into BeautifulSoup.
+
+``html5lib`` is pure Python and follows the HTML5 spec exactly, but is
+slow. ``lxml`` is C-backed and several times faster. Both have to give
+identical ``extra_head`` and ``body`` output for every example, which
+the test suite checks.
+"""
+from collections.abc import Callable
+from collections.abc import Iterable
+from time import perf_counter
+
+from bs4 import BeautifulSoup
+from bs4 import FeatureNotFound
+
+
+# Keep whitespace-only strings the way html5lib does. By default the
+# other tree builders collapse them to a single newline.
+PRESERVE_WHITESPACE_TAGS = {"html", "pre", "textarea"}
+
+
+def html5lib_soup(text: str) -> BeautifulSoup:
+    """Parse with the pure-Python HTML5 parser."""
+    return BeautifulSoup(text, "html5lib")
+
+
+def lxml_soup(text: str) -> BeautifulSoup:
+    """Parse with libxml2, keeping whitespace like html5lib."""
+    return BeautifulSoup(
+        text, "lxml", preserve_whitespace_tags=PRESERVE_WHITESPACE_TAGS
+    )
+
+
+PARSERS: dict[str, Callable[[str], BeautifulSoup]] = dict(
+    html5lib=html5lib_soup,
+    lxml=lxml_soup,
+)
+
+
+def get_soup(text: str, parser: str = "html5lib") -> BeautifulSoup:
+    """Parse the HTML text with the named backend."""
+    if parser not in PARSERS:
+        raise ValueError(f"No parser named {parser}")
+    return PARSERS[parser](text)
+
+
+def get_available_parsers() -> list[str]:
+    """The backends whose libraries are installed."""
+    available = []
+    for parser in PARSERS:
+        try:
+            get_soup("<p></p>", parser)
+        except FeatureNotFound:
+            continue
+        available.append(parser)
+    return available
+
+
+def benchmark(
+    texts: Iterable[str], parsers: Iterable[str], repeat: int = 10
+) -> dict[str, float]:
+    """Average milliseconds to extract ``extra_head`` and ``body`` per text."""
+    # Imported here as resources uses this module
+    from psc.resources import get_body_content
+    from psc.resources import get_head_nodes
+
+    texts = list(texts)
+    timings = {}
+    for parser in parsers:
+        start = perf_counter()
+        for _ in range(repeat):
+            for text in texts:
+                soup = get_soup(text, parser)
+                get_head_nodes(soup)
+                get_body_content(soup)
+        elapsed = perf_counter() - start
+        timings[parser] = elapsed * 1000 / (repeat * len(texts))
+    return timings
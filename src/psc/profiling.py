@@ -0,0 +1,211 @@
+"""Show where a request's time goes, as it happens or sampled.
+
+With ``PSC_SERVER_TIMING`` on, each response gets a ``Server-Timing``
+header, which browser developer tools show next to the request. The
+phases are the page cache, loading resources, rendering the template,
+and the whole app up to the response headers.
+Time spent sending the body comes after the headers, so it is left
+out. Code times a phase with ``timed``, which does nothing unless the
+current request is being timed.
+
+With ``PSC_PROFILE`` on, for debugging only, a request with an
+``X-PSC-Profile`` header or a ``psc-profile`` query parameter is
+sampled while it runs. The response is replaced by the samples as
+folded stacks, which ``flamegraph.pl``, speedscope and inferno read.
+The app has to be in debug mode too, so the setting left on in
+production doesn't hand out stacks and file paths.
+"""
+import sys
+import threading
+from collections import Counter
+from collections.abc import Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from dataclasses import field
+from functools import lru_cache
+from pathlib import Path
+from time import perf_counter
+from types import FrameType
+
+from starlette.datastructures import Headers
+from starlette.datastructures import MutableHeaders
+from starlette.datastructures import QueryParams
+from starlette.responses import PlainTextResponse
+from starlette.types import ASGIApp
+from starlette.types import Message
+from starlette.types import Receive
+from starlette.types import Scope
+from starlette.types import Send
+
+from psc import settings
+
+
+PROFILE_HEADER = "x-psc-profile"
+PROFILE_PARAM = "psc-profile"
+PHASE_DESCRIPTIONS = {
+    "cache": "Page cache",
+    "resources": "Resources",
+    "render": "Template",
+    "app": "Until headers",
+}
+
+
+@dataclass
+class Timings:
+    """Seconds spent in each phase of one request."""
+
+    durations: dict[str, float] = field(default_factory=dict)
+
+    def add(self, phase: str, seconds: float) -> None:
+        """Add time to a phase, which may run more than once."""
+        self.durations[phase] = self.durations.get(phase, 0.0) + seconds
+
+    def to_header(self) -> str:
+        """The phases as a ``Server-Timing`` value, in milliseconds."""
+        metrics = []
+        for phase, seconds in self.durations.items():
+            description = PHASE_DESCRIPTIONS.get(phase, phase)
+            duration = f"{seconds * 1000:.2f}"
+            metrics.append(phase + ';desc="' + description + '";dur=' + duration)
+        return ", ".join(metrics)
+
+
+TIMINGS: ContextVar[Timings | None] = ContextVar("psc_timings", default=None)
+
+
+def get_timings() -> Timings | None:
+    """The timings of the current request, None if it isn't timed."""
+    return TIMINGS.get()
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Add the time in the block to a phase of the current request."""
+    timings = TIMINGS.get()
+    if timings is None:
+        yield
+        return
+    started = perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(phase, perf_counter() - started)
+
+
+@lru_cache(maxsize=None)
+def get_frame_name(filename: str, function: str, line: int) -> str:
+    """A frame in a folded stack, with its file relative to ``sys.path``."""
+    path = Path(filename)
+    for entry in sorted(sys.path, key=len, reverse=True):
+        if entry and path.is_relative_to(entry):
+            path = path.relative_to(entry)
+            break
+    return f"{function} ({path}:{line})"
+
+
+def get_stack(frame: FrameType | None) -> str:
+    """A stack in the folded format, outermost frame first."""
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(
+            get_frame_name(code.co_filename, code.co_name, code.co_firstlineno)
+        )
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+@dataclass
+class Sampler:
+    """Count the stacks of a thread, looked at every ``interval`` seconds."""
+
+    thread_id: int
+    interval: float = 0.005
+    stacks: Counter[str] = field(default_factory=Counter)
+    stopped: threading.Event = field(default_factory=threading.Event)
+
+    def run(self) -> None:
+        """Take samples until stopped."""
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[get_stack(frame)] += 1
+
+    @contextmanager
+    def sampling(self) -> Iterator[None]:
+        """Take samples in the background while the block runs."""
+        thread = threading.Thread(target=self.run, name="psc-sampler", daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            self.stopped.set()
+            thread.join()
+
+    def to_folded(self) -> str:
+        """Each stack with its count, one per line, most frequent first."""
+        return "".join(f"{stack} {n}\n" for stack, n in self.stacks.most_common())
+
+
+def is_debug(scope: Scope) -> bool:
+    """Whether the app handling the request is in debug mode."""
+    return bool(getattr(scope.get("app"), "debug", False))
+
+
+def wants_profile(scope: Scope) -> bool:
+    """Whether the request asks to be profiled."""
+    if PROFILE_HEADER in Headers(scope=scope):
+        return True
+    return PROFILE_PARAM in QueryParams(scope["query_string"])
+
+
+class ProfilingMiddleware:
+    """Time the phases of requests, or sample one, as the settings say."""
+
+    def __init__(self, app: ASGIApp) -> None:
+        """Wrap an ASGI app."""
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Pass the request on, timed, sampled, or as it is."""
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+        elif settings.PROFILE and is_debug(scope) and wants_profile(scope):
+            await self.profile(scope, receive, send)
+        elif settings.SERVER_TIMING:
+            await self.time(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+    async def time(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Add a ``Server-Timing`` header with the phases so far."""
+        timings = Timings()
+        token = TIMINGS.set(timings)
+        started = perf_counter()
+
+        async def timing_send(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                timings.add("app", perf_counter() - started)
+                headers = MutableHeaders(scope=message)
+                headers.append("Server-Timing", timings.to_header())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timing_send)
+        finally:
+            TIMINGS.reset(token)
+
+    async def profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        """Answer with the folded stacks sampled while handling the request."""
+        sampler = Sampler(threading.get_ident(), settings.PROFILE_INTERVAL)
+
+        async def discard(message: Message) -> None:
+            pass
+
+        with sampler.sampling():
+            await self.app(scope, receive, discard)
+        name = scope["path"].strip("/").replace("/", "-") or "index"
+        headers = {"content-disposition": f'attachment; filename="{name}.folded"'}
+        response = PlainTextResponse(sampler.to_folded(), headers=headers)
+        await response(scope, receive, send)
@@ -0,0 +1,80 @@
+"""Reload resources in the running app when their files change.
+
+The watcher polls the modification times of each resource's source
+files. Only the example, author, or page that changed gets parsed
+again, then swapped into ``Resources``.
+"""
+import logging
+from dataclasses import dataclass
+from dataclasses import field
+
+import anyio
+
+from psc.cache import ResourceCache
+from psc.resources import Resource
+from psc.resources import Resources
+from psc.resources import get_resource_keys
+from psc.resources import load_resource
+
+
+logger = logging.getLogger(__name__)
+ResourceKey = tuple[type[Resource], str]
+Fingerprint = tuple[tuple[str, int, int], ...]
+
+
+def get_fingerprint(kind: type[Resource], name: str) -> Fingerprint:
+    """Cheaply summarize the source files of a resource."""
+    fingerprint = []
+    for source_path in kind.source_paths(name):
+        try:
+            stat = source_path.stat()
+        except FileNotFoundError:  # pragma: no cover
+            continue
+        fingerprint.append((str(source_path), stat.st_mtime_ns, stat.st_size))
+    return tuple(fingerprint)
+
+
+def scan() -> dict[ResourceKey, Fingerprint]:
+    """Fingerprint every resource currently on disk."""
+    return {
+        (kind, name): get_fingerprint(kind, name) for kind, name in get_resource_keys()
+    }
+
+
+@dataclass
+class ResourceWatcher:
+    """Keep ``Resources`` in step with the files on disk."""
+
+    resources: Resources
+    cache: ResourceCache | None = None
+    lazy: bool = False
+    fingerprints: dict[ResourceKey, Fingerprint] = field(default_factory=scan)
+
+    def check(self) -> list[ResourceKey]:
+        """Reload whatever changed since the last check and return it."""
+        fingerprints = scan()
+        changed = []
+        for key, fingerprint in fingerprints.items():
+            if self.fingerprints.get(key) == fingerprint:
+                continue
+            kind, name = key
+            try:
+                resource, load_time = load_resource(kind, name, self.cache, self.lazy)
+            except Exception as exc:
+                # Probably saved mid-edit: keep serving the old one, retry later
+                logger.warning("Could not reload %s %s: %s", kind.__name__, name, exc)
+                fingerprints[key] = self.fingerprints.get(key, ())
+                continue
+            self.resources.replace(resource, load_time)
+            changed.append(key)
+        for key in self.fingerprints.keys() - fingerprints.keys():
+            self.resources.remove(*key)
+            changed.append(key)
+        self.fingerprints = fingerprints
+        return changed
+
+    async def watch(self, interval: float = 1.0) -> None:
+        """Check forever, parsing in a thread to keep serving requests."""
+        while True:
+            await anyio.sleep(interval)
+            await anyio.to_thread.run_sync(self.check)
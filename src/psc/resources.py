@@ -2,11 +2,24 @@
 
 We use paths as the "id" values. More specifically, PurePath.
 """
+from __future__ import annotations
+
+import re
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+from concurrent.futures import Executor
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 from dataclasses import field
 from operator import attrgetter
 from pathlib import Path
 from pathlib import PurePath
+from threading import RLock
+from time import perf_counter
+from typing import TYPE_CHECKING
+from typing import Any
 from typing import cast
 
 import frontmatter
@@ -14,11 +27,32 @@ from bs4 import BeautifulSoup
 from bs4 import Tag
 from markdown_it import MarkdownIt
 
+from psc import settings
 from psc.here import HERE
+from psc.here import LOCKFILE
 from psc.here import PYODIDE
+from psc.lock import format_packages
+from psc.lock import get_pinned_urls
+from psc.lock import read_lockfile
+from psc.parsers import get_soup
+from psc.profiling import timed
+from psc.search import SearchIndex
+from psc.search import build_search_index
 
 
+if TYPE_CHECKING:  # pragma: no cover
+    from psc.cache import ResourceCache
+
 EXCLUSIONS = ("pyscript.css", "pyscript.js", "favicon.png")
+CHUNK_SIZE = 64 * 1024
+PY_CONFIG_PATTERN = re.compile(r"<py-config[^>]*>(.*?)</py-config>", re.DOTALL)
+PACKAGES_PATTERN = re.compile(r"packages\s*=\s*\[(.*?)\]", re.DOTALL)
+PACKAGE_NAME_PATTERN = re.compile(r"[\"']([^\"']+)[\"']")
+LOADERS: dict[str, Callable[..., Executor] | None] = dict(
+    serial=None,
+    thread=ThreadPoolExecutor,
+    process=ProcessPoolExecutor,
+)
 
 
 def tag_filter(
@@ -55,8 +89,28 @@ def is_local(test_path: Path = PYODIDE) -> bool:
     return pyscript_file.exists()
 
 
-def get_body_content(s: BeautifulSoup, test_path: Path = PYODIDE) -> str:
-    """Get the body node but raise an exception if not present."""
+def get_packages(html_text: str) -> list[str]:
+    """The packages listed in the ``<py-config>`` of an example's HTML.
+
+    A regex on the raw text, so lazy examples don't need parsing.
+    """
+    packages = [
+        package
+        for py_config in PY_CONFIG_PATTERN.findall(html_text)
+        for package_list in PACKAGES_PATTERN.findall(py_config)
+        for package in PACKAGE_NAME_PATTERN.findall(package_list)
+    ]
+    return sorted(set(packages))
+
+
+def get_body_content(
+    s: BeautifulSoup, test_path: Path = PYODIDE, pinned: list[str] | None = None
+) -> str:
+    """Get the body node but raise an exception if not present.
+
+    With ``pinned`` wheel URLs, from ``psc lock``, those replace the
+    packages in the ``<py-config>``.
+    """
     # Choose the correct TOML file for local vs remote.
     toml_name = "local" if is_local(test_path) else "cdn"
     src = f"../py_config.{toml_name}.toml"
@@ -67,7 +121,11 @@ def get_body_content(s: BeautifulSoup, test_path: Path = PYODIDE) -> str:
         py_config = body_element.select_one("py-config")
         if py_config:
             py_config.attrs["src"] = src
-            return f"{body_element.decode_contents()}"
+            if pinned is not None:
+                py_config.string = format_packages(pinned)
+            # Drop the trailing whitespace that only html5lib moves in
+            # from after </body>, so all parsers give the same result.
+            return body_element.decode_contents().rstrip()
     return ""
 
 
@@ -79,6 +137,13 @@ class Resource:
     title: str = ""
     body: str = ""
     extra_head: str = ""
+    # Defer the expensive parsing until first use, where supported
+    lazy: bool = field(default=False, kw_only=True, repr=False, compare=False)
+
+    @classmethod
+    def source_paths(cls, name: str) -> list[Path]:
+        """The files on disk that a resource of this name is made from."""
+        return []
 
 
 linked_file_mapping = dict(
@@ -89,18 +154,45 @@ linked_file_mapping = dict(
 )
 
 
+def get_example_path(path: PurePath | str) -> str:
+    """A linked file's path relative to its example's directory."""
+    relative = PurePath(path).relative_to(HERE / "gallery/examples")
+    return PurePath(*relative.parts[1:]).as_posix()
+
+
 @dataclass
 class LinkedFile:
-    """A source file on disk that gets attached to an example."""
+    """A source file on disk that gets attached to an example.
+
+    When ``stream`` is set, the contents stay on disk and the body is
+    empty. ``iter_chunks`` then reads the file while rendering.
+    """
 
     path: Path
     language: str = field(init=False)
     body: str = field(init=False)
+    size: int = field(init=False)
+    stream: bool = field(default=False, kw_only=True, repr=False, compare=False)
+
+    @property
+    def relative_path(self) -> str:
+        """The path in the example's directory, as the code page shows it."""
+        return get_example_path(self.path)
 
     def __post_init__(self) -> None:
-        """Read the file contents into the body."""
+        """Read the file contents into the body, unless streaming."""
         self.language = linked_file_mapping[self.path.suffix[1:]]
-        self.body = self.path.read_text()
+        self.size = self.path.stat().st_size
+        self.body = "" if self.stream else self.path.read_text()
+
+    def iter_chunks(self, chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+        """Yield the contents a piece at a time, from disk if streaming."""
+        if not self.stream:
+            yield self.body
+            return
+        with self.path.open() as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
 
 
 @dataclass
@@ -111,46 +203,141 @@ class Example(Resource):
     actual file on disk. Instead, it will be like ``hello_world``. When
     we go to actually open the file, we'll add the "policy part".
     Meaning, HERE / "examples" / name / "index.html".
+
+    When ``lazy``, only the Markdown frontmatter is read up front. The
+    fields in ``DEFERRED_FIELDS`` get filled from the HTML and linked
+    files the first time any of them is used.
+
+    ``lockfile`` is the lockfile as ``read_lockfile`` returns it, read
+    once for a whole load. Without it, the example reads it itself.
     """
 
     subtitle: str = field(init=False)
     description: str = field(init=False)
     author: str = field(init=False)
+    tags: list[str] = field(init=False)
+    packages: list[str] = field(init=False)
     linked_files: list[LinkedFile] = field(default_factory=list)
+    lockfile: dict[str, Any] | None = field(
+        default=None, kw_only=True, repr=False, compare=False
+    )
+    # Held while parsing a lazy example, so other examples aren't kept waiting
+    parse_lock: RLock = field(
+        default_factory=RLock, init=False, repr=False, compare=False
+    )
+
+    @classmethod
+    def source_paths(cls, name: str) -> list[Path]:
+        """Everything in the example's directory, and the lockfile."""
+        example_path = HERE / "gallery/examples" / name
+        paths = sorted(p for p in example_path.rglob("*") if p.is_file())
+        return [*paths, LOCKFILE] if LOCKFILE.exists() else paths
 
     def __post_init__(self) -> None:
-        """Extract most of the data from the HTML file."""
+        """Extract the metadata, then the HTML unless lazy."""
         # Title, subtitle, body come from the example's MD file.
         index_md_file = HERE / "gallery/examples" / self.name / "index.md"
         md_fm = frontmatter.load(index_md_file)
         self.title = md_fm.get("title", "")
         self.author = md_fm.get("author", "")
         self.subtitle = md_fm.get("subtitle", "")
+        self.tags = cast(list[str], md_fm.get("tags", []))
         md = MarkdownIt()
         self.description = str(md.render(md_fm.content))
+        index_html_file = index_md_file.with_name("index.html")
+        if index_html_file.exists():
+            self.packages = get_packages(index_html_file.read_text())
+        else:  # pragma: nocover
+            self.packages = []
+
+        if self.lockfile is not None:
+            # Keep just this example's entry until the HTML is loaded
+            self.lockfile = {k: v for k, v in self.lockfile.items() if k == self.name}
+        if self.lazy:
+            # Let the deferred descriptors take over from the defaults
+            for field_name in DEFERRED_FIELDS:
+                self.__dict__.pop(field_name, None)
+        else:
+            self.load_html(cast(list[str], md_fm.get("linked_files", [])))
+
+    def __getstate__(self) -> dict[str, Any]:
+        """Leave out the parse lock, which can't be pickled."""
+        state = self.__dict__.copy()
+        state.pop("parse_lock", None)
+        return state
+
+    def __setstate__(self, state: dict[str, Any]) -> None:
+        """Restore the fields, with a new parse lock."""
+        self.__dict__.update(state)
+        self.parse_lock = RLock()
+
+    def load_html(self, linked_names: list[str] | None = None) -> None:
+        """Fill in the fields that come from the HTML and linked files."""
+        this_example_path = HERE / "gallery/examples" / self.name
+        if linked_names is None:
+            md_fm = frontmatter.load(this_example_path / "index.md")
+            linked_names = cast(list[str], md_fm.get("linked_files", []))
 
         # Main, extra head example's HTML file.
-        this_example_path = HERE / "gallery/examples" / self.name
         index_html_file = this_example_path / "index.html"
         if not index_html_file.exists():  # pragma: nocover
             raise ValueError(f"No example at {self.name}")
         index_html_text = index_html_file.read_text()
-        soup = BeautifulSoup(index_html_text, "html5lib")
+        soup = get_soup(index_html_text, settings.PARSER)
         self.extra_head = get_head_nodes(soup)
-        self.body = get_body_content(soup)
+        mode = "local" if is_local() else "cdn"
+        locked = read_lockfile(LOCKFILE) if self.lockfile is None else self.lockfile
+        pinned = get_pinned_urls(self.name, self.packages, mode, locked)
+        self.body = get_body_content(soup, pinned=pinned)
 
         # Process any linked files
-        linked_paths = [*["index.html"], *md_fm.get("linked_files", [])]
-        for linked_name in linked_paths:
-            linked_path = this_example_path / linked_name
-            linked_file = LinkedFile(path=linked_path)
-            self.linked_files.append(linked_file)
+        linked_paths = [*["index.html"], *linked_names]
+        self.linked_files = [
+            LinkedFile(
+                path=this_example_path / linked_name,
+                stream=settings.STREAM_LINKED_FILES,
+            )
+            for linked_name in linked_paths
+        ]
+
+
+class Deferred:
+    """Compute a lazy ``Example`` field on first access, once.
+
+    This is a non-data descriptor, like ``functools.cached_property``.
+    After the first access the value sits in the instance ``__dict__``,
+    which wins over the descriptor, so later reads cost nothing.
+    """
+
+    def __init__(self, name: str) -> None:
+        """Remember which field this is for."""
+        self.name = name
+
+    def __get__(self, instance: Example | None, owner: type | None = None) -> Any:
+        """Parse the HTML, only once even if several threads ask at once."""
+        if instance is None:
+            return self
+        with instance.parse_lock:
+            if self.name not in instance.__dict__:
+                with timed("resources"):
+                    instance.load_html()
+        return instance.__dict__[self.name]
+
+
+DEFERRED_FIELDS = ("body", "extra_head", "linked_files")
+for _field_name in DEFERRED_FIELDS:
+    setattr(Example, _field_name, Deferred(_field_name))
 
 
 @dataclass
 class Author(Resource):
     """Information about an author, from Markdown."""
 
+    @classmethod
+    def source_paths(cls, name: str) -> list[Path]:
+        """The author's Markdown file."""
+        return [HERE / "gallery/authors" / f"{name}.md"]
+
     def __post_init__(self) -> None:
         """Initialize the rest of the fields from the Markdown."""
         md_file = HERE / "gallery/authors" / f"{self.name}.md"
@@ -166,6 +353,12 @@ class Page(Resource):
 
     subtitle: str = ""
 
+    @classmethod
+    def source_paths(cls, name: str) -> list[Path]:
+        """The Markdown or HTML file for the page."""
+        candidates = [HERE / "pages" / f"{name}.{suffix}" for suffix in ("md", "html")]
+        return [p for p in candidates if p.exists()]
+
     def __post_init__(self) -> None:
         """Extract content from either Markdown or HTML file."""
         md_file = HERE / "pages" / f"{self.name}.md"
@@ -179,7 +372,7 @@ class Page(Resource):
             md = MarkdownIt()
             self.body = str(md.render(md_fm.content))
         elif html_file.exists():
-            soup = BeautifulSoup(html_file.read_text(), "html5lib")
+            soup = get_soup(html_file.read_text(), settings.PARSER)
             title_node = soup.find("title")
             if title_node:
                 self.title = title_node.text
@@ -202,6 +395,130 @@ class Resources:
     authors: dict[str, Author] = field(default_factory=dict)
     examples: dict[str, Example] = field(default_factory=dict)
     pages: dict[str, Page] = field(default_factory=dict)
+    # Seconds spent constructing each resource, keyed by "examples/name"
+    load_times: dict[str, float] = field(default_factory=dict, compare=False)
+    # Bumped on every change after the initial load
+    version: int = field(default=0, compare=False)
+    # Full-text index over the examples, kept current by store and remove
+    search_index: SearchIndex = field(
+        default_factory=SearchIndex, compare=False, repr=False
+    )
+    # Sorted example names by author, frontmatter tag, and py-config package
+    author_examples: dict[str, tuple[str, ...]] = field(
+        default_factory=dict, compare=False, repr=False
+    )
+    tag_examples: dict[str, tuple[str, ...]] = field(
+        default_factory=dict, compare=False, repr=False
+    )
+    package_examples: dict[str, tuple[str, ...]] = field(
+        default_factory=dict, compare=False, repr=False
+    )
+
+    def replace(self, resource: Resource, load_time: float = 0.0) -> None:
+        """Add or swap one resource, without disturbing current readers.
+
+        The dict is copied, changed, then assigned in one step. A request
+        that already has the old dict keeps a consistent view of it.
+        """
+        kind_name = f"{type(resource).__name__.lower()}s"
+        self.store(kind_name, resource.name, resource, load_time)
+
+    def store(self, kind_name: str, name: str, value: object, load_time: float) -> None:
+        """Put a value under a name in one of the dicts, as ``replace`` does."""
+        resources = dict(getattr(self, kind_name))
+        is_new = name not in resources
+        resources[name] = value
+        if is_new and kind_name != "pages":
+            resources = dict(sorted(resources.items()))
+        self.load_times[f"{kind_name}/{name}"] = load_time
+        self.publish(kind_name, name, resources)
+
+    def remove(self, kind: type[Resource], name: str) -> None:
+        """Drop one resource, using the same copy-then-assign as replace."""
+        kind_name = f"{kind.__name__.lower()}s"
+        resources = dict(getattr(self, kind_name))
+        resources.pop(name, None)
+        self.load_times.pop(f"{kind_name}/{name}", None)
+        self.publish(kind_name, name, resources)
+
+    def publish(self, kind_name: str, name: str, resources: dict[str, Any]) -> None:
+        """Assign a changed dict together with the indexes it changes.
+
+        Everything is built first, then assigned in one update, so a
+        request never sees an index naming a resource the dict lacks.
+        """
+        changes: dict[str, Any] = {kind_name: resources}
+        changes.update(self.get_indexes(kind_name, name, resources))
+        changes["version"] = self.version + 1
+        vars(self).update(changes)
+
+    def get_indexes(
+        self, kind_name: str, name: str, resources: dict[str, Any]
+    ) -> dict[str, Any]:
+        """Copies of the indexes changed by one resource, by attribute name.
+
+        Like the resource dicts, each index is changed on a copy, so a
+        request in progress is not disturbed.
+        """
+        examples, authors = self.examples, self.authors
+        indexes: dict[str, Any] = {}
+        if kind_name == "authors":
+            authors = resources
+            names = list(self.author_examples.get(name, ()))
+        elif kind_name == "examples":
+            examples = resources
+            names = [name]
+            this_example = examples.get(name)
+            for index_name, get_keys in EXAMPLE_INDEXES.items():
+                keys = get_keys(this_example) if this_example else []
+                index = getattr(self, index_name)
+                indexes[index_name] = refile(index, name, keys)
+        else:
+            return indexes
+        search_index = self.search_index.copy()
+        for example_name in names:
+            this_example = examples.get(example_name)
+            if this_example is None:
+                search_index.remove(example_name)
+                continue
+            this_author = authors.get(this_example.author)
+            search_index.add(this_example, this_author.title if this_author else "")
+        indexes["search_index"] = search_index
+        return indexes
+
+
+# Each secondary index on Resources, with how to get an example's keys
+EXAMPLE_INDEXES: dict[str, Callable[[Any], Iterable[str]]] = dict(
+    author_examples=lambda e: [e.author] if e.author else [],
+    tag_examples=attrgetter("tags"),
+    package_examples=attrgetter("packages"),
+)
+
+
+def group_examples(
+    examples: Iterable[Any], get_keys: Callable[[Any], Iterable[str]]
+) -> dict[str, tuple[str, ...]]:
+    """Map each key to the sorted names of the examples having it."""
+    groups: dict[str, list[str]] = {}
+    for this_example in examples:
+        for key in get_keys(this_example):
+            groups.setdefault(key, []).append(this_example.name)
+    return {key: tuple(sorted(names)) for key, names in sorted(groups.items())}
+
+
+def refile(
+    index: dict[str, tuple[str, ...]], name: str, keys: Iterable[str]
+) -> dict[str, tuple[str, ...]]:
+    """A copy of the index with the example filed under exactly these keys."""
+    keys = set(keys)
+    refiled = {}
+    for key in sorted({*index, *keys}):
+        names = {*index.get(key, ())} - {name}
+        if key in keys:
+            names.add(name)
+        if names:
+            refiled[key] = tuple(sorted(names))
+    return refiled
 
 
 def get_sorted_paths(target_dir: Path, only_dirs: bool = True) -> list[PurePath]:
@@ -214,27 +531,96 @@ def get_sorted_paths(target_dir: Path, only_dirs: bool = True) -> list[PurePath]
     return sorted(paths, key=attrgetter("name"))
 
 
-def get_resources() -> Resources:
-    """Factory to construct all the resources in the site."""
-    resources = Resources()
+def load_resource(
+    kind: type[Resource],
+    name: str,
+    cache: ResourceCache | None = None,
+    lazy: bool = False,
+    lockfile: dict[str, Any] | None = None,
+) -> tuple[Resource, float]:
+    """Construct one resource, returning it with its parse time in seconds.
 
-    # Load the authors
+    With a ``cache``, a fresh entry is used instead of parsing, and a
+    parsed resource is stored for next time. An example is given the
+    ``lockfile``, when already read.
+    """
+    start = perf_counter()
+    resource = cache.get(kind, name) if cache else None
+    if resource is None:
+        if kind is Example:
+            resource = Example(name=name, lazy=lazy, lockfile=lockfile)
+        else:
+            resource = kind(name=name, lazy=lazy)
+        if cache:
+            cache.put(resource)
+    return resource, perf_counter() - start
+
+
+def load_resources(
+    jobs: Iterable[tuple[type[Resource], str]],
+    loader: str = "serial",
+    max_workers: int | None = None,
+    cache: ResourceCache | None = None,
+    lazy: bool = False,
+    lockfile: dict[str, Any] | None = None,
+) -> list[tuple[Resource, float]]:
+    """Run ``load_resource`` for each job, in order, using the loader."""
+    if loader not in LOADERS:
+        raise ValueError(f"No loader named {loader}")
+    executor_class = LOADERS[loader]
+    if executor_class is None:
+        return [load_resource(kind, name, cache, lazy, lockfile) for kind, name in jobs]
+
+    jobs = list(jobs)
+    kinds = [kind for kind, _ in jobs]
+    names = [name for _, name in jobs]
+    caches = [cache] * len(jobs)
+    lazies = [lazy] * len(jobs)
+    lockfiles = [lockfile] * len(jobs)
+    with executor_class(max_workers=max_workers) as executor:
+        return list(
+            executor.map(load_resource, kinds, names, caches, lazies, lockfiles)
+        )
+
+
+def get_resource_keys() -> list[tuple[type[Resource], str]]:
+    """List every resource on disk: authors, then examples, then pages."""
     authors = HERE / "gallery/authors"
-    for author in get_sorted_paths(authors, only_dirs=False):
-        this_author = Author(name=author.stem)
-        resources.authors[author.stem] = this_author
-
-    # Load the examples
     examples = HERE / "gallery/examples"
-    for example in get_sorted_paths(examples):
-        this_example = Example(example.stem)
-        resources.examples[example.stem] = this_example
-
-    # Load the Pages
     pages_dir = HERE / "pages"
-    pages = [e for e in pages_dir.iterdir()]
-    for page in pages:
-        this_page = Page(name=page.stem)
-        resources.pages[page.stem] = this_page
+    return [
+        *[(Author, a.stem) for a in get_sorted_paths(authors, only_dirs=False)],
+        *[(Example, e.stem) for e in get_sorted_paths(examples)],
+        *[(Page, p.stem) for p in pages_dir.iterdir()],
+    ]
+
+
+def get_resources(
+    loader: str = "serial",
+    max_workers: int | None = None,
+    cache: ResourceCache | None = None,
+    lazy: bool = False,
+) -> Resources:
+    """Factory to construct all the resources in the site.
+
+    The ``loader`` picks how the resources get parsed: ``serial``, or
+    concurrently with a ``thread`` or ``process`` pool of ``max_workers``.
+    The result is the same, in the same order, whichever is used.
+    Pass a ``cache`` to only parse the resources that changed since
+    the last run, and ``lazy`` to defer parsing example HTML until used.
+    The lockfile is read once, here, for all the examples.
+    """
+    resources = Resources()
+    jobs = get_resource_keys()
+    lockfile = read_lockfile(LOCKFILE)
+    loaded = load_resources(jobs, loader, max_workers, cache, lazy, lockfile)
+    for resource, load_time in loaded:
+        kind_name = f"{type(resource).__name__.lower()}s"
+        getattr(resources, kind_name)[resource.name] = resource
+        resources.load_times[f"{kind_name}/{resource.name}"] = load_time
+    examples = resources.examples.values()
+    resources.search_index = build_search_index(examples, resources.authors)
+    for index_name, get_keys in EXAMPLE_INDEXES.items():
+        setattr(resources, index_name, group_examples(examples, get_keys))
 
     return resources
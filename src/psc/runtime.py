@@ -0,0 +1,129 @@
+"""Serve the Pyodide runtime: cached for good, resumable, correctly typed.
+
+``psc download`` fetches one pinned Pyodide release, so its files never
+change under the same URL. Browsers and CDNs may keep them for a year
+without revalidating. The runtime is tens of megabytes, so a single
+byte range may be requested to resume an interrupted download.
+"""
+import os
+from collections.abc import AsyncIterator
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse
+from starlette.responses import Response
+from starlette.responses import StreamingResponse
+from starlette.staticfiles import NotModifiedResponse
+from starlette.staticfiles import PathLike
+from starlette.types import Scope
+
+from psc.compression import PrecompressedStaticFiles
+from psc.media_types import get_media_type
+
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(range_header: str, size: int) -> tuple[int, int] | None:
+    """The first and last byte of a single ``bytes=`` range.
+
+    Returns None for anything else, meaning send the whole file.
+    Raises ``ValueError`` when the range starts past the end.
+    """
+    unit, _, byte_range = range_header.partition("=")
+    if unit.strip() != "bytes" or "," in byte_range:
+        return None
+    first, _, last = byte_range.strip().partition("-")
+    if not (first + last).isdigit():
+        return None
+    if not first:
+        # A suffix, the last N bytes
+        if int(last) == 0:
+            raise ValueError("Empty suffix range")
+        return max(size - int(last), 0), size - 1
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    if start >= size:
+        raise ValueError("Range starts past the end")
+    if end < start:
+        return None
+    return start, end
+
+
+async def iter_file_range(path: PathLike, start: int, end: int) -> AsyncIterator[bytes]:
+    """Read the bytes from start to end, inclusive, a chunk at a time."""
+    async with await anyio.open_file(path, "rb") as f:
+        await f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+class RuntimeFiles(PrecompressedStaticFiles):
+    """Static files for a pinned runtime release, see the module docstring."""
+
+    def get_headers(self, full_path: PathLike) -> dict[str, str]:
+        """Cache for good, and say ranges are supported."""
+        return {"cache-control": IMMUTABLE, "accept-ranges": "bytes"}
+
+    def file_response(
+        self,
+        full_path: PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        """Send the requested byte range of the uncompressed file, if any."""
+        request_headers = Headers(scope=scope)
+        range_header = request_headers.get("range")
+        if range_header is None or status_code != 200:
+            return super().file_response(full_path, stat_result, scope, status_code)
+
+        headers = self.get_headers(full_path)
+        response = FileResponse(
+            full_path,
+            media_type=get_media_type(full_path),
+            headers=headers,
+            stat_result=stat_result,
+            method=scope["method"],
+        )
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+        # Only resume when the client still has the same file
+        if_range = request_headers.get("if-range")
+        validators = (response.headers["etag"], response.headers["last-modified"])
+        if if_range is not None and if_range not in validators:
+            return response
+
+        size = stat_result.st_size
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            headers["content-range"] = f"bytes */{size}"
+            return Response(status_code=416, headers=headers)
+        if byte_range is None:
+            return response
+        start, end = byte_range
+        headers.update(
+            {
+                "etag": response.headers["etag"],
+                "last-modified": response.headers["last-modified"],
+                "content-range": f"bytes {start}-{end}/{size}",
+                "content-length": str(end - start + 1),
+            }
+        )
+        if scope["method"] == "HEAD":
+            return Response(
+                status_code=206, media_type=get_media_type(full_path), headers=headers
+            )
+        return StreamingResponse(
+            iter_file_range(full_path, start, end),
+            status_code=206,
+            media_type=get_media_type(full_path),
+            headers=headers,
+        )
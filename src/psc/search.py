@@ -0,0 +1,144 @@
+"""An inverted index for searching the gallery examples.
+
+Each term maps to the examples containing it, with a score weighted by
+the field it was found in. The index is built when the resources load,
+kept current on reload, and exported as JSON so the static site can
+search without a server.
+"""
+import math
+import re
+from collections import Counter
+from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import dataclass
+from dataclasses import field
+from typing import Any
+
+from psc.here import HERE
+
+
+SEARCH_INDEX_FORMAT = 1
+TERM_PATTERN = re.compile(r"[a-z0-9_]+")
+TAG_PATTERN = re.compile(r"<[^>]+>")
+FIELD_WEIGHTS = dict(title=5.0, subtitle=3.0, author=3.0, description=2.0, code=1.0)
+CODE_SUFFIXES = (".py", ".js", ".css", ".html")
+
+
+def get_terms(text: str) -> list[str]:
+    """Split text into lowercase terms, ignoring markup and single letters."""
+    text = TAG_PATTERN.sub(" ", text).lower()
+    return [term for term in TERM_PATTERN.findall(text) if len(term) > 1]
+
+
+def get_code(example_name: str) -> str:
+    """The source files of an example, straight from disk.
+
+    This avoids parsing lazy examples just to index them.
+    """
+    example_path = HERE / "gallery/examples" / example_name
+    return "\n".join(
+        p.read_text()
+        for p in sorted(example_path.iterdir())
+        if p.suffix in CODE_SUFFIXES and p.is_file()
+    )
+
+
+@dataclass(frozen=True)
+class SearchResult:
+    """One example matching a query."""
+
+    name: str
+    title: str
+    subtitle: str
+    score: float
+
+
+@dataclass
+class SearchIndex:
+    """Map each term to the examples using it, and a weighted score."""
+
+    postings: dict[str, dict[str, float]] = field(default_factory=dict)
+    documents: dict[str, dict[str, str]] = field(default_factory=dict)
+
+    def add(self, example: Any, author_title: str = "") -> None:
+        """Index one example, replacing any earlier version of it."""
+        self.remove(example.name)
+        fields = dict(
+            title=example.title,
+            subtitle=example.subtitle,
+            author=f"{example.author} {author_title}",
+            description=example.description,
+            code=get_code(example.name),
+        )
+        weights: defaultdict[str, float] = defaultdict(float)
+        for field_name, text in fields.items():
+            for term, count in Counter(get_terms(text)).items():
+                # Repeats count, but with diminishing returns
+                weights[term] += FIELD_WEIGHTS[field_name] * (1 + math.log(count))
+        for term, weight in weights.items():
+            self.postings.setdefault(term, {})[example.name] = weight
+        self.documents[example.name] = dict(
+            title=example.title, subtitle=example.subtitle
+        )
+
+    def copy(self) -> "SearchIndex":
+        """A copy that can change without disturbing current searches."""
+        return SearchIndex(
+            postings={term: dict(examples) for term, examples in self.postings.items()},
+            documents=dict(self.documents),
+        )
+
+    def remove(self, name: str) -> None:
+        """Drop an example from the index."""
+        if self.documents.pop(name, None) is None:
+            return
+        for term in list(self.postings):
+            examples = self.postings[term]
+            examples.pop(name, None)
+            if not examples:
+                del self.postings[term]
+
+    def search(self, query: str, limit: int = 20) -> list[SearchResult]:
+        """Rank the examples matching the most query terms, then by score."""
+        total = len(self.documents)
+        scores: defaultdict[str, float] = defaultdict(float)
+        matches: Counter[str] = Counter()
+        for term in set(get_terms(query)):
+            examples = self.postings.get(term, {})
+            # Rare terms say more about an example than common ones
+            idf = math.log(1 + total / len(examples)) if examples else 0.0
+            for name, weight in examples.items():
+                scores[name] += weight * idf
+                matches[name] += 1
+        ranked = sorted(scores, key=lambda name: (-matches[name], -scores[name], name))
+        return [
+            SearchResult(
+                name=name, score=round(scores[name], 3), **self.documents[name]
+            )
+            for name in ranked[:limit]
+        ]
+
+    def to_json(self) -> dict[str, Any]:
+        """A compact form for searching in the browser."""
+        names = list(self.documents)
+        positions = {name: position for position, name in enumerate(names)}
+        return dict(
+            format=SEARCH_INDEX_FORMAT,
+            documents=[dict(name=name, **self.documents[name]) for name in names],
+            terms={
+                term: [
+                    [positions[name], round(weight, 3)]
+                    for name, weight in examples.items()
+                ]
+                for term, examples in sorted(self.postings.items())
+            },
+        )
+
+
+def build_search_index(examples: Iterable[Any], authors: dict[str, Any]) -> SearchIndex:
+    """Index all the examples, with the titles of their authors."""
+    search_index = SearchIndex()
+    for example in examples:
+        author = authors.get(example.author)
+        search_index.add(example, author.title if author else "")
+    return search_index
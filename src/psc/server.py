@@ -0,0 +1,141 @@
+"""Run the app in production: preloaded, pre-forked, stopped gracefully.
+
+The resources are loaded once, in the parent process, before forking
+the workers. The workers then share those pages of memory
+copy-on-write instead of each parsing the gallery again.
+``gc.freeze`` moves the preloaded objects out of the collector's reach,
+so a collection in a worker doesn't write to, and so copy, every page.
+
+The parent binds the socket, which the workers all accept on. On
+SIGTERM or SIGINT it passes SIGTERM on, and each worker finishes the
+requests it has before exiting. Workers still running after the
+graceful timeout are killed. A worker that dies on its own is replaced,
+unless it dies straight after starting, which would only repeat.
+"""
+import gc
+import os
+import signal
+import socket
+import time
+from dataclasses import dataclass
+from dataclasses import field
+from types import FrameType
+
+import uvicorn
+
+from psc import settings
+from psc.app import app
+from psc.app import configure_app
+from psc.app import get_app_resources
+from psc.cache import ResourceCache
+
+
+# Seconds a worker must have run for to be replaced when it dies.
+MIN_WORKER_LIFETIME = 5.0
+POLL_INTERVAL = 0.1
+
+
+def get_config(
+    host: str = "127.0.0.1",
+    port: int = 3000,
+    loop: str = "auto",
+    http: str = "auto",
+    keep_alive: int = 5,
+) -> uvicorn.Config:
+    """The uvicorn config for the app.
+
+    The "auto" loop and HTTP parser are uvloop and httptools, when they
+    are installed.
+    """
+    return uvicorn.Config(
+        app,
+        host=host,
+        port=port,
+        loop=loop,
+        http=http,
+        timeout_keep_alive=keep_alive,
+        log_level="info",
+        server_header=False,
+    )
+
+
+def preload() -> None:
+    """Load the resources for the workers forked after, and freeze them."""
+    cache = ResourceCache(settings.CACHE_DIR) if settings.CACHE_ENABLED else None
+    app.state.preloaded = get_app_resources(cache)
+    gc.freeze()
+
+
+@dataclass
+class Supervisor:
+    """Fork workers serving on one socket, and stop them gracefully."""
+
+    config: uvicorn.Config
+    workers: int
+    graceful_timeout: float = 30.0
+    started: dict[int, float] = field(default_factory=dict)
+    deadline: float | None = None
+
+    def spawn(self, sock: socket.socket) -> None:
+        """Fork a worker, which serves until told to stop."""
+        pid = os.fork()
+        if pid == 0:  # pragma: no cover
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            try:
+                uvicorn.Server(self.config).run(sockets=[sock])
+            finally:
+                os._exit(0)
+        self.started[pid] = time.monotonic()
+
+    def stop(self, signum: int, frame: FrameType | None = None) -> None:
+        """Ask every worker to finish, and start counting down."""
+        if self.deadline is None:
+            self.deadline = time.monotonic() + self.graceful_timeout
+        for pid in list(self.started):
+            os.kill(pid, signal.SIGTERM)
+
+    def reap(self, sock: socket.socket) -> None:
+        """Forget the workers that exited, replacing them if still running."""
+        while self.started:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+            if pid == 0:
+                return
+            lifetime = time.monotonic() - self.started.pop(pid)
+            if self.deadline is None and lifetime >= MIN_WORKER_LIFETIME:
+                self.spawn(sock)
+
+    def run(self) -> None:
+        """Serve until stopped and every worker is gone."""
+        sock = self.config.bind_socket()
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        for _ in range(self.workers):
+            self.spawn(sock)
+        while self.started:
+            self.reap(sock)
+            if self.deadline is not None and time.monotonic() > self.deadline:
+                for pid in list(self.started):
+                    os.kill(pid, signal.SIGKILL)
+            time.sleep(POLL_INTERVAL)
+        sock.close()
+
+
+def serve(
+    config: uvicorn.Config,
+    workers: int = 1,
+    graceful_timeout: float = 30.0,
+    production: bool = False,
+) -> None:  # pragma: no cover
+    """Serve the app, in production without debugging, preloaded.
+
+    Even a single worker is supervised, for the graceful timeout, unless
+    the platform can't fork.
+    """
+    if production:
+        configure_app(debug=False)
+        preload()
+    if hasattr(os, "fork"):
+        Supervisor(config, workers, graceful_timeout).run()
+    else:
+        uvicorn.Server(config).run()
@@ -0,0 +1,75 @@
+"""Settings for the app, read from the environment.
+
+Each setting has a ``PSC_`` environment variable, so they can be set
+for ``psc start`` as well as for a deployment.
+"""
+from pathlib import Path
+
+from starlette.config import Config
+
+from psc.here import CACHE
+from psc.here import DOWNLOADS
+from psc.here import SNAPSHOT
+
+
+config = Config()
+
+# Tracebacks in error pages, and templates reloaded when they change.
+DEBUG: bool = config("PSC_DEBUG", cast=bool, default=True)
+
+# How ``get_resources`` parses resources: serial, thread, or process.
+LOADER: str = config("PSC_LOADER", default="serial")
+# Pool size for the thread and process loaders, None means the default.
+LOADER_WORKERS: int | None = config("PSC_LOADER_WORKERS", cast=int, default=None)
+# Only read example metadata at startup, parse the HTML on first use.
+LAZY: bool = config("PSC_LAZY", cast=bool, default=False)
+# Hold slotted resources sharing identical text, see ``psc.compact``.
+COMPACT: bool = config("PSC_COMPACT", cast=bool, default=False)
+# Parser backend for resource HTML, see ``psc.parsers.PARSERS``.
+PARSER: str = config("PSC_PARSER", default="html5lib")
+# Keep parsed resources on disk, so a restart only parses what changed.
+CACHE_ENABLED: bool = config("PSC_CACHE", cast=bool, default=True)
+CACHE_DIR: Path = config("PSC_CACHE_DIR", cast=Path, default=CACHE)
+# Watch the source files and reload just the resources that change.
+WATCH: bool = config("PSC_WATCH", cast=bool, default=False)
+WATCH_INTERVAL: float = config("PSC_WATCH_INTERVAL", cast=float, default=1.0)
+# Keep rendered pages until the resources change, and answer conditional
+# requests with 304, see ``psc.page_cache``. Unset, only when not
+# debugging, as cached pages would hide edited templates.
+PAGE_CACHE: bool | None = config("PSC_PAGE_CACHE", cast=bool, default=None)
+PAGE_CACHE_SIZE: int = config("PSC_PAGE_CACHE_SIZE", cast=int, default=1024)
+# Read linked files from disk while rendering the code page, instead of
+# holding them in memory. Over the size cap, link to the raw file instead.
+STREAM_LINKED_FILES: bool = config("PSC_STREAM_LINKED_FILES", cast=bool, default=False)
+LINKED_FILE_MAX_SIZE: int | None = config(
+    "PSC_LINKED_FILE_MAX_SIZE", cast=int, default=None
+)
+# Load resources from this file at startup when it is current, see
+# ``psc snapshot``.
+SNAPSHOT_PATH: Path = config("PSC_SNAPSHOT", cast=Path, default=SNAPSHOT)
+# Give static and example assets content-hashed URLs, cached for good,
+# see ``psc.fingerprint``.
+FINGERPRINT_ASSETS: bool = config("PSC_FINGERPRINT_ASSETS", cast=bool, default=True)
+# Where ``psc download`` keeps artifacts by version, the base URL of a
+# mirror to fetch them from, and the PyScript release, see ``psc.download``.
+DOWNLOAD_CACHE: Path = config("PSC_DOWNLOAD_CACHE", cast=Path, default=DOWNLOADS)
+DOWNLOAD_MIRROR: str | None = config("PSC_DOWNLOAD_MIRROR", default=None)
+PYSCRIPT_VERSION: str = config("PSC_PYSCRIPT_VERSION", default="latest")
+# The SHA-256 the Pyodide tarball must have, whatever a mirror publishes.
+# Without it, ``psc download --allow-unverified`` trusts the first download.
+PYODIDE_SHA256: str | None = config("PSC_PYODIDE_SHA256", default=None)
+# Count and time requests, exposed at ``/metrics``, see ``psc.metrics``.
+METRICS: bool = config("PSC_METRICS", cast=bool, default=False)
+# Add a ``Server-Timing`` header to responses, and for debugging only,
+# sample requests that ask for a profile, see ``psc.profiling``.
+SERVER_TIMING: bool = config("PSC_SERVER_TIMING", cast=bool, default=False)
+PROFILE: bool = config("PSC_PROFILE", cast=bool, default=False)
+PROFILE_INTERVAL: float = config("PSC_PROFILE_INTERVAL", cast=float, default=0.005)
+# Where and how ``psc start`` serves, see ``psc.server``. Idle
+# keep-alive connections close after ``KEEP_ALIVE`` seconds, and workers
+# get ``GRACEFUL_TIMEOUT`` seconds to finish their requests on shutdown.
+HOST: str = config("PSC_HOST", default="127.0.0.1")
+PORT: int = config("PSC_PORT", cast=int, default=3000)
+WORKERS: int = config("PSC_WORKERS", cast=int, default=1)
+KEEP_ALIVE: int = config("PSC_KEEP_ALIVE", cast=int, default=5)
+GRACEFUL_TIMEOUT: float = config("PSC_GRACEFUL_TIMEOUT", cast=float, default=30.0)
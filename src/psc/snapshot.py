@@ -0,0 +1,290 @@
+"""Save fully loaded resources to one file, for a fast cold start.
+
+``psc snapshot`` writes the file once, for example while building a
+container image. At startup the app reads it back instead of parsing
+every resource with BeautifulSoup and Markdown.
+
+The format is versioned, in these sections:
+
+- A fixed-size header: magic, format, the key, and the section sizes.
+- The offsets of each string in the string blob, as uint64.
+- The fields of every resource, as uint64 numbers and string indexes.
+- The search index weights, as float64.
+- The string blob, UTF-8, with each distinct string stored once.
+
+The key hashes every source file, so an out-of-date snapshot is
+ignored and the resources get loaded as usual.
+
+Loading maps the file but decodes every string up front, into ordinary
+resources, and closes it. What's saved is the parsing, not the memory:
+nothing is read lazily from the mapping.
+"""
+import mmap
+import os
+import struct
+from array import array
+from collections.abc import Iterable
+from dataclasses import dataclass
+from dataclasses import field
+from hashlib import sha256
+from pathlib import Path
+from pathlib import PurePath
+from tempfile import NamedTemporaryFile
+from typing import Any
+
+from psc import settings
+from psc.cache import get_cache_key
+from psc.here import HERE
+from psc.resources import EXAMPLE_INDEXES
+from psc.resources import Author
+from psc.resources import Example
+from psc.resources import LinkedFile
+from psc.resources import Page
+from psc.resources import Resources
+from psc.resources import get_resource_keys
+from psc.resources import group_examples
+from psc.search import SearchIndex
+
+
+MAGIC = b"PSCSNAP\0"
+# Bump when the layout or the stored fields change.
+SNAPSHOT_FORMAT = 1
+HEADER = struct.Struct("<8sQ64sQQQQ")
+FIELDS: dict[type[Any], tuple[str, ...]] = {
+    Author: ("name", "title", "body", "extra_head"),
+    Example: (
+        "name",
+        "title",
+        "subtitle",
+        "description",
+        "author",
+        "body",
+        "extra_head",
+    ),
+    Page: ("name", "title", "subtitle", "body", "extra_head"),
+}
+
+
+def get_snapshot_key() -> str:
+    """Hash the cache key of every resource, plus this format."""
+    digest = sha256(f"{SNAPSHOT_FORMAT}".encode())
+    for module_name in ("snapshot.py", "search.py"):
+        digest.update((HERE / module_name).read_bytes())
+    for kind, name in get_resource_keys():
+        digest.update(get_cache_key(kind, name).encode())
+    return digest.hexdigest()
+
+
+@dataclass
+class SnapshotWriter:
+    """Collect values into the number, weight, and string sections."""
+
+    strings: dict[str, int] = field(default_factory=dict)
+    numbers: "array[int]" = field(default_factory=lambda: array("Q"))
+    weights: "array[float]" = field(default_factory=lambda: array("d"))
+
+    def number(self, value: int) -> None:
+        """Add a count or size."""
+        self.numbers.append(value)
+
+    def text(self, value: str) -> None:
+        """Add a string, by its index in the string table."""
+        self.number(self.strings.setdefault(value, len(self.strings)))
+
+    def texts(self, values: Iterable[str]) -> None:
+        """Add a list of strings, prefixed by its length."""
+        values = list(values)
+        self.number(len(values))
+        for value in values:
+            self.text(value)
+
+    def to_bytes(self, key: str) -> bytes:
+        """Lay out the header and sections."""
+        encoded = [value.encode() for value in self.strings]
+        offsets = array("Q", [0])
+        for value in encoded:
+            offsets.append(offsets[-1] + len(value))
+        header = HEADER.pack(
+            MAGIC,
+            SNAPSHOT_FORMAT,
+            key.encode(),
+            len(encoded),
+            offsets[-1],
+            len(self.numbers),
+            len(self.weights),
+        )
+        sections = (offsets, self.numbers, self.weights)
+        return b"".join([header, *[s.tobytes() for s in sections], *encoded])
+
+
+@dataclass
+class SnapshotReader:
+    """Read values back, in the order they were written."""
+
+    strings: list[str]
+    numbers: list[int]
+    weights: list[float]
+    position: int = 0
+    weight_position: int = 0
+
+    def number(self) -> int:
+        """The next count or size."""
+        self.position += 1
+        return self.numbers[self.position - 1]
+
+    def text(self) -> str:
+        """The next string."""
+        return self.strings[self.number()]
+
+    def texts(self) -> list[str]:
+        """The next list of strings."""
+        return [self.text() for _ in range(self.number())]
+
+    def weight(self) -> float:
+        """The next search index weight."""
+        self.weight_position += 1
+        return self.weights[self.weight_position - 1]
+
+
+def rehydrate(kind: type[Any], values: dict[str, Any]) -> Any:
+    """Make a resource from its field values, skipping ``__post_init__``."""
+    resource = object.__new__(kind)
+    resource.__dict__.update(values)
+    return resource
+
+
+def write_resources(writer: SnapshotWriter, resources: Resources) -> None:
+    """Add each kind of resource, then the search index."""
+    for kind, kind_name in (
+        (Author, "authors"),
+        (Example, "examples"),
+        (Page, "pages"),
+    ):
+        these_resources = getattr(resources, kind_name).values()
+        writer.number(len(these_resources))
+        for resource in these_resources:
+            for field_name in FIELDS[kind]:
+                writer.text(getattr(resource, field_name))
+            if kind is Example:
+                writer.texts(resource.tags)
+                writer.texts(resource.packages)
+                writer.number(len(resource.linked_files))
+                for linked_file in resource.linked_files:
+                    path = PurePath(HERE / linked_file.path).relative_to(HERE)
+                    writer.text(path.as_posix())
+                    writer.text(linked_file.language)
+                    writer.text(linked_file.body)
+                    writer.number(linked_file.size)
+
+    search_index = resources.search_index
+    writer.number(len(search_index.documents))
+    for name, document in search_index.documents.items():
+        writer.texts([name, document["title"], document["subtitle"]])
+    writer.number(len(search_index.postings))
+    for term, examples in search_index.postings.items():
+        writer.text(term)
+        writer.texts(examples)
+        writer.weights.extend(examples.values())
+
+
+def read_resources(reader: SnapshotReader) -> Resources:
+    """Rebuild the resources in the order ``write_resources`` used."""
+    resources = Resources()
+    for kind, kind_name in (
+        (Author, "authors"),
+        (Example, "examples"),
+        (Page, "pages"),
+    ):
+        these_resources = getattr(resources, kind_name)
+        for _ in range(reader.number()):
+            values: dict[str, Any] = {f: reader.text() for f in FIELDS[kind]}
+            values["lazy"] = False
+            if kind is Example:
+                values["tags"] = reader.texts()
+                values["packages"] = reader.texts()
+                values["linked_files"] = [
+                    rehydrate(
+                        LinkedFile,
+                        dict(
+                            path=HERE / reader.text(),
+                            language=reader.text(),
+                            body=reader.text(),
+                            size=reader.number(),
+                            stream=settings.STREAM_LINKED_FILES,
+                        ),
+                    )
+                    for _ in range(reader.number())
+                ]
+            these_resources[values["name"]] = rehydrate(kind, values)
+            resources.load_times[f"{kind_name}/{values['name']}"] = 0.0
+
+    search_index = SearchIndex()
+    for _ in range(reader.number()):
+        name, title, subtitle = reader.texts()
+        search_index.documents[name] = dict(title=title, subtitle=subtitle)
+    for _ in range(reader.number()):
+        term = reader.text()
+        search_index.postings[term] = {n: reader.weight() for n in reader.texts()}
+    resources.search_index = search_index
+    examples = resources.examples.values()
+    for index_name, get_keys in EXAMPLE_INDEXES.items():
+        setattr(resources, index_name, group_examples(examples, get_keys))
+    return resources
+
+
+def write_snapshot(resources: Resources, path: Path) -> int:
+    """Save the resources, replacing any previous snapshot atomically.
+
+    Returns the size of the snapshot in bytes.
+    """
+    writer = SnapshotWriter()
+    write_resources(writer, resources)
+    data = writer.to_bytes(get_snapshot_key())
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with NamedTemporaryFile("wb", dir=path.parent, delete=False) as f:
+        f.write(data)
+    os.replace(f.name, path)
+    return len(data)
+
+
+def load_snapshot(path: Path) -> Resources | None:
+    """Load the resources, or None if the snapshot is missing or stale.
+
+    All the strings are decoded here, so the file isn't kept open.
+    """
+    try:
+        with open(path, "rb") as f, mmap.mmap(
+            f.fileno(), 0, access=mmap.ACCESS_READ
+        ) as m:
+            (
+                magic,
+                snapshot_format,
+                key,
+                string_count,
+                _,
+                number_count,
+                weight_count,
+            ) = HEADER.unpack_from(m)
+            if magic != MAGIC or snapshot_format != SNAPSHOT_FORMAT:
+                return None
+            if key.decode() != get_snapshot_key():
+                return None
+            offsets, numbers = array("Q"), array("Q")
+            weights = array("d")
+            start = HEADER.size
+            for section, count in (
+                (offsets, string_count + 1),
+                (numbers, number_count),
+                (weights, weight_count),
+            ):
+                end = start + count * section.itemsize
+                section.frombytes(m[start:end])
+                start = end
+            strings = [
+                m[start + offsets[i] : start + offsets[i + 1]].decode()
+                for i in range(string_count)
+            ]
+    except (OSError, ValueError, struct.error):
+        return None
+    reader = SnapshotReader(strings, numbers.tolist(), weights.tolist())
+    return read_resources(reader)
@@ -0,0 +1,61 @@
+// Search the static site in the browser, using the index from psc build.
+// Ranking matches SearchIndex.search: most query terms first, then score.
+(function () {
+  const container = document.getElementById("search_results");
+  const query = (new URLSearchParams(window.location.search).get("q") || "").trim();
+  // The server already answered this query
+  if (!query || query === container.dataset.query) {
+    return;
+  }
+  document.getElementById("search_query").value = query;
+  const rootPath = container.dataset.rootPath;
+
+  function getTerms(text) {
+    const terms = text.replace(/<[^>]+>/g, " ").toLowerCase().match(/[a-z0-9_]+/g) || [];
+    return terms.filter((term) => term.length > 1);
+  }
+
+  function render(index) {
+    const total = index.documents.length;
+    const scores = new Map();
+    const matches = new Map();
+    for (const term of new Set(getTerms(query))) {
+      const postings = index.terms[term] || [];
+      const idf = postings.length ? Math.log(1 + total / postings.length) : 0;
+      for (const [position, weight] of postings) {
+        scores.set(position, (scores.get(position) || 0) + weight * idf);
+        matches.set(position, (matches.get(position) || 0) + 1);
+      }
+    }
+    const ranked = [...scores.keys()].sort(
+      (a, b) => matches.get(b) - matches.get(a) || scores.get(b) - scores.get(a)
+    );
+    container.replaceChildren();
+    if (!ranked.length) {
+      const message = document.createElement("p");
+      message.className = "no-results";
+      message.textContent = `No examples match ${query}.`;
+      container.append(message);
+    }
+    for (const position of ranked.slice(0, 20)) {
+      const doc = index.documents[position];
+      const article = document.createElement("article");
+      article.className = "box";
+      const title = document.createElement("p");
+      title.className = "title is-5";
+      const link = document.createElement("a");
+      link.href = `${rootPath}/gallery/examples/${doc.name}/`;
+      link.textContent = doc.title;
+      title.append(link);
+      const subtitle = document.createElement("p");
+      subtitle.className = "subtitle is-6";
+      subtitle.textContent = doc.subtitle;
+      article.append(title, subtitle);
+      container.append(article);
+    }
+  }
+
+  fetch(`${rootPath}/search/index.json`)
+    .then((response) => response.json())
+    .then(render);
+})();
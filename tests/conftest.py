@@ -1,2 +1,23 @@
 """Configure tests for PSC."""
+from pathlib import Path
+
+import pytest
+
+from psc.resources import Resources
+from psc.resources import get_resources
+
+
 pytest_plugins = "psc.fixtures"
+
+
+@pytest.fixture(autouse=True)
+def user_cache(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Keep the parse cache and snapshot out of the user's cache dir."""
+    monkeypatch.setattr("psc.settings.CACHE_DIR", tmp_path / "cache")
+    monkeypatch.setattr("psc.settings.SNAPSHOT_PATH", tmp_path / "resources.snapshot")
+
+
+@pytest.fixture(scope="module")
+def resources() -> Resources:
+    """Cache the generation of resources for each test file."""
+    return get_resources()
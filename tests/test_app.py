@@ -1,7 +1,10 @@
 """Test the Starlette web app for browsing examples."""
+import re
+
 from starlette.testclient import TestClient
 
 from psc.fixtures import PageT
+from psc.runtime import IMMUTABLE
 
 
 def test_index_page(client_page: PageT) -> None:
@@ -22,9 +25,10 @@ def test_bulma_css(client_page: PageT, test_client: TestClient) -> None:
     stylesheet = soup.select_one("link[rel='stylesheet']")
     if stylesheet:
         href = stylesheet.attrs["href"]
-        assert href == "./static/psc.css"
+        assert re.match(r"^\./static/psc\.[0-9a-f]{10}\.css$", href)
         response = test_client.get(href)
         assert response.status_code == 200
+        assert response.headers["cache-control"] == IMMUTABLE
 
 
 def test_favicon(test_client: TestClient) -> None:
@@ -70,3 +74,43 @@ def test_static(test_client: TestClient) -> None:
     """Ensure the app provides a /static/ route."""
     response = test_client.get("/static/bulma.min.css")
     assert response.status_code == 200
+
+
+def test_gallery_filters(client_page: PageT) -> None:
+    """The gallery links to views filtered by tag and by package."""
+    soup = client_page("/gallery/index.html")
+    tag_link = soup.select_one("#gallery_filters a[href$='/tags/beginner.html']")
+    assert tag_link
+    tag_soup = client_page("/gallery/tags/beginner.html")
+    titles = [a.text for a in tag_soup.select("p.title a")]
+    assert titles == ["Hello World", "Hello World Python"]
+    subtitle = tag_soup.select_one("p.subtitle")
+    assert subtitle and subtitle.text.strip() == "Examples tagged beginner."
+
+    package_soup = client_page("/gallery/packages/pandas.html")
+    titles = [a.text for a in package_soup.select("p.title a")]
+    assert titles == ["Altair Visualization"]
+    first_href = package_soup.select_one("p.title a")
+    assert first_href and first_href.get("href") == "../../gallery/examples/altair/"
+
+
+def test_gallery_filter_missing(test_client: TestClient) -> None:
+    """An unknown tag or package is not found."""
+    assert test_client.get("/gallery/tags/xxx.html").status_code == 404
+    assert test_client.get("/gallery/packages/xxx.html").status_code == 404
+
+
+def test_pyodide_runtime(test_client: TestClient) -> None:
+    """The Pyodide mount caches for good and serves byte ranges."""
+    response = test_client.get("/pyodide/README.md")
+    assert response.status_code == 200
+    assert "immutable" in response.headers["cache-control"]
+    assert response.headers["accept-ranges"] == "bytes"
+    partial = test_client.get("/pyodide/README.md", headers={"Range": "bytes=0-4"})
+    assert partial.status_code == 206
+    assert partial.content == response.content[:5]
+
+    # Other mounts are revalidated as usual
+    response = test_client.get("/static/psc.css")
+    assert "cache-control" not in response.headers
+    assert response.headers["content-type"] == "text/css; charset=utf-8"
@@ -22,3 +22,11 @@ def test_author_page(client_page: PageT) -> None:
     author = soup.select_one("main h1")
     if author:
         assert "Margaret" == author.text.strip()
+
+
+def test_author_examples(client_page: PageT) -> None:
+    """An author page lists the examples they wrote."""
+    soup = client_page("/authors/meg-1.html")
+    links = soup.select("#author_examples a")
+    assert [a.text for a in links] == ["Compound Interest Calculator"]
+    assert links[0].get("href") == "../../gallery/examples/interest_calculator/"
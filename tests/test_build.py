@@ -0,0 +1,241 @@
+"""Render the site to static files, in one pass, redoing only what changed."""
+import json
+from pathlib import Path
+
+import anyio
+import pytest
+
+from psc.app import app
+from psc.build import MANIFEST
+from psc.build import InputHashes
+from psc.build import build_site
+from psc.build import fetch
+from psc.build import get_asset_targets
+from psc.build import get_build_targets
+from psc.fingerprint import fingerprints
+from psc.here import HERE
+from psc.resources import Resources
+
+
+def test_build_targets(resources: Resources) -> None:
+    """Each page is rendered once, including the filtered galleries."""
+    targets = get_build_targets(resources)
+    outputs = [target.output for target in targets]
+    assert len(outputs) == len(set(outputs))
+    urls = {target.output: target.url for target in targets}
+    assert urls["pages/about.html"] == "/pages/about.html"
+    assert urls["gallery/authors/meg-1.html"] == "/authors/meg-1.html"
+    assert "gallery/tags/beginner.html" in outputs
+    assert "gallery/examples/altair/code.html" in outputs
+    examples = [o for o in outputs if o.startswith("gallery/examples/")]
+    assert len(examples) == 2 * len(resources.examples)
+
+
+def test_fetch(resources: Resources) -> None:
+    """Call the app directly, as the build's user agent."""
+    app.state.resources = resources
+    app.state.page_cache = None
+    status, body = anyio.run(fetch, app, "/gallery/examples/hello_world/index.html")
+    assert status == 200
+    assert b"https://pyscript.net/latest/pyscript.js" in body
+    status, _ = anyio.run(fetch, app, "/search?q=hello")
+    assert status == 200
+
+
+def test_fetch_streaming(resources: Resources, monkeypatch: pytest.MonkeyPatch) -> None:
+    """A streamed page comes back whole."""
+    monkeypatch.setattr("psc.settings.STREAM_LINKED_FILES", True)
+    app.state.resources = resources
+    status, body = anyio.run(fetch, app, "/gallery/examples/hello_world/code.html")
+    assert status == 200
+    assert body.rstrip().endswith(b"</html>")
+
+
+@pytest.mark.parametrize("jobs", [1, 2])
+def test_build_site(jobs: int, tmp_path: Path, resources: Resources) -> None:
+    """Every target is written, however many processes render them."""
+    report = build_site(tmp_path, jobs)
+    expected = sorted(t.output for t in get_build_targets(resources))
+    assert report.written == expected
+    index_html = tmp_path / "gallery/examples/hello_world/index.html"
+    assert "Hello World" in index_html.read_text()
+    assert (tmp_path / "search/index.json").read_text().startswith("{")
+
+
+def test_build_target_inputs(resources: Resources) -> None:
+    """Pages depend on their sources and templates, listings on every example."""
+    inputs = {target.output: target.inputs for target in get_build_targets(resources)}
+    about = inputs["pages/about.html"]
+    assert "pages/about.md" in about
+    assert "templates/page.jinja2" in about
+    assert "templates/layout.jinja2" in about
+    hello = inputs["gallery/examples/hello_world/code.html"]
+    assert "gallery/examples/hello_world/index.md" in hello
+    assert "gallery/examples/altair/index.md" not in hello
+    assert "gallery/examples/altair/index.md" in inputs["gallery/index.html"]
+    assert "gallery/examples/altair/index.html" in inputs["gallery/tags/beginner.html"]
+
+
+def edit_manifest(public: Path, output: str, source: str) -> None:
+    """Pretend an input of an output changed since the last build."""
+    manifest_path = public / MANIFEST
+    manifest = json.loads(manifest_path.read_text())
+    manifest["outputs"][output][source] = "changed"
+    manifest_path.write_text(json.dumps(manifest))
+
+
+def test_build_site_incremental(tmp_path: Path) -> None:
+    """A second build only redoes outputs with a changed input."""
+    first = build_site(tmp_path)
+    assert "static/psc.css" in first.copied
+    assert (tmp_path / "static/psc.css").exists()
+
+    second = build_site(tmp_path)
+    assert second.written == second.copied == second.removed == []
+    assert len(second.skipped) == len(first.written) + len(first.copied)
+
+    edit_manifest(tmp_path, "gallery/tags/beginner.html", "templates/gallery.jinja2")
+    edit_manifest(tmp_path, "static/psc.css", "static/psc.css")
+    (tmp_path / "pages/about.html").unlink()
+    third = build_site(tmp_path)
+    assert third.written == ["gallery/tags/beginner.html", "pages/about.html"]
+    assert third.copied == ["static/psc.css"]
+
+
+def test_build_site_removes_stale(tmp_path: Path) -> None:
+    """An output no longer built is removed."""
+    build_site(tmp_path)
+    stale = tmp_path / "gallery/examples/gone/index.html"
+    stale.parent.mkdir()
+    stale.write_text("Gone")
+    manifest_path = tmp_path / MANIFEST
+    manifest = json.loads(manifest_path.read_text())
+    manifest["outputs"]["gallery/examples/gone/index.html"] = {}
+    manifest_path.write_text(json.dumps(manifest))
+
+    report = build_site(tmp_path)
+    assert report.removed == ["gallery/examples/gone/index.html"]
+    assert not stale.exists()
+
+
+def test_build_site_removes_untracked(tmp_path: Path) -> None:
+    """A file the manifest doesn't know of is removed too."""
+    build_site(tmp_path)
+    stale = tmp_path / "gallery/examples/gone/index.html"
+    stale.parent.mkdir()
+    stale.write_text("Gone")
+    (tmp_path / MANIFEST).unlink()
+
+    report = build_site(tmp_path)
+    assert report.removed == ["gallery/examples/gone/index.html"]
+    assert not stale.parent.exists()
+
+
+def test_build_site_packages(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, resources: Resources
+) -> None:
+    """Pyodide packages are left out only when the lockfile covers PyPI's."""
+    repodata = {
+        name: dict(file_name=f"{name}.whl", depends=[])
+        for name in ("micropip", "pandas", "jinja2", "scipy")
+    }
+    monkeypatch.setattr("psc.build.load_repodata", lambda pyodide_dir: repodata)
+    monkeypatch.setattr("psc.build.read_lockfile", lambda: {})
+    report = build_site(tmp_path)
+    assert report.missing == report.unlocked == ["altair", "vega-datasets"]
+    assert report.unused == []
+
+    packages = [dict(name=n) for n in ("altair", "jinja2", "pandas", "vega-datasets")]
+    requested = resources.examples["altair"].packages
+    locked = dict(altair=dict(requested=requested, packages=packages))
+    monkeypatch.setattr("psc.build.read_lockfile", lambda: locked)
+    report = build_site(tmp_path)
+    assert report.missing == ["altair", "vega-datasets"]
+    assert report.unlocked == []
+    assert report.unused == ["pyodide/scipy.whl"]
+
+
+def test_build_site_settings_change(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A setting that changes the output rebuilds everything."""
+    first = build_site(tmp_path)
+    monkeypatch.setattr("psc.settings.STREAM_LINKED_FILES", True)
+    second = build_site(tmp_path)
+    assert second.written == first.written
+    assert second.skipped == []
+
+
+def test_asset_targets() -> None:
+    """Only served files are published, and rendered pages win."""
+    outputs = [t.output for t in get_asset_targets({"pyodide/README.md"})]
+    assert "favicon.png" in outputs
+    assert "static/psc.css" in outputs
+    assert "gallery/examples/altair/screenshot.png" in outputs
+    assert "pyodide/README.md" not in outputs
+    assert "app.py" not in outputs
+    assert "templates/layout.jinja2" not in outputs
+    assert not [o for o in outputs if "__pycache__" in o or "__init__" in o]
+
+
+def test_asset_targets_unused() -> None:
+    """Unused package files are left out, with their sidecars."""
+    unused = ["static/prism.js"]
+    outputs = [t.output for t in get_asset_targets(set(), unused=unused)]
+    assert "static/prism.js" not in outputs
+    assert "static/prism.css" in outputs
+
+
+def test_input_hashes() -> None:
+    """A file the last build saw unchanged is not hashed again."""
+    stat = (HERE / "static/psc.css").stat()
+    same = (stat.st_size, stat.st_mtime_ns, "from-last-build")
+    assert InputHashes(known={"static/psc.css": same})(["static/psc.css"]) == {
+        "static/psc.css": "from-last-build"
+    }
+    grown = (stat.st_size + 1, stat.st_mtime_ns, "from-last-build")
+    hashes = InputHashes(known={"static/psc.css": grown})(["static/psc.css"])
+    assert len(hashes["static/psc.css"]) == 64
+
+
+def test_build_site_link(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Runtime files may be hardlinked, everything else is copied."""
+    linked = []
+
+    def fake_link(source: Path, output: Path) -> None:
+        linked.append(output.relative_to(tmp_path).as_posix())
+        raise OSError("Cross-device link")
+
+    monkeypatch.setattr("psc.build.os.link", fake_link)
+    build_site(tmp_path, link=True)
+    assert "pyodide/README.md" in linked
+    assert "static/psc.css" not in linked
+    # Falls back to copying
+    assert (tmp_path / "pyodide/README.md").exists()
+
+
+def test_build_site_optimize(tmp_path: Path) -> None:
+    """Outputs are minified and compressed, with savings by type."""
+    report = build_site(tmp_path, minify=True, compress=True)
+    html = report.savings[".html"]
+    assert html.minified < html.original
+    assert html.compressed["gzip"] < html.minified
+    index_html = tmp_path / "gallery/examples/hello_world/index.html"
+    assert "\n    " not in index_html.read_text().split("<py-")[0]
+    assert (tmp_path / "gallery/examples/hello_world/index.html.gz").exists()
+    assert not (tmp_path / "favicon.png.gz").exists()
+
+    # Sidecars are outputs, kept while unchanged and removed when not made
+    assert build_site(tmp_path, minify=True, compress=True).removed == []
+    report = build_site(tmp_path)
+    assert "gallery/examples/hello_world/index.html.gz" in report.removed
+    assert report.savings == {}
+
+
+def test_build_site_fingerprints(tmp_path: Path) -> None:
+    """Fingerprinted copies are published next to the originals."""
+    report = build_site(tmp_path)
+    fingerprinted = fingerprints.get_name("static/psc.css")
+    assert fingerprinted in report.copied
+    assert "static/psc.css" in report.copied
+    assert fingerprinted in (tmp_path / "index.html").read_text()
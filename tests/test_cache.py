@@ -0,0 +1,86 @@
+"""Store parsed resources on disk and only use the fresh ones."""
+from pathlib import Path
+
+import pytest
+
+from psc.cache import ResourceCache
+from psc.cache import get_cache_key
+from psc.resources import Author
+from psc.resources import Example
+from psc.resources import Page
+from psc.resources import get_resources
+
+
+@pytest.fixture
+def resource_cache(tmp_path: Path) -> ResourceCache:
+    """An empty cache in a temporary directory."""
+    return ResourceCache(tmp_path / "cache")
+
+
+def test_source_paths() -> None:
+    """Each kind of resource knows the files it was made from."""
+    example_paths = Example.source_paths("hello_world")
+    assert "index.html" in [p.name for p in example_paths]
+    assert "hello_world.css" in [p.name for p in example_paths]
+    assert [p.name for p in Author.source_paths("meg-1")] == ["meg-1.md"]
+    assert [p.name for p in Page.source_paths("contributing")] == ["contributing.html"]
+
+
+def test_cache_key() -> None:
+    """The key is stable, but different for each resource."""
+    key = get_cache_key(Example, "hello_world")
+    assert key == get_cache_key(Example, "hello_world")
+    assert key != get_cache_key(Example, "altair")
+
+
+def test_cache_key_options(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Another parser backend or lazy loading makes another key."""
+    key = get_cache_key(Example, "hello_world")
+    monkeypatch.setattr("psc.settings.PARSER", "lxml")
+    parser_key = get_cache_key(Example, "hello_world")
+    monkeypatch.setattr("psc.settings.LAZY", True)
+    assert len({key, parser_key, get_cache_key(Example, "hello_world")}) == 3
+
+
+def test_cache_miss(resource_cache: ResourceCache) -> None:
+    """Nothing stored yet."""
+    assert resource_cache.get(Example, "hello_world") is None
+
+
+def test_cache_round_trip(resource_cache: ResourceCache) -> None:
+    """A stored resource comes back with all the parsed fields."""
+    this_example = Example(name="hello_world")
+    resource_cache.put(this_example)
+    cached_example = resource_cache.get(Example, "hello_world")
+    assert cached_example == this_example
+    assert resource_cache.get(Author, "hello_world") is None
+
+
+def test_cache_stale(
+    resource_cache: ResourceCache, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """An entry made by a different PSC is not used."""
+    resource_cache.put(Page(name="about"))
+    monkeypatch.setattr("psc.cache.get_psc_fingerprint", lambda: "upgraded")
+    assert resource_cache.get(Page, "about") is None
+
+
+def test_cache_corrupt(resource_cache: ResourceCache) -> None:
+    """A broken entry is treated as missing."""
+    resource_cache.put(Page(name="about"))
+    resource_cache.get_path(Page, "about").write_bytes(b"xxx")
+    assert resource_cache.get(Page, "about") is None
+
+
+def test_get_resources_cached(
+    resource_cache: ResourceCache, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A warm cache gives the same resources without parsing."""
+    resources = get_resources(cache=resource_cache)
+    assert resource_cache.get_path(Example, "altair").exists()
+
+    def no_parse(self: Example) -> None:
+        raise AssertionError("Parsed instead of using the cache")
+
+    monkeypatch.setattr(Example, "__post_init__", no_parse)
+    assert get_resources(cache=resource_cache) == resources
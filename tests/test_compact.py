@@ -0,0 +1,117 @@
+"""Slotted, deduplicated variants of the resource models."""
+import pytest
+from bs4 import BeautifulSoup
+from starlette.testclient import TestClient
+
+from psc.app import app
+from psc.compact import CompactExample
+from psc.compact import CompactResources
+from psc.compact import TextPool
+from psc.compact import compact_linked_file
+from psc.compact import compact_resource
+from psc.compact import compact_resources
+from psc.compact import get_deep_size
+from psc.compact import get_memory_report
+from psc.here import HERE
+from psc.resources import Example
+from psc.resources import LinkedFile
+from psc.resources import Resource
+from psc.resources import Resources
+
+
+def test_text_pool() -> None:
+    """Equal texts come back as the same object."""
+    pool = TextPool()
+    first = pool("".join(["abc", "def"]))
+    second = pool("".join(["abc", "def"]))
+    assert first is second
+
+
+def test_compact_example(resources: Resources) -> None:
+    """The compact variant has the same values, without a ``__dict__``."""
+    this_example = resources.examples["hello_world"]
+    compacted = compact_resource(this_example, TextPool())
+    assert isinstance(compacted, CompactExample)
+    assert not hasattr(compacted, "__dict__")
+    assert compacted.title == this_example.title
+    assert compacted.body == this_example.body
+    assert compacted.linked_files[1].relative_path == "hello_world.css"
+    assert compacted.linked_files[1].body == this_example.linked_files[1].body
+
+
+def test_compact_linked_file_stream() -> None:
+    """A streamed linked file is still read from disk once compacted."""
+    linked_path = HERE / "gallery/examples/hello_world/hello_world.js"
+    linked_file = LinkedFile(path=linked_path, stream=True)
+    compacted = compact_linked_file(linked_file, TextPool())
+    assert compacted.body == ""
+    assert "".join(compacted.iter_chunks(chunk_size=10)) == linked_path.read_text()
+
+
+def test_compact_unknown() -> None:
+    """Only the known resource kinds can be compacted."""
+    with pytest.raises(ValueError) as exc:
+        compact_resource(Resource(name="xxx"), TextPool())
+    assert str(exc.value) == "No compact variant for Resource"
+
+
+def test_compact_resources_shared(resources: Resources) -> None:
+    """Text used by several resources is only stored once."""
+    compacted = compact_resources(resources)
+    assert list(compacted.examples) == list(resources.examples)
+    hello_world = compacted.examples["hello_world"]
+    hello_world_py = compacted.examples["hello_world_py"]
+    assert hello_world.extra_head == hello_world_py.extra_head
+    assert hello_world.extra_head is hello_world_py.extra_head
+    interest_calculator = compacted.examples["interest_calculator"]
+    assert interest_calculator.author is compacted.authors["meg-1"].name
+
+
+def test_compact_replace(resources: Resources) -> None:
+    """A reloaded resource is compacted on the way in."""
+    compacted = compact_resources(resources)
+    compacted.replace(Example(name="altair"))
+    altair: object = compacted.examples["altair"]
+    assert isinstance(altair, CompactExample)
+    assert compacted.version == 1
+
+
+def test_deep_size() -> None:
+    """Shared objects are only counted once."""
+    text = "x" * 1000
+    assert get_deep_size([text, text]) < get_deep_size([text, "y" * 1000])
+
+
+def test_memory_report(resources: Resources) -> None:
+    """The compact models use less memory per example."""
+    report = get_memory_report(resources)
+    assert report["examples"] == len(resources.examples)
+    assert 0 < report["compact"] < report["regular"]
+
+
+def test_compact_app(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The views work the same with compact resources."""
+    monkeypatch.setattr("psc.settings.COMPACT", True)
+    with TestClient(app) as client:
+        assert isinstance(client.app.state.resources, CompactResources)  # type: ignore
+        code = client.get("/gallery/examples/hello_world/code.html")
+        gallery = client.get("/gallery/index.html")
+    assert code.status_code == gallery.status_code == 200
+    soup = BeautifulSoup(code.text, "html5lib")
+    headings = [h2.text for h2 in soup.select("h2")]
+    assert headings == ["index.html", "hello_world.css", "hello_world.js"]
+    soup = BeautifulSoup(gallery.text, "html5lib")
+    assert soup.select_one("p.title a")
+
+
+def test_compact_app_stream(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Compacted and streamed, the code page still shows the sources."""
+    monkeypatch.setattr("psc.settings.COMPACT", True)
+    monkeypatch.setattr("psc.settings.STREAM_LINKED_FILES", True)
+    monkeypatch.setattr("psc.settings.PAGE_CACHE", False)
+    with TestClient(app) as client:
+        response = client.get("/gallery/examples/hello_world/code.html")
+    soup = BeautifulSoup(response.text, "html5lib")
+    codes = [code.text for code in soup.select("pre code")]
+    js_path = HERE / "gallery/examples/hello_world/hello_world.js"
+    assert codes[2] == js_path.read_text()
@@ -0,0 +1,129 @@
+"""Write compressed sidecars and serve them by ``Accept-Encoding``."""
+import gzip
+import os
+from pathlib import Path
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from psc.compression import PrecompressedStaticFiles
+from psc.compression import compress
+from psc.compression import get_accepted_encodings
+from psc.compression import get_available_encodings
+from psc.compression import write_file_sidecars
+from psc.compression import write_sidecars
+
+
+CSS = b"body { color: black; }\n" * 200
+
+
+@pytest.fixture
+def static_dir(tmp_path: Path) -> Path:
+    """A directory with a compressible file, and one that is not."""
+    (tmp_path / "site.css").write_bytes(CSS)
+    (tmp_path / "tiny.txt").write_bytes(b"x")
+    (tmp_path / "logo.png").write_bytes(CSS)
+    return tmp_path
+
+
+@pytest.fixture
+def client(static_dir: Path) -> TestClient:
+    """Serve the directory the way the app mounts do."""
+    write_sidecars(static_dir)
+    static_files = PrecompressedStaticFiles(directory=static_dir)
+    return TestClient(Starlette(routes=[Mount("/static", static_files)]))
+
+
+def test_accepted_encodings() -> None:
+    """Parse the header, dropping anything refused with q=0."""
+    assert get_accepted_encodings("gzip, deflate, br") == {"gzip", "deflate", "br"}
+    assert get_accepted_encodings("br;q=0, GZIP;q=0.5") == {"gzip"}
+    assert get_accepted_encodings("br;q=x") == set()
+    assert get_accepted_encodings("") == {""}
+
+
+def test_compress_deterministic() -> None:
+    """The same input always gives the same bytes."""
+    for encoding in get_available_encodings():
+        assert compress(CSS, encoding) == compress(CSS, encoding)
+    assert gzip.decompress(compress(CSS, "gzip")) == CSS
+
+
+def test_write_sidecars(static_dir: Path) -> None:
+    """Only files that shrink get sidecars, and only once."""
+    report = write_sidecars(static_dir)
+    assert (static_dir / "site.css.gz").exists()
+    assert not (static_dir / "tiny.txt.gz").exists()
+    assert not (static_dir / "logo.png.gz").exists()
+    assert report.written == len(get_available_encodings())
+    assert report.compressed_bytes < report.original_bytes
+    again = write_sidecars(static_dir)
+    assert again.written == 0
+    assert again.skipped == report.written
+
+
+def test_write_file_sidecars(static_dir: Path) -> None:
+    """Given content gets its sidecars, and too little saving removes one."""
+    path = static_dir / "site.css"
+    sizes = write_file_sidecars(path, CSS)
+    assert set(sizes) == set(get_available_encodings())
+    assert gzip.decompress((static_dir / "site.css.gz").read_bytes()) == CSS
+    assert write_file_sidecars(path, b"x") == {}
+    assert not (static_dir / "site.css.gz").exists()
+
+
+def test_serve_gzip(client: TestClient) -> None:
+    """A client accepting gzip gets the gzip sidecar."""
+    response = client.get("/static/site.css", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["content-type"].startswith("text/css")
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == CSS
+
+
+def test_serve_brotli(client: TestClient) -> None:
+    """Brotli is preferred when both are accepted."""
+    pytest.importorskip("brotli")
+    response = client.get(
+        "/static/site.css", headers={"Accept-Encoding": "gzip, br"}, stream=True
+    )
+    assert response.headers["content-encoding"] == "br"
+    raw = response.raw.read(decode_content=False)
+    assert len(raw) < len(CSS)
+
+
+def test_serve_identity(client: TestClient) -> None:
+    """Without an accepted encoding, the file is sent as is."""
+    response = client.get("/static/site.css", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["vary"] == "Accept-Encoding"
+    assert response.content == CSS
+    response = client.get("/static/tiny.txt", headers={"Accept-Encoding": "gzip"})
+    assert "vary" not in response.headers
+
+
+def test_not_modified(client: TestClient) -> None:
+    """Each encoding revalidates with its own ETag."""
+    headers = {"Accept-Encoding": "gzip"}
+    etag = client.get("/static/site.css", headers=headers).headers["etag"]
+    response = client.get(
+        "/static/site.css", headers={**headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    response = client.get(
+        "/static/site.css",
+        headers={"Accept-Encoding": "identity", "If-None-Match": etag},
+    )
+    assert response.status_code == 200
+
+
+def test_stale_sidecar(client: TestClient, static_dir: Path) -> None:
+    """A file changed after compressing is sent uncompressed."""
+    css = static_dir / "site.css"
+    stat = css.stat()
+    os.utime(css, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000_000))
+    response = client.get("/static/site.css", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
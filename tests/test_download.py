@@ -0,0 +1,317 @@
+"""Download into a shared cache, resuming and verifying, then install."""
+import io
+import tarfile
+import threading
+from collections.abc import Iterator
+from hashlib import sha256
+from http.server import SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+import pytest
+from urllib3 import HTTPResponse
+from urllib3 import PoolManager
+from urllib3.exceptions import HTTPError
+
+from psc.download import Artifact
+from psc.download import ChecksumError
+from psc.download import Progress
+from psc.download import StatusError
+from psc.download import extract_stream
+from psc.download import fetch
+from psc.download import fetch_all
+from psc.download import get_artifacts
+from psc.download import get_member_path
+from psc.download import install_pyodide
+
+
+def make_tarball(files: dict[str, bytes]) -> bytes:
+    """A bzip2 tarball with the given members, and a symlink."""
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w:bz2") as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+        link = tarfile.TarInfo("pyodide/link")
+        link.type = tarfile.SYMTYPE
+        link.linkname = "/etc/passwd"
+        tar.addfile(link)
+    return buffer.getvalue()
+
+
+FILES = {
+    "pyodide/pyodide.js": b"// Pyodide\n",
+    "pyodide/repodata.json": b"{}",
+    "pyodide/packages/big.whl": bytes(range(256)) * 1024,
+    "other/README": b"Not Pyodide",
+    "pyodide/../escape.txt": b"Outside",
+}
+TARBALL = make_tarball(FILES)
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """Serve files, answering a ``bytes=N-`` range, and count requests."""
+
+    requests: list[tuple[str, str | None]]
+
+    def log_message(self, *args: Any) -> None:
+        """Keep the test output quiet."""
+
+    def do_GET(self) -> None:  # noqa: N802
+        """Send the file, or the part after a range's start."""
+        range_header = self.headers.get("Range")
+        self.requests.append((self.path, range_header))
+        path = Path(self.translate_path(self.path))
+        if not range_header or not path.is_file():
+            super().do_GET()
+            return
+        data = path.read_bytes()
+        start = int(range_header.removeprefix("bytes=").rstrip("-"))
+        if start >= len(data):
+            self.send_response(416)
+            self.end_headers()
+            return
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(data) - start))
+        self.end_headers()
+        self.wfile.write(data[start:])
+
+
+@pytest.fixture
+def mirror(tmp_path: Path) -> Iterator[tuple[str, Path, list[tuple[str, str | None]]]]:
+    """A mirror on a local HTTP server, its directory, and its requests."""
+    served = tmp_path / "served"
+    pyodide = served / "pyodide/0.21.3"
+    pyodide.mkdir(parents=True)
+    (pyodide / "pyodide-build-0.21.3.tar.bz2").write_bytes(TARBALL)
+    pyscript = served / "pyscript/2022.12.1"
+    pyscript.mkdir(parents=True)
+    (pyscript / "pyscript.js").write_text("// PyScript")
+    (pyscript / "pyscript.js.map").write_text("{}")
+    requests: list[tuple[str, str | None]] = []
+
+    class Handler(RangeHandler):
+        def __init__(self, *args: Any, **kwargs: Any) -> None:
+            self.requests = requests
+            super().__init__(*args, directory=str(served), **kwargs)
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}", served, requests
+    server.shutdown()
+
+
+@pytest.fixture
+def artifacts(
+    mirror: tuple[str, Path, list[tuple[str, str | None]]], tmp_path: Path
+) -> dict[str, Artifact]:
+    """The artifacts from the mirror, cached in a temporary directory."""
+    digest = sha256(TARBALL).hexdigest()
+    return get_artifacts(tmp_path / "cache", mirror[0], "2022.12.1", digest)
+
+
+def test_get_artifacts(tmp_path: Path) -> None:
+    """Each artifact comes from the mirror or upstream, cached by version."""
+    upstream = get_artifacts(tmp_path)
+    assert upstream["pyodide"].url.startswith("https://github.com/pyodide/")
+    assert upstream["pyscript.js"].url == "https://pyscript.net/latest/pyscript.js"
+    assert not upstream["pyscript.js"].reuse
+    pinned = get_artifacts(tmp_path, "http://mirror/", "2022.12.1")
+    assert pinned["pyscript.js.map"].url == (
+        "http://mirror/pyscript/2022.12.1/pyscript.js.map"
+    )
+    assert pinned["pyscript.js"].reuse
+    assert pinned["pyodide"].path == (
+        tmp_path / "pyodide/0.21.3/pyodide-build-0.21.3.tar.bz2"
+    )
+
+
+def test_get_member_path() -> None:
+    """Only members under the stripped directory, and inside it, are kept."""
+    assert str(get_member_path("pyodide/a/b.js", "pyodide")) == "a/b.js"
+    assert get_member_path("pyodide", "pyodide") is None
+    assert get_member_path("other/a.js", "pyodide") is None
+    assert get_member_path("pyodide/../a.js", "pyodide") is None
+    assert get_member_path("/pyodide/a.js", "pyodide") is None
+
+
+def test_progress() -> None:
+    """Show bytes, share of the total and rate."""
+    output = io.StringIO()
+    progress = Progress("pyodide.tar.bz2", total=4_000_000, output=output)
+    progress.update(1_000_000)
+    progress.show()
+    assert "pyodide.tar.bz2: 1.0 MB of 4.0 MB (25%)" in output.getvalue()
+    assert output.getvalue().endswith("MB/s\n")
+
+
+def test_extract_stream(tmp_path: Path) -> None:
+    """Unpack just the Pyodide files, skipping links and escapes."""
+    assert extract_stream(io.BytesIO(TARBALL), tmp_path, "pyodide") == 3
+    assert (tmp_path / "pyodide.js").read_bytes() == b"// Pyodide\n"
+    assert (tmp_path / "packages/big.whl").stat().st_size == 256 * 1024
+    assert not (tmp_path / "link").exists()
+    assert not (tmp_path / "README").exists()
+    assert not (tmp_path.parent / "escape.txt").exists()
+
+
+def test_fetch_cached(
+    artifacts: dict[str, Artifact],
+    mirror: tuple[str, Path, list[tuple[str, str | None]]],
+) -> None:
+    """The first fetch records the checksum, the next reuses the file."""
+    http = PoolManager()
+    artifact = artifacts["pyodide"]
+    path = fetch(http, artifact)
+    assert path.read_bytes() == TARBALL
+    assert artifact.checksum_path.read_text() == sha256(TARBALL).hexdigest()
+    requests = mirror[2]
+    count = len(requests)
+    assert fetch(http, artifact) == path
+    assert len(requests) == count
+
+    # A damaged cache is downloaded again
+    path.write_bytes(b"Damaged")
+    assert fetch(http, artifact).read_bytes() == TARBALL
+    assert len(requests) > count
+
+
+def test_fetch_resume(
+    artifacts: dict[str, Artifact],
+    mirror: tuple[str, Path, list[tuple[str, str | None]]],
+) -> None:
+    """A partial file is finished with a range request."""
+    artifact = artifacts["pyodide"]
+    artifact.path.parent.mkdir(parents=True)
+    artifact.part_path.write_bytes(TARBALL[:100])
+    assert fetch(PoolManager(), artifact).read_bytes() == TARBALL
+    assert mirror[2][-1][1] == "bytes=100-"
+    assert not artifact.part_path.exists()
+
+
+def test_fetch_checksum(
+    artifacts: dict[str, Artifact],
+    mirror: tuple[str, Path, list[tuple[str, str | None]]],
+) -> None:
+    """A published checksum is checked, and a mismatch is an error."""
+    served = mirror[1] / "pyscript/2022.12.1"
+    digest = sha256(b"// PyScript").hexdigest()
+    (served / "pyscript.js.sha256").write_text(f"{digest}  pyscript.js\n")
+    assert fetch(PoolManager(), artifacts["pyscript.js"]).exists()
+
+    (served / "pyscript.js.map.sha256").write_text("0" * 64)
+    with pytest.raises(ChecksumError):
+        fetch(PoolManager(), artifacts["pyscript.js.map"], attempts=2)
+    assert not artifacts["pyscript.js.map"].path.exists()
+
+
+def test_fetch_pinned(
+    mirror: tuple[str, Path, list[tuple[str, str | None]]], tmp_path: Path
+) -> None:
+    """A pinned checksum wins over having none, or a recorded one."""
+    cache_dir = tmp_path / "cache"
+    digest = sha256(TARBALL).hexdigest()
+    artifact = get_artifacts(cache_dir, mirror[0], "2022.12.1", digest)["pyodide"]
+    assert fetch(PoolManager(), artifact).read_bytes() == TARBALL
+
+    wrong = get_artifacts(cache_dir, mirror[0], "2022.12.1", "0" * 64)["pyodide"]
+    with pytest.raises(ChecksumError):
+        fetch(PoolManager(), wrong, attempts=1)
+    assert not wrong.part_path.exists()
+
+
+def test_fetch_checksum_retried(
+    artifacts: dict[str, Artifact],
+    mirror: tuple[str, Path, list[tuple[str, str | None]]],
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    """Failing to get the published checksum is retried like the file."""
+    calls = []
+
+    def flaky(http: PoolManager, url: str) -> str | None:
+        calls.append(url)
+        if len(calls) == 1:
+            raise HTTPError("Connection reset")
+        return None
+
+    monkeypatch.setattr("psc.download.fetch_checksum", flaky)
+    assert fetch(PoolManager(), artifacts["pyscript.js"]).exists()
+    assert len(calls) == 2
+
+
+def test_fetch_not_reused_restarts(
+    mirror: tuple[str, Path, list[tuple[str, str | None]]], tmp_path: Path
+) -> None:
+    """A file fetched every time doesn't resume an old partial file."""
+    artifact = get_artifacts(tmp_path / "cache", mirror[0], "latest")["pyscript.js"]
+    assert not artifact.reuse
+    artifact.path.parent.mkdir(parents=True)
+    artifact.part_path.write_text("// Older PyScript, longer than the new one")
+    (mirror[1] / "pyscript/latest").mkdir()
+    (mirror[1] / "pyscript/latest/pyscript.js").write_text("// PyScript")
+    assert fetch(PoolManager(), artifact).read_text() == "// PyScript"
+    assert mirror[2][-1][1] is None
+
+
+def test_fetch_unpinned(
+    mirror: tuple[str, Path, list[tuple[str, str | None]]], tmp_path: Path
+) -> None:
+    """Pyodide without a pinned checksum is refused, unless allowed."""
+    cache_dir = tmp_path / "cache"
+    artifact = get_artifacts(cache_dir, mirror[0], "2022.12.1")["pyodide"]
+    with pytest.raises(ChecksumError, match="No SHA-256 pinned"):
+        fetch(PoolManager(), artifact)
+    assert mirror[2] == []
+
+    allowed = get_artifacts(cache_dir, mirror[0], "2022.12.1", allow_unverified=True)
+    assert fetch(PoolManager(), allowed["pyodide"]).read_bytes() == TARBALL
+
+
+def test_fetch_server_error_retried(
+    artifacts: dict[str, Artifact], monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """A server error is retried, like a dropped connection."""
+    http = PoolManager()
+    request = http.request
+    statuses: list[int] = []
+
+    def flaky(method: str, url: str, **kwargs: Any) -> Any:
+        if statuses:
+            response = request(method, url, **kwargs)
+        else:
+            response = HTTPResponse(status=503, preload_content=False)
+        statuses.append(response.status)
+        return response
+
+    monkeypatch.setattr(http, "request", flaky)
+    assert fetch(http, artifacts["pyodide"]).read_bytes() == TARBALL
+    assert statuses == [503, 200]
+
+
+def test_fetch_missing(tmp_path: Path, mirror: tuple[str, Path, Any]) -> None:
+    """A file the server doesn't have is an error, once retried."""
+    artifact = Artifact(f"{mirror[0]}/nothing.js", tmp_path / "nothing.js")
+    with pytest.raises(StatusError, match="404"):
+        fetch(PoolManager(), artifact, attempts=2)
+    assert [path for path, _ in mirror[2]].count("/nothing.js") == 2
+
+
+def test_fetch_all_and_install(artifacts: dict[str, Artifact], tmp_path: Path) -> None:
+    """Fetch everything side by side, then unpack Pyodide into place."""
+    paths = fetch_all(PoolManager(), artifacts)
+    assert sorted(paths) == ["pyodide", "pyscript.js", "pyscript.js.map"]
+    assert paths["pyscript.js"].read_text() == "// PyScript"
+
+    target = tmp_path / "pyodide"
+    (target / "packages").mkdir(parents=True)
+    (target / "packages/big.whl").write_bytes(b"Old")
+    assert install_pyodide(paths["pyodide"], target) == 3
+    assert (target / "packages/big.whl").stat().st_size == 256 * 1024
+    assert not list(tmp_path.glob("tmp*"))
+
+    dry_target = tmp_path / "dry"
+    assert install_pyodide(paths["pyodide"], dry_target, dry_run=True) == 3
+    assert not dry_target.exists()
@@ -0,0 +1,123 @@
+"""Content-hashed asset names, in templates, examples and the app."""
+import os
+from pathlib import Path
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from psc.fingerprint import FingerprintedStaticFiles
+from psc.fingerprint import Fingerprints
+from psc.fingerprint import add_digest
+from psc.fingerprint import asset
+from psc.fingerprint import fingerprint_references
+from psc.fingerprint import fingerprints
+from psc.fingerprint import is_asset
+from psc.runtime import IMMUTABLE
+
+
+@pytest.fixture
+def site(tmp_path: Path) -> Fingerprints:
+    """A directory with one stylesheet."""
+    (tmp_path / "css").mkdir()
+    (tmp_path / "css/site.css").write_text("body { color: black; }")
+    return Fingerprints(tmp_path)
+
+
+def test_add_digest() -> None:
+    """The digest goes before the last suffix."""
+    assert add_digest("static/bulma.min.css", "0123456789") == (
+        "static/bulma.min.0123456789.css"
+    )
+
+
+def test_is_asset() -> None:
+    """Static and example files are assets, example pages are not."""
+    assert is_asset("favicon.png")
+    assert is_asset("static/psc.css")
+    assert is_asset("gallery/examples/hello_world/hello_world.css")
+    assert not is_asset("gallery/examples/hello_world/index.html")
+    assert not is_asset("static/psc.css.gz")
+    assert not is_asset("templates/layout.jinja2")
+
+
+def test_fingerprints(site: Fingerprints) -> None:
+    """Names follow the content, and only a current name resolves."""
+    name = site.get_name("css/site.css")
+    assert name.startswith("css/site.") and name.endswith(".css")
+    assert site.resolve(name) == "css/site.css"
+    assert site.get_name("css/missing.css") == "css/missing.css"
+    assert site.resolve("css/site.css") is None
+    assert site.resolve("../css/site.0123456789.css") is None
+
+    generation = Fingerprints.generation
+    path = site.root / "css/site.css"
+    path.write_text("body { color: white; }")
+    os.utime(path, ns=(1, 1))
+    changed = site.get_name("css/site.css")
+    assert changed != name
+    assert Fingerprints.generation == generation + 1
+    # The name before the change still resolves, but isn't current
+    assert site.resolve(name) == "css/site.css"
+    assert not site.is_current(name, "css/site.css")
+    assert site.is_current(changed, "css/site.css")
+
+    path.write_text("body { color: red; }")
+    os.utime(path, ns=(2, 2))
+    assert site.resolve(name) is None
+
+
+def test_asset(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Templates get fingerprinted names, unless turned off."""
+    assert asset("static/psc.css") == fingerprints.get_name("static/psc.css")
+    assert asset("static/psc.css") != "static/psc.css"
+    monkeypatch.setattr("psc.settings.FINGERPRINT_ASSETS", False)
+    assert asset("static/psc.css") == "static/psc.css"
+
+
+def test_fingerprint_references() -> None:
+    """Only names of the example's own assets are rewritten."""
+    directory = "gallery/examples/hello_world"
+    html = (
+        '<link href="hello_world.css"><script src="hello_world.js"></script>'
+        '<a href="index.html">Home</a><py-config src="../py_config.toml">'
+    )
+    rewritten = fingerprint_references(html, directory)
+    css = fingerprints.get_name(f"{directory}/hello_world.css").split("/")[-1]
+    assert 'href="' + css + '"' in rewritten
+    assert 'src="hello_world.js"' not in rewritten
+    assert 'href="index.html"' in rewritten
+    assert 'src="../py_config.toml"' in rewritten
+
+
+def test_fingerprinted_static_files(site: Fingerprints) -> None:
+    """A current fingerprinted name is served for good, an old one is not."""
+    static_files = FingerprintedStaticFiles(directory=site.root)
+    client = TestClient(Starlette(routes=[Mount("/static", static_files)]))
+    name = site.get_name("css/site.css")
+    response = client.get(f"/static/{name}")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == IMMUTABLE
+    assert response.text == "body { color: black; }"
+
+    response = client.get("/static/css/site.css")
+    assert response.status_code == 200
+    assert "cache-control" not in response.headers
+    assert client.get("/static/css/site.0123456789.css").status_code == 404
+
+    path = site.root / "css/site.css"
+    path.write_text("body { color: white; }")
+    os.utime(path, ns=(1, 1))
+    response = client.get(f"/static/{name}")
+    assert response.status_code == 200
+    assert "cache-control" not in response.headers
+    assert response.text == "body { color: white; }"
+
+
+def test_favicon(test_client: TestClient) -> None:
+    """The favicon has a fingerprinted route too."""
+    response = test_client.get(f"/{asset('favicon.png')}")
+    assert response.status_code == 200
+    assert response.headers["cache-control"] == IMMUTABLE
+    assert test_client.get("/favicon.0123456789.png").status_code == 404
@@ -1,5 +1,6 @@
 """Ensure the test fixtures work as expected."""
 import builtins
+from pathlib import Path
 from typing import cast
 
 import pytest
@@ -114,6 +115,22 @@ def test_route_handler_fake_good_path() -> None:
             assert dummy_route.body == body
 
 
+def test_route_handler_wasm(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """Serve WebAssembly with its type, whatever the platform tables say."""
+    monkeypatch.setattr("psc.fixtures.HERE", tmp_path)
+    monkeypatch.setattr("psc.media_types.guess_type", lambda path: (None, None))
+    (tmp_path / "pyodide").mkdir()
+    (tmp_path / "pyodide/pyodide.asm.wasm").write_bytes(b"\0asm")
+    dummy_request = DummyRequest(url="https://fake/pyodide/pyodide.asm.wasm")
+    dummy_route = DummyRoute(request=dummy_request)
+    route_handler(
+        cast(Page, DummyPage(request=dummy_request)),
+        cast(Route, dummy_route),
+    )
+    assert dummy_route.status == "200"
+    assert dummy_route.headers == {"Content-Type": "application/wasm"}
+
+
 def test_route_handler_non_fake() -> None:
     """Not fake thus not interceptor, but simulating network request."""
     dummy_request = DummyRequest(url="https://good/static/bulma.min.css")
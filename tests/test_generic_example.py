@@ -1,7 +1,13 @@
 """Test machinery common to all gallery examples."""
+import re
+
+import pytest
+from bs4 import BeautifulSoup
 from starlette.testclient import TestClient
 
+from psc.app import app
 from psc.fixtures import PageT
+from psc.here import HERE
 
 
 def test_hello_world(client_page: PageT) -> None:
@@ -18,8 +24,8 @@ def test_hello_world(client_page: PageT) -> None:
         == "The classic hello world, but in Python -- in a browser!"
     )
 
-    # See if extra_head got filled, then resolve those
-    assert soup.find_all("link", href="hello_world.css")
+    # See if extra_head got filled, with fingerprinted asset names
+    assert soup.find_all("link", href=re.compile(r"^hello_world\.[0-9a-f]{10}\.css$"))
 
     # Ensure the ``<main>`` got filled
     assert soup.select_one("main")
@@ -56,3 +62,31 @@ def test_hello_world_code(client_page: PageT) -> None:
     # Back to code button
     button = soup.select_one("a.is-pulled-right")
     assert button and "Back to Demo" == button.text
+
+
+def test_hello_world_code_streamed(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Streaming the linked files gives the same code page."""
+    with TestClient(app) as client:
+        expected = client.get("/gallery/examples/hello_world/code.html").text
+
+    monkeypatch.setattr("psc.settings.STREAM_LINKED_FILES", True)
+    monkeypatch.setattr("psc.settings.CACHE_ENABLED", False)
+    with TestClient(app) as client:
+        hello_world = client.app.state.resources.examples["hello_world"]  # type: ignore
+        assert hello_world.linked_files[1].body == ""
+        response = client.get("/gallery/examples/hello_world/code.html")
+        assert response.status_code == 200
+        assert response.text == expected
+
+
+def test_hello_world_code_max_size(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Large linked files get a link to the raw file instead."""
+    css_size = (HERE / "gallery/examples/hello_world/hello_world.css").stat().st_size
+    monkeypatch.setattr("psc.settings.LINKED_FILE_MAX_SIZE", css_size - 1)
+    with TestClient(app) as client:
+        response = client.get("/gallery/examples/hello_world/code.html")
+    assert response.status_code == 200
+    soup = BeautifulSoup(response.text, "html5lib")
+    raw_links = [a.get("href") for a in soup.select("p.too-large a")]
+    assert "./hello_world.css" in raw_links
+    assert "./hello_world.js" not in raw_links
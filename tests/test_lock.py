@@ -0,0 +1,159 @@
+"""Pin example packages to exact wheels, and render them."""
+import json
+import threading
+from collections.abc import Iterator
+from functools import partial
+from http.server import SimpleHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+from pathlib import Path
+from typing import Any
+
+import pytest
+from urllib3 import PoolManager
+
+from psc.lock import CDN_BASE
+from psc.lock import LOCAL_BASE
+from psc.lock import LockedPackage
+from psc.lock import format_packages
+from psc.lock import get_locked_names
+from psc.lock import get_pinned_urls
+from psc.lock import get_repodata
+from psc.lock import get_requirements
+from psc.lock import lock_packages
+from psc.lock import read_lockfile
+from psc.lock import write_lockfile
+
+
+def package(file_name: str, depends: list[str]) -> dict[str, Any]:
+    """A repodata entry."""
+    return dict(file_name=file_name, version="1.0", depends=depends)
+
+
+REPODATA = {
+    "micropip": package("micropip.whl", ["packaging"]),
+    "packaging": package("packaging.whl", []),
+    "pandas": package("pandas.whl", ["numpy"]),
+    "numpy": package("numpy.whl", []),
+}
+PYPI_JSON: dict[str, Any] = {
+    "info": {
+        "version": "0.9.0",
+        "requires_dist": [
+            "pandas (>=0.19.2)",
+            "Toolz",
+            "pytest ; extra == 'dev'",
+            'pywin32 ; sys_platform == "win32"',
+        ],
+    },
+    "urls": [
+        {"filename": "vega_datasets-0.9.0.tar.gz", "url": "sdist"},
+        {
+            "filename": "vega_datasets-0.9.0-py3-none-any.whl",
+            "url": "https://files/vega_datasets-0.9.0-py3-none-any.whl",
+        },
+    ],
+}
+TOOLZ_JSON: dict[str, Any] = {
+    "info": {"version": "0.12.0", "requires_dist": None},
+    "urls": [{"filename": "toolz-0.12.0-py3-none-any.whl", "url": "https://toolz"}],
+}
+
+
+@pytest.fixture
+def index_url(tmp_path: Path) -> Iterator[str]:
+    """A local PyPI, serving the JSON API for two projects."""
+    served = tmp_path / "served"
+    for name, metadata in (("vega-datasets", PYPI_JSON), ("toolz", TOOLZ_JSON)):
+        project = served / "pypi" / name
+        project.mkdir(parents=True)
+        (project / "json").write_text(json.dumps(metadata))
+    handler = partial(SimpleHTTPRequestHandler, directory=str(served))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+def test_lock_packages(index_url: str) -> None:
+    """Pyodide packages pin to both runtimes, others to PyPI wheels."""
+    locked = lock_packages(
+        ["pandas", "vega_datasets"], REPODATA, PoolManager(), index_url
+    )
+    assert [p.name for p in locked] == ["numpy", "pandas", "toolz", "vega-datasets"]
+    numpy = locked[0]
+    assert numpy.urls == dict(
+        cdn=f"{CDN_BASE}/numpy.whl", local=f"{LOCAL_BASE}/numpy.whl"
+    )
+    vega = locked[3]
+    assert vega.version == "0.9.0"
+    assert vega.urls["cdn"] == vega.urls["local"] == PYPI_JSON["urls"][1]["url"]
+
+
+def test_lock_packages_pypi_dependencies(index_url: str) -> None:
+    """What a PyPI package requires in Pyodide is pinned too, from either."""
+    locked = lock_packages(["vega_datasets"], REPODATA, PoolManager(), index_url)
+    assert [p.name for p in locked] == ["numpy", "pandas", "toolz", "vega-datasets"]
+    assert locked[2].urls["local"] == "https://toolz"
+
+
+def test_get_requirements() -> None:
+    """Requirements for extras or other platforms are left out."""
+    assert get_requirements(PYPI_JSON["info"]["requires_dist"]) == ["pandas", "toolz"]
+    assert get_requirements(['typing_extensions ; python_version < "3.11"']) == [
+        "typing-extensions"
+    ]
+    assert get_requirements(None) == []
+
+
+def test_lock_packages_unknown(index_url: str) -> None:
+    """A package on neither is an error."""
+    with pytest.raises(LookupError, match="nothing"):
+        lock_packages(["nothing"], REPODATA, PoolManager(), index_url)
+
+
+def test_get_repodata(tmp_path: Path) -> None:
+    """The local distribution's repodata comes first."""
+    (tmp_path / "repodata.json").write_text(json.dumps({"packages": REPODATA}))
+    assert get_repodata(PoolManager(), tmp_path) == REPODATA
+
+
+def test_pinned_urls(tmp_path: Path) -> None:
+    """Pinned URLs for a mode, unless the lock is out of date."""
+    lockfile = tmp_path / "packages.lock.json"
+    assert read_lockfile(lockfile) == {}
+    urls = dict(cdn="https://cdn/numpy.whl", local="../numpy.whl")
+    numpy = LockedPackage("numpy", "1.0", urls)
+    write_lockfile(dict(altair=(["Pandas"], [numpy])), lockfile)
+    locked = read_lockfile(lockfile)
+    assert get_pinned_urls("altair", ["pandas"], "cdn", locked) == [urls["cdn"]]
+    assert get_pinned_urls("altair", ["pandas"], "local", locked) == [urls["local"]]
+    assert get_pinned_urls("altair", ["pandas", "numpy"], "cdn", locked) is None
+    assert get_pinned_urls("hello_world", [], "cdn", locked) is None
+
+
+def test_locked_names(tmp_path: Path) -> None:
+    """The names pinned for examples whose lock is current."""
+    lockfile = tmp_path / "packages.lock.json"
+    numpy = LockedPackage("numpy", "1.0", dict(cdn="numpy.whl", local="numpy.whl"))
+    write_lockfile(dict(altair=(["pandas"], [numpy])), lockfile)
+    locked = read_lockfile(lockfile)
+    assert get_locked_names(dict(altair=["Pandas"]), locked) == ["numpy"]
+    assert get_locked_names(dict(altair=["pandas", "numpy"]), locked) == []
+    assert get_locked_names(dict(hello_world=[]), locked) == []
+
+
+def test_read_lockfile_other_pyodide(tmp_path: Path) -> None:
+    """A lock made for another Pyodide release is ignored."""
+    lockfile = tmp_path / "packages.lock.json"
+    write_lockfile({}, lockfile)
+    data = json.loads(lockfile.read_text())
+    lockfile.write_text(json.dumps({**data, "pyodide": "0.1.0"}))
+    assert read_lockfile(lockfile) == {}
+
+
+def test_format_packages() -> None:
+    """A TOML packages list, one URL per line."""
+    assert format_packages(["a.whl", "b.whl"]) == (
+        '\npackages = [\n    "a.whl",\n    "b.whl",\n]\n'
+    )
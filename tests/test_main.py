@@ -1,4 +1,6 @@
 """Test cases for the __main__ module."""
+from pathlib import Path
+
 from typer.testing import CliRunner
 
 from psc.__main__ import app
@@ -23,8 +25,46 @@ def test_build() -> None:
     assert "Building to the public directory" in result.stdout
 
 
+def test_build_verbose() -> None:
+    """List the files the build changed."""
+    runner.invoke(app, ["build"])
+    result = runner.invoke(app, ["build", "--verbose"])
+    assert result.exit_code == 0
+    assert "Rendered gallery/index.html" not in result.stdout
+    result = runner.invoke(app, ["build", "--verbose", "--clean"])
+    assert "Rendered gallery/index.html" in result.stdout
+    assert "Copied static/psc.css" in result.stdout
+
+
 def test_start() -> None:
     """Ensure the examples home page works as expected."""
     result = runner.invoke(app, ["start", "--dry-run"])
     assert result.exit_code == 0
     assert "Skipping server startup" in result.stdout
+    assert "debug mode, 1 worker(s) on http://127.0.0.1:3000" in result.stdout
+
+
+def test_start_production() -> None:
+    """Production options are checked, without starting the server."""
+    args = ["start", "--dry-run", "--production", "--workers", "4", "--port", "8000"]
+    result = runner.invoke(app, args)
+    assert result.exit_code == 0
+    assert "production mode, 4 worker(s) on http://127.0.0.1:8000" in result.stdout
+    result = runner.invoke(app, ["start", "--dry-run", "--workers", "0"])
+    assert result.exit_code != 0
+
+
+def test_memory() -> None:
+    """Report the bytes per example."""
+    result = runner.invoke(app, ["memory"])
+    assert result.exit_code == 0
+    assert "Compact:" in result.stdout
+
+
+def test_snapshot(tmp_path: Path) -> None:
+    """Write the resources snapshot to a given file."""
+    target = tmp_path / "resources.snapshot"
+    result = runner.invoke(app, ["snapshot", "--output", str(target)])
+    assert result.exit_code == 0
+    assert f"bytes to {target}" in result.stdout
+    assert target.exists()
@@ -0,0 +1,95 @@
+"""Count and time requests, exposed at /metrics."""
+from collections.abc import Iterator
+
+import pytest
+from starlette.testclient import TestClient
+
+from psc import metrics as metrics_module
+from psc.app import app
+from psc.metrics import Counter
+from psc.metrics import Histogram
+from psc.metrics import Metrics
+
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch) -> Iterator[TestClient]:
+    """A client with metrics on, recorded afresh, and pages cached."""
+    monkeypatch.setattr("psc.settings.METRICS", True)
+    monkeypatch.setattr("psc.settings.PAGE_CACHE", True)
+    monkeypatch.setattr(metrics_module, "metrics", Metrics())
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_counter_expose() -> None:
+    """Each set of label values is a sample, escaped."""
+    counter = Counter("hits_total", "Hits.", ("path",))
+    counter.inc('/a"b')
+    counter.inc('/a"b', amount=2)
+    assert list(counter.expose()) == [
+        "# HELP hits_total Hits.",
+        "# TYPE hits_total counter",
+        'hits_total{path="/a\\"b"} 3',
+    ]
+
+
+def test_histogram_expose() -> None:
+    """Buckets are cumulative, with a sum and a count."""
+    histogram = Histogram("size_bytes", "Sizes.", buckets=(10.0, 100.0))
+    histogram.observe(5)
+    histogram.observe(50)
+    histogram.observe(500)
+    lines = list(histogram.expose())
+    assert lines[2:] == [
+        'size_bytes_bucket{le="10"} 1',
+        'size_bytes_bucket{le="100"} 2',
+        'size_bytes_bucket{le="+Inf"} 3',
+        "size_bytes_sum 555",
+        "size_bytes_count 3",
+    ]
+
+
+def test_metrics_off() -> None:
+    """Without the setting there is no endpoint and nothing is recorded."""
+    with TestClient(app) as client:
+        assert client.get("/metrics").status_code == 404
+        client.get("/gallery/index.html")
+    assert not metrics_module.metrics.requests.values
+
+
+def test_metrics_requests(client: TestClient) -> None:
+    """Requests are counted under their route, not their URL."""
+    client.get("/gallery/examples/hello_world/index.html")
+    client.get("/gallery/examples/hello_world/index.html")
+    client.get("/nothing/here")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    text = response.text
+    route = 'route="/gallery/examples/{example_name}/index.html"'
+    assert "psc_requests_total{" + route + ',method="GET",status="200"} 2' in text
+    assert 'psc_requests_total{route="unmatched",method="GET",status="404"} 1' in text
+    assert "psc_request_duration_seconds_count{" + route + "} 2" in text
+    assert "psc_response_size_bytes_count{" + route + "} 2" in text
+
+
+def test_metrics_templates(client: TestClient) -> None:
+    """Rendering is timed by template, once per page cache miss."""
+    client.get("/gallery/index.html")
+    client.get("/gallery/index.html")
+    text = client.get("/metrics").text
+    assert 'psc_template_render_seconds_count{template="gallery.jinja2"} 1' in text
+
+
+def test_metrics_static(client: TestClient) -> None:
+    """Bytes from static files are added up by mount."""
+    size = len(client.get("/static/psc.css").content)
+    text = client.get("/metrics").text
+    assert f'psc_static_bytes_total{{mount="/static"}} {size}' in text
+    assert 'psc_response_size_bytes_bucket{route="/static",le="256"}' in text
+
+
+def test_metrics_resources_load(client: TestClient) -> None:
+    """Loading the resources at startup is timed."""
+    text = client.get("/metrics").text
+    assert "# TYPE psc_resources_load_seconds gauge" in text
@@ -0,0 +1,75 @@
+"""Shrink HTML, CSS and JavaScript without changing what they do."""
+from psc.minify import minify
+from psc.minify import minify_css
+from psc.minify import minify_html
+from psc.minify import minify_js
+
+
+def test_minify_html() -> None:
+    """Indentation and comments go, significant whitespace stays."""
+    html = """
+<html>
+    <body>
+        <!-- A comment -->
+        <!--[if IE]><p>Old</p><![endif]-->
+        <p><b>Hello</b> <i>World</i></p>
+    </body>
+</html>
+"""
+    assert minify_html(html) == (
+        "<html>\n<body>\n<!--[if IE]><p>Old</p><![endif]-->\n"
+        "<p><b>Hello</b> <i>World</i></p>\n</body>\n</html>\n"
+    )
+
+
+def test_minify_html_preserved() -> None:
+    """Python and preformatted text keep their indentation."""
+    html = """<div>
+    <py-script>
+def hello():
+    print("Hello")
+    </py-script>
+    <pre>
+  keep
+    </pre>
+</div>"""
+    minified = minify_html(html)
+    assert '\ndef hello():\n    print("Hello")\n    </py-script>' in minified
+    assert "<pre>\n  keep\n    </pre>" in minified
+    assert minified.startswith("<div>\n<py-script>")
+
+
+def test_minify_css() -> None:
+    """Comments and the spaces around punctuation go."""
+    css = "/* Site */\nbody {\n    color: black;\n    margin: 0 auto;\n}\na, b { }\n"
+    assert minify_css(css) == "body{color: black;margin: 0 auto}a,b{}"
+
+
+def test_minify_css_strings() -> None:
+    """Strings and ``url()`` values keep their whitespace, even comments."""
+    css = (
+        'a::before {\n    content: "a  ;  }  /* b */";\n}\n'
+        "b { background: url(x  y.png) ; font-family: 'A  B', serif; }\n"
+        'c { content: "\\"  "; /* gone */ }\n'
+    )
+    assert minify_css(css) == (
+        'a::before{content: "a  ;  }  /* b */"}'
+        "b{background: url(x  y.png);font-family: 'A  B',serif}"
+        'c{content: "\\"  "}'
+    )
+
+
+def test_minify_js() -> None:
+    """Lines stay separate, but lose indentation and comments."""
+    js = "// Greet\nfunction hello() {\n    return 'Hello'\n}\n\n"
+    assert minify_js(js) == "function hello() {\nreturn 'Hello'\n}\n"
+    template = "const a = `\n    indented\n`\n"
+    assert minify_js(template) == template
+
+
+def test_minify() -> None:
+    """Choose by suffix, leaving minified and unknown files alone."""
+    assert minify("site.css", "a { }") == "a{}"
+    assert minify("bulma.min.css", "a { }") == "a { }"
+    assert minify("main.py", "    x = 1\n") == "    x = 1\n"
+    assert minify("README", "  text") == "  text"
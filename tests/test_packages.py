@@ -0,0 +1,93 @@
+"""Resolve the Pyodide packages the examples need."""
+import json
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from psc.packages import canonicalize
+from psc.packages import get_unused_files
+from psc.packages import load_repodata
+from psc.packages import resolve_packages
+
+
+REPODATA: dict[str, Any] = {
+    "info": {"version": "0.21.3"},
+    "packages": {
+        "micropip": {"file_name": "micropip.whl", "depends": ["packaging"]},
+        "packaging": {"file_name": "packaging.whl", "depends": ["pyparsing"]},
+        "pyparsing": {"file_name": "pyparsing.whl", "depends": []},
+        "pandas": {"file_name": "pandas.whl", "depends": ["numpy", "python-dateutil"]},
+        "numpy": {"file_name": "numpy.whl", "depends": []},
+        "python-dateutil": {"file_name": "dateutil.whl", "depends": ["six"]},
+        "six": {"file_name": "six.whl", "depends": []},
+        "scipy": {"file_name": "scipy.whl", "depends": ["numpy"]},
+    },
+}
+
+
+@pytest.fixture
+def pyodide_dir(tmp_path: Path) -> Path:
+    """A Pyodide distribution with its repodata."""
+    (tmp_path / "repodata.json").write_text(json.dumps(REPODATA))
+    return tmp_path
+
+
+def test_canonicalize() -> None:
+    """Versions and extras go, and names are normalized."""
+    assert canonicalize("Python_Dateutil") == "python-dateutil"
+    assert canonicalize("pandas==1.4.2") == "pandas"
+    assert canonicalize("altair[all] >= 4") == "altair"
+
+
+def test_load_repodata(pyodide_dir: Path, tmp_path: Path) -> None:
+    """Read the packages, or None without a distribution."""
+    repodata = load_repodata(pyodide_dir)
+    assert repodata and "pandas" in repodata
+    assert load_repodata(tmp_path / "missing") is None
+
+
+def test_resolve_packages() -> None:
+    """Dependencies are followed, and unknown packages reported."""
+    resolution = resolve_packages(["Pandas", "vega_datasets"], REPODATA["packages"])
+    assert resolution.packages == [
+        "micropip",
+        "numpy",
+        "packaging",
+        "pandas",
+        "pyparsing",
+        "python-dateutil",
+        "six",
+    ]
+    assert resolution.missing == ["vega-datasets"]
+
+
+def test_resolve_packages_locked() -> None:
+    """Locked names are needed, and cover the missing packages among them."""
+    repodata = REPODATA["packages"]
+    locked = ["vega-datasets", "six"]
+    resolution = resolve_packages(["vega_datasets", "altair"], repodata, locked)
+    assert "six" in resolution.packages
+    assert resolution.missing == ["altair", "vega-datasets"]
+    assert resolution.unlocked == ["altair"]
+
+
+def test_unused_files() -> None:
+    """Only the files of packages nothing needs are unused."""
+    repodata = REPODATA["packages"]
+    resolution = resolve_packages(["numpy"], repodata)
+    assert get_unused_files(repodata, resolution) == {
+        "pandas.whl",
+        "dateutil.whl",
+        "six.whl",
+        "scipy.whl",
+    }
+
+
+def test_unused_files_unlocked() -> None:
+    """A PyPI package with unknown dependencies may need any package."""
+    repodata = REPODATA["packages"]
+    resolution = resolve_packages(["numpy", "altair"], repodata)
+    assert get_unused_files(repodata, resolution) == set()
+    locked = resolve_packages(["numpy", "altair"], repodata, ["altair"])
+    assert "scipy.whl" in get_unused_files(repodata, locked)
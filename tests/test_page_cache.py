@@ -0,0 +1,172 @@
+"""Serve rendered pages from the cache, with validators and 304s."""
+from collections.abc import Iterator
+from pathlib import Path
+from shutil import copytree
+
+import pytest
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from psc.app import app
+from psc.app import configure_app
+from psc.fingerprint import FingerprintedStaticFiles
+from psc.fingerprint import Fingerprints
+from psc.fingerprint import asset
+from psc.here import HERE
+from psc.page_cache import CachedPage
+from psc.page_cache import PageCache
+from psc.resources import Example
+
+
+@pytest.fixture
+def client(monkeypatch: pytest.MonkeyPatch) -> Iterator[TestClient]:
+    """A client whose app has a fresh page cache."""
+    monkeypatch.setattr("psc.settings.PAGE_CACHE", True)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def test_page_cache_lru() -> None:
+    """The least recently used page goes first."""
+    page_cache = PageCache(max_entries=2)
+    page = CachedPage(b"", None, '"x"', None)  # type: ignore
+    page_cache.put("a", 0, page)
+    page_cache.put("b", 0, page)
+    assert page_cache.get("a", 0) is page
+    page_cache.put("c", 0, page)
+    assert list(page_cache.pages) == ["a", "c"]
+
+
+def test_page_cache_version() -> None:
+    """A new version empties the cache, an old one is not stored."""
+    page_cache = PageCache()
+    page = CachedPage(b"", None, '"x"', None)  # type: ignore
+    page_cache.put("a", 0, page)
+    assert page_cache.get("a", 1) is None
+    assert page_cache.pages == {}
+    page_cache.put("a", 0, page)
+    assert page_cache.pages == {}
+
+
+def test_validators(client: TestClient) -> None:
+    """Cached pages have a strong ETag and a Last-Modified."""
+    response = client.get("/gallery/index.html")
+    assert response.status_code == 200
+    etag = response.headers["etag"]
+    assert etag.startswith('"') and not etag.startswith("W/")
+    assert response.headers["last-modified"].endswith("GMT")
+    again = client.get("/gallery/index.html")
+    assert again.headers["etag"] == etag
+    assert again.text == response.text
+
+
+def test_if_none_match(client: TestClient) -> None:
+    """A matching ETag gets a 304 without a body."""
+    etag = client.get("/pages/about.html").headers["etag"]
+    response = client.get("/pages/about.html", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["etag"] == etag
+    response = client.head("/pages/about.html", headers={"If-None-Match": f"W/{etag}"})
+    assert response.status_code == 304
+    response = client.get("/pages/about.html", headers={"If-None-Match": '"other"'})
+    assert response.status_code == 200
+
+
+def test_if_modified_since(client: TestClient) -> None:
+    """A copy from after the page was rendered is still current."""
+    last_modified = client.get("/authors/index.html").headers["last-modified"]
+    response = client.get(
+        "/authors/index.html", headers={"If-Modified-Since": last_modified}
+    )
+    assert response.status_code == 304
+    earlier = "Mon, 01 Jan 2001 00:00:00 GMT"
+    response = client.get("/authors/index.html", headers={"If-Modified-Since": earlier})
+    assert response.status_code == 200
+    response = client.get("/authors/index.html", headers={"If-Modified-Since": "xxx"})
+    assert response.status_code == 200
+
+
+def test_reload_invalidates(client: TestClient) -> None:
+    """Replacing a resource means the page gets rendered again."""
+    url = "/gallery/examples/hello_world/index.html"
+    etag = client.get(url).headers["etag"]
+    resources = client.app.state.resources  # type: ignore
+    hello_world = Example(name="hello_world")
+    hello_world.title = "Hello Again"
+    resources.replace(hello_world)
+    response = client.get(url, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert "Hello Again" in response.text
+    assert response.headers["etag"] != etag
+
+
+def test_vary_user_agent(client: TestClient) -> None:
+    """The build and a browser get different PyScript URLs."""
+    url = "/gallery/examples/hello_world/index.html"
+    build = client.get(url)
+    browser = client.get(url, headers={"User-Agent": "Mozilla/5.0"})
+    assert 'src="https://pyscript.net/latest/pyscript.js"' in build.text
+    assert 'src="../../../pyscript/pyscript.js"' in browser.text
+
+
+def test_not_found_uncached(client: TestClient) -> None:
+    """Errors are not stored."""
+    assert client.get("/gallery/tags/xxx.html").status_code == 404
+    assert client.app.state.page_cache.pages == {}  # type: ignore
+
+
+def test_streaming_uncached(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Streamed code pages bypass the cache."""
+    monkeypatch.setattr("psc.settings.PAGE_CACHE", True)
+    monkeypatch.setattr("psc.settings.STREAM_LINKED_FILES", True)
+    with TestClient(app) as client:
+        response = client.get("/gallery/examples/hello_world/code.html")
+        assert response.status_code == 200
+        assert "etag" not in response.headers
+
+
+def test_disabled(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Without the cache, pages are rendered every time."""
+    monkeypatch.setattr("psc.settings.PAGE_CACHE", False)
+    with TestClient(app) as client:
+        response = client.get("/gallery/index.html")
+        assert response.status_code == 200
+        assert "etag" not in response.headers
+
+
+def test_default_by_debug() -> None:
+    """Unset, pages are only cached when templates aren't reloaded."""
+    with TestClient(app) as client:
+        assert client.app.state.page_cache is None  # type: ignore
+    configure_app(debug=False)
+    try:
+        with TestClient(app) as client:
+            assert client.app.state.page_cache is not None  # type: ignore
+    finally:
+        configure_app(debug=True)
+
+
+def test_asset_edited(
+    client: TestClient, monkeypatch: pytest.MonkeyPatch, tmp_path: Path
+) -> None:
+    """A cached page naming an edited asset is rendered again."""
+    # Edit a copy of the static files, served and fingerprinted in their place
+    copytree(HERE / "static", tmp_path / "static")
+    monkeypatch.setattr("psc.fingerprint.fingerprints", Fingerprints(tmp_path))
+    mount = next(r for r in app.routes if isinstance(r, Mount) and r.path == "/static")
+    static_files = FingerprintedStaticFiles(directory=tmp_path / "static")
+    monkeypatch.setattr(mount, "app", static_files)
+    stylesheet = tmp_path / "static/psc.css"
+    old_name = asset("static/psc.css")
+    assert old_name in client.get("/gallery/index.html").text
+
+    stylesheet.write_bytes(stylesheet.read_bytes() + b"\n/* Edited */\n")
+    # A browser with the cached page asks for the asset it names
+    response = client.get(f"/{old_name}")
+    assert response.status_code == 200
+    assert response.text.endswith("/* Edited */\n")
+    page = client.get("/gallery/index.html").text
+    new_name = asset("static/psc.css")
+    assert new_name != old_name
+    assert new_name in page and old_name not in page
@@ -0,0 +1,73 @@
+"""Every parser backend must give the same output as html5lib."""
+import pytest
+
+from psc.here import HERE
+from psc.parsers import benchmark
+from psc.parsers import get_available_parsers
+from psc.parsers import get_soup
+from psc.resources import Example
+from psc.resources import Page
+from psc.resources import get_body_content
+from psc.resources import get_head_nodes
+from psc.resources import get_sorted_paths
+
+
+EXAMPLES = [p.name for p in get_sorted_paths(HERE / "gallery/examples")]
+HTML_PAGES = [p.stem for p in (HERE / "pages").glob("*.html")]
+FAST_PARSERS = [p for p in get_available_parsers() if p != "html5lib"]
+
+
+def test_unknown_parser() -> None:
+    """Ask for a backend that does not exist."""
+    with pytest.raises(ValueError) as exc:
+        get_soup("<p></p>", "xxx")
+    assert str(exc.value) == "No parser named xxx"
+
+
+def test_available_parsers() -> None:
+    """The reference parser is always there."""
+    assert "html5lib" in get_available_parsers()
+
+
+@pytest.mark.parametrize("parser", FAST_PARSERS)
+@pytest.mark.parametrize("example_name", EXAMPLES)
+def test_example_equivalence(parser: str, example_name: str) -> None:
+    """The head nodes and body of each example match html5lib exactly."""
+    index_html = HERE / "gallery/examples" / example_name / "index.html"
+    text = index_html.read_text()
+    expected = get_soup(text, "html5lib")
+    actual = get_soup(text, parser)
+    assert get_head_nodes(actual) == get_head_nodes(expected)
+    assert get_body_content(actual) == get_body_content(expected)
+
+
+@pytest.mark.parametrize("parser", FAST_PARSERS)
+@pytest.mark.parametrize("page_name", HTML_PAGES)
+def test_page_equivalence(
+    parser: str, page_name: str, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """The HTML pages come out the same with each parser."""
+    expected = Page(name=page_name)
+    monkeypatch.setattr("psc.settings.PARSER", parser)
+    assert Page(name=page_name) == expected
+
+
+@pytest.mark.parametrize("parser", FAST_PARSERS)
+def test_example_resource(parser: str, monkeypatch: pytest.MonkeyPatch) -> None:
+    """The configured parser is used when constructing examples."""
+    expected = Example(name="interest_calculator")
+    monkeypatch.setattr("psc.settings.PARSER", parser)
+    assert Example(name="interest_calculator") == expected
+
+
+@pytest.mark.benchmark
+def test_benchmark() -> None:
+    """Compare the backends over the gallery, use ``-s`` to see the result."""
+    texts = [
+        (HERE / "gallery/examples" / name / "index.html").read_text()
+        for name in EXAMPLES
+    ]
+    timings = benchmark(texts, get_available_parsers(), repeat=3)
+    for parser, milliseconds in timings.items():
+        print(f"{parser}: {milliseconds:.2f} ms per example")
+    assert list(timings) == get_available_parsers()
@@ -0,0 +1,111 @@
+"""Time the phases of a request, or sample it, for debugging."""
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from starlette.testclient import TestClient
+
+from psc.app import app
+from psc.app import configure_app
+from psc.profiling import Sampler
+from psc.profiling import Timings
+from psc.profiling import get_timings
+from psc.profiling import timed
+
+
+def test_timed_outside_request() -> None:
+    """Without a timed request, ``timed`` records nothing."""
+    with timed("render"):
+        pass
+    assert get_timings() is None
+
+
+def test_timings_header() -> None:
+    """Phases add up, in milliseconds, with a description."""
+    timings = Timings()
+    timings.add("render", 0.001)
+    timings.add("render", 0.002)
+    timings.add("custom", 0.5)
+    assert timings.to_header() == (
+        'render;desc="Template";dur=3.00, custom;desc="custom";dur=500.00'
+    )
+
+
+def test_sampler() -> None:
+    """A busy thread's stack is counted, outermost frame first."""
+    sampler = Sampler(threading.get_ident(), interval=0.001)
+    with sampler.sampling():
+        deadline = time.perf_counter() + 0.05
+        while time.perf_counter() < deadline:
+            pass
+    folded = sampler.to_folded()
+    assert "test_sampler (test_profiling.py:" in folded
+    stack, count = folded.splitlines()[0].rsplit(" ", 1)
+    assert int(count) > 0
+    assert stack.index("test_sampler") > 0
+
+
+def test_server_timing_off() -> None:
+    """Responses have no ``Server-Timing`` unless asked for."""
+    with TestClient(app) as client:
+        response = client.get("/gallery/index.html")
+    assert "server-timing" not in response.headers
+
+
+def test_server_timing(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Each phase the request went through is in the header."""
+    monkeypatch.setattr("psc.settings.SERVER_TIMING", True)
+    monkeypatch.setattr("psc.settings.PAGE_CACHE", True)
+    with TestClient(app) as client:
+        first = client.get("/gallery/index.html")
+        again = client.get("/gallery/index.html")
+    phases = [m.split(";")[0] for m in first.headers["server-timing"].split(", ")]
+    assert phases == ["cache", "render", "app"]
+    assert "render;" not in again.headers["server-timing"]
+
+
+def test_server_timing_lazy(monkeypatch: pytest.MonkeyPatch, tmp_path: Path) -> None:
+    """Parsing a lazy example on first use is timed as resources."""
+    monkeypatch.setattr("psc.settings.SERVER_TIMING", True)
+    monkeypatch.setattr("psc.settings.LAZY", True)
+    monkeypatch.setattr("psc.settings.CACHE_ENABLED", False)
+    monkeypatch.setattr("psc.settings.SNAPSHOT_PATH", tmp_path / "missing")
+    with TestClient(app) as client:
+        response = client.get("/gallery/examples/hello_world/index.html")
+    assert "resources;" in response.headers["server-timing"]
+
+
+def test_profile_off() -> None:
+    """Without the debug setting, asking for a profile does nothing."""
+    with TestClient(app) as client:
+        response = client.get("/gallery/index.html?psc-profile")
+    assert response.headers["content-type"].startswith("text/html")
+
+
+def test_profile(monkeypatch: pytest.MonkeyPatch) -> None:
+    """A request asking for it gets its folded stacks as a download."""
+    monkeypatch.setattr("psc.settings.PROFILE", True)
+    monkeypatch.setattr("psc.settings.PROFILE_INTERVAL", 0.0001)
+    monkeypatch.setattr("psc.settings.PAGE_CACHE", False)
+    with TestClient(app) as client:
+        response = client.get("/search", headers={"X-PSC-Profile": "1"})
+    assert response.status_code == 200
+    disposition = response.headers["content-disposition"]
+    assert disposition == 'attachment; filename="search.folded"'
+    for line in response.text.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert stack and int(count) > 0
+
+
+def test_profile_production(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Outside debug mode, the setting alone doesn't allow profiling."""
+    monkeypatch.setattr("psc.settings.PROFILE", True)
+    configure_app(debug=False)
+    try:
+        with TestClient(app) as client:
+            response = client.get("/search", headers={"X-PSC-Profile": "1"})
+    finally:
+        configure_app(debug=True)
+    assert "content-disposition" not in response.headers
+    assert response.headers["content-type"].startswith("text/html")
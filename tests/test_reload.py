@@ -0,0 +1,96 @@
+"""Reload just the resources whose files changed."""
+import pytest
+from starlette.testclient import TestClient
+
+from psc.app import app
+from psc.reload import ResourceWatcher
+from psc.reload import get_fingerprint
+from psc.resources import Author
+from psc.resources import Example
+from psc.resources import Page
+from psc.resources import Resources
+from psc.resources import get_resources
+
+
+@pytest.fixture
+def resources() -> Resources:
+    """A fresh set of resources, since the watcher changes them."""
+    return get_resources()
+
+
+def test_get_fingerprint() -> None:
+    """A fingerprint covers each source file of the resource."""
+    fingerprint = get_fingerprint(Author, "meg-1")
+    assert len(fingerprint) == 1
+    assert fingerprint[0][0].endswith("meg-1.md")
+
+
+def test_check_unchanged(resources: Resources) -> None:
+    """Nothing changed, nothing reloaded."""
+    watcher = ResourceWatcher(resources)
+    assert watcher.check() == []
+    assert resources.version == 0
+
+
+def test_check_changed(resources: Resources) -> None:
+    """Only the changed example gets parsed and swapped in."""
+    watcher = ResourceWatcher(resources)
+    old_examples = resources.examples
+    old_hello_world = resources.examples["hello_world"]
+    # As if its files were saved since the watcher last looked
+    fingerprint = get_fingerprint(Example, "hello_world")
+    stale = tuple((path, mtime - 1, size) for path, mtime, size in fingerprint)
+    watcher.fingerprints[(Example, "hello_world")] = stale
+    changed = watcher.check()
+
+    assert changed == [(Example, "hello_world")]
+    assert resources.version == 1
+    assert resources.examples["hello_world"] is not old_hello_world
+    assert resources.examples["altair"] is old_examples["altair"]
+    # The old dict was swapped out, not changed underneath readers
+    assert old_examples["hello_world"] is old_hello_world
+    assert list(resources.examples) == list(old_examples)
+
+
+def test_check_added_and_removed(resources: Resources) -> None:
+    """Resources appearing on or vanishing from disk are handled."""
+    watcher = ResourceWatcher(resources)
+    del watcher.fingerprints[(Page, "about")]
+    watcher.fingerprints[(Example, "gone")] = ()
+    resources.examples["gone"] = resources.examples["altair"]
+
+    changed = watcher.check()
+    assert (Page, "about") in changed
+    assert (Example, "gone") in changed
+    assert "gone" not in resources.examples
+    assert resources.pages["about"].title == "About the PyScript Collective"
+
+
+def test_check_broken(
+    resources: Resources,
+    monkeypatch: pytest.MonkeyPatch,
+    caplog: pytest.LogCaptureFixture,
+) -> None:
+    """A resource that fails to parse keeps its old version, and is logged."""
+    watcher = ResourceWatcher(resources)
+    del watcher.fingerprints[(Page, "about")]
+    about = resources.pages["about"]
+
+    def broken(self: Page) -> None:
+        raise ValueError("Half-saved")
+
+    monkeypatch.setattr(Page, "__post_init__", broken)
+    assert watcher.check() == []
+    assert resources.pages["about"] is about
+    assert "Could not reload Page about: Half-saved" in caplog.text
+    # Not marked as seen, so the next check tries again
+    assert watcher.fingerprints[(Page, "about")] == ()
+
+
+def test_lifespan_watch(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The app runs the watcher when asked and stops it on shutdown."""
+    monkeypatch.setattr("psc.settings.WATCH", True)
+    monkeypatch.setattr("psc.settings.WATCH_INTERVAL", 0.01)
+    with TestClient(app) as client:
+        response = client.get("/gallery/examples/hello_world/")
+        assert response.status_code == 200
@@ -1,19 +1,29 @@
 """Construct the various kinds of resources: example, page, contributor."""
+import pickle  # noqa: S403
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Any
 
 import pytest
 from bs4 import BeautifulSoup
 
 from psc.here import HERE
+from psc.resources import DEFERRED_FIELDS
+from psc.resources import Author
 from psc.resources import Example
 from psc.resources import LinkedFile
 from psc.resources import Page
 from psc.resources import Resources
 from psc.resources import get_body_content
+from psc.resources import get_example_path
 from psc.resources import get_head_nodes
+from psc.resources import get_packages
 from psc.resources import get_resources
 from psc.resources import get_sorted_paths
 from psc.resources import is_local
+from psc.resources import load_resource
+from psc.resources import load_resources
+from psc.resources import refile
 from psc.resources import tag_filter
 
 
@@ -32,12 +42,6 @@ def head_soup() -> BeautifulSoup:
     return BeautifulSoup(head, "html5lib")
 
 
-@pytest.fixture(scope="module")
-def resources() -> Resources:
-    """Cache the generation of resources for this test file."""
-    return get_resources()
-
-
 def test_tag_filter(head_soup: BeautifulSoup) -> None:
     """Helper function to filter link and script from head."""
     excluded_link = head_soup.select("link")[0]
@@ -78,6 +82,40 @@ def test_get_main() -> None:
         assert body == '<py-config src="../py_config.cdn.toml">abc</py-config>'
 
 
+def test_get_body_content_pinned() -> None:
+    """Pinned wheels replace the packages in the py-config."""
+    example_html = '<body><py-config src="../x.toml">packages=["a"]</py-config></body>'
+    soup = BeautifulSoup(example_html, "html5lib")
+    body = get_body_content(soup, pinned=["https://cdn/a.whl"])
+    assert 'packages = [\n    "https://cdn/a.whl",\n]' in body
+    assert 'packages=["a"]' not in body
+
+
+def test_example_source_paths_lockfile(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """The lockfile is a source of every example, once there is one."""
+    lockfile = tmp_path / "packages.lock.json"
+    monkeypatch.setattr("psc.resources.LOCKFILE", lockfile)
+    assert lockfile not in Example.source_paths("altair")
+    lockfile.write_text("{}")
+    assert Example.source_paths("altair")[-1] == lockfile
+
+
+def test_get_resources_reads_lockfile_once(monkeypatch: pytest.MonkeyPatch) -> None:
+    """One load reads the lockfile once, not once per example."""
+    reads = []
+
+    def counting(path: Path) -> dict[str, Any]:
+        reads.append(path)
+        return {}
+
+    monkeypatch.setattr("psc.resources.read_lockfile", counting)
+    these_resources = get_resources()
+    assert len(reads) == 1
+    assert these_resources.examples["altair"].lockfile == {}
+
+
 def test_get_py_config_local() -> None:
     """Return the body node and test setting py-config src."""
     example_html = '<body><py-config src="../x.toml">abc</py-config></body>'
@@ -138,6 +176,32 @@ def test_linked_file() -> None:
     linked_path = HERE / "gallery/examples/altair/index.html"
     linked_file = LinkedFile(path=linked_path)
     assert "html" == linked_file.language
+    assert linked_file.relative_path == "index.html"
+
+
+def test_example_path_subdirectory() -> None:
+    """A linked file in a subdirectory keeps it, for the raw link."""
+    linked_path = HERE / "gallery/examples/altair/src/chart.py"
+    assert get_example_path(linked_path) == "src/chart.py"
+    assert get_example_path(linked_path.as_posix()) == "src/chart.py"
+
+
+def test_linked_file_stream() -> None:
+    """A streamed LinkedFile keeps only the metadata in memory."""
+    linked_path = HERE / "gallery/examples/hello_world/hello_world.js"
+    linked_file = LinkedFile(path=linked_path, stream=True)
+    assert linked_file.body == ""
+    assert linked_file.size == linked_path.stat().st_size
+    chunks = list(linked_file.iter_chunks(chunk_size=10))
+    assert len(chunks) > 1
+    assert "".join(chunks) == linked_path.read_text()
+
+
+def test_linked_file_chunks_in_memory() -> None:
+    """Without streaming, the body is the only chunk."""
+    linked_path = HERE / "gallery/examples/hello_world/hello_world.js"
+    linked_file = LinkedFile(path=linked_path)
+    assert list(linked_file.iter_chunks()) == [linked_path.read_text()]
 
 
 def test_markdown_page() -> None:
@@ -209,3 +273,164 @@ def test_authors(resources: Resources) -> None:
     authors = resources.authors
     first_author = list(authors.values())[0]
     assert "meg-1" == first_author.name
+
+
+def test_load_resource() -> None:
+    """Construct one resource and time it."""
+    this_page, load_time = load_resource(Page, "about")
+    assert isinstance(this_page, Page)
+    assert this_page.title == "About the PyScript Collective"
+    assert load_time > 0
+
+
+def test_load_resources_unknown_loader() -> None:
+    """Ask for a loader that does not exist."""
+    with pytest.raises(ValueError) as exc:
+        load_resources([(Page, "about")], loader="xxx")
+    assert str(exc.value) == "No loader named xxx"
+
+
+@pytest.mark.parametrize("loader", ["thread", "process"])
+def test_get_resources_parallel(resources: Resources, loader: str) -> None:
+    """The pool loaders produce the same resources, in the same order."""
+    parallel_resources = get_resources(loader=loader, max_workers=2)
+    assert parallel_resources == resources
+    assert list(parallel_resources.examples) == list(resources.examples)
+    assert list(parallel_resources.pages) == list(resources.pages)
+
+
+def test_load_times(resources: Resources) -> None:
+    """Each resource records how long it took to parse."""
+    assert "authors/meg-1" in resources.load_times
+    assert "examples/altair" in resources.load_times
+    assert "pages/about" in resources.load_times
+    assert len(resources.load_times) == (
+        len(resources.authors) + len(resources.examples) + len(resources.pages)
+    )
+
+
+def test_lazy_example() -> None:
+    """A lazy example has the metadata, but parses the HTML on first use."""
+    this_example = Example(name="interest_calculator", lazy=True)
+    assert this_example.title == "Compound Interest Calculator"
+    assert this_example.author == "meg-1"
+    for field_name in DEFERRED_FIELDS:
+        assert field_name not in this_example.__dict__
+
+    assert "Welcome to the" in this_example.body
+    for field_name in DEFERRED_FIELDS:
+        assert field_name in this_example.__dict__
+    assert "styles.css" in this_example.extra_head
+    assert this_example == Example(name="interest_calculator")
+
+
+def test_lazy_example_threads(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Many threads asking at once still only parse once."""
+    calls = []
+    load_html = Example.load_html
+
+    def counting_load_html(self: Example, linked_names: None = None) -> None:
+        calls.append(self.name)
+        load_html(self, linked_names)
+
+    monkeypatch.setattr(Example, "load_html", counting_load_html)
+    this_example = Example(name="hello_world", lazy=True)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        bodies = set(executor.map(lambda _: this_example.body, range(32)))
+    assert len(bodies) == 1
+    assert calls == ["hello_world"]
+
+
+def test_lazy_example_lock_per_example() -> None:
+    """Parsing one lazy example doesn't hold up another."""
+    this_example = Example(name="hello_world", lazy=True)
+    other_example = Example(name="interest_calculator", lazy=True)
+    with this_example.parse_lock, ThreadPoolExecutor(max_workers=1) as executor:
+        body = executor.submit(lambda: other_example.body).result(timeout=10)
+    assert "Welcome to the" in body
+
+
+def test_lazy_example_pickle() -> None:
+    """An unparsed lazy example survives the cache and process pools."""
+    this_example = Example(name="hello_world", lazy=True)
+    restored = pickle.loads(pickle.dumps(this_example))  # noqa: S301
+    assert "body" not in restored.__dict__
+    assert restored.parse_lock is not this_example.parse_lock
+    assert [f.path.name for f in restored.linked_files] == [
+        "index.html",
+        "hello_world.css",
+        "hello_world.js",
+    ]
+
+
+def test_get_resources_lazy(resources: Resources) -> None:
+    """Lazy resources end up the same as eager ones."""
+    lazy_resources = get_resources(lazy=True)
+    assert "body" not in lazy_resources.examples["altair"].__dict__
+    assert lazy_resources == resources
+
+
+def test_get_packages() -> None:
+    """Packages come from the py-config, in either quote style."""
+    html = """<py-config src="x.toml">
+    packages=["pandas", 'altair']
+    </py-config><p>packages = ["not", "these"]</p>"""
+    assert get_packages(html) == ["altair", "pandas"]
+    assert get_packages("<py-config></py-config>") == []
+
+
+def test_example_tags_packages() -> None:
+    """Tags come from the frontmatter, packages from the HTML."""
+    this_example = Example(name="altair", lazy=True)
+    assert this_example.tags == ["visualization", "data"]
+    assert this_example.packages == ["altair", "pandas", "vega_datasets"]
+    assert "body" not in this_example.__dict__
+
+
+def test_secondary_indexes(resources: Resources) -> None:
+    """Examples are listed by author, tag, and package."""
+    assert resources.author_examples == {"meg-1": ("interest_calculator",)}
+    assert resources.tag_examples["beginner"] == ("hello_world", "hello_world_py")
+    assert resources.package_examples["pandas"] == ("altair",)
+
+
+def test_refile() -> None:
+    """Move one example between keys, dropping keys left empty."""
+    index = {"a": ("x", "y"), "b": ("x",)}
+    assert refile(index, "x", ["c"]) == {"a": ("y",), "c": ("x",)}
+    assert refile(index, "z", ["a"]) == {"a": ("x", "y", "z"), "b": ("x",)}
+    assert index == {"a": ("x", "y"), "b": ("x",)}
+
+
+def test_secondary_indexes_reload() -> None:
+    """Replacing or removing an example keeps the indexes current."""
+    these_resources = get_resources()
+    old_tags = these_resources.tag_examples
+    these_resources.remove(Example, "hello_world")
+    assert these_resources.tag_examples["beginner"] == ("hello_world_py",)
+    assert old_tags["beginner"] == ("hello_world", "hello_world_py")
+    these_resources.replace(Example(name="hello_world"))
+    assert these_resources.tag_examples == old_tags
+    these_resources.remove(Author, "meg-1")
+    assert these_resources.author_examples == {"meg-1": ("interest_calculator",)}
+
+
+def test_publish_together(monkeypatch: pytest.MonkeyPatch) -> None:
+    """The dict isn't assigned until its indexes are ready to go with it."""
+    these_resources = get_resources()
+    get_indexes = Resources.get_indexes
+    seen = []
+
+    def spy(
+        self: Resources, kind_name: str, name: str, resources: dict[str, Any]
+    ) -> dict[str, Any]:
+        seen.append(name in self.examples)
+        return get_indexes(self, kind_name, name, resources)
+
+    monkeypatch.setattr(Resources, "get_indexes", spy)
+    version = these_resources.version
+    these_resources.remove(Example, "hello_world")
+    assert seen == [True]
+    assert "hello_world" not in these_resources.examples
+    assert "hello_world" not in these_resources.search_index.documents
+    assert these_resources.version == version + 1
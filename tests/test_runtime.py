@@ -0,0 +1,134 @@
+"""Serve runtime files with long-lived caching and byte ranges."""
+from pathlib import Path
+
+import pytest
+from starlette.applications import Starlette
+from starlette.routing import Mount
+from starlette.testclient import TestClient
+
+from psc.media_types import get_media_type
+from psc.runtime import IMMUTABLE
+from psc.runtime import RuntimeFiles
+from psc.runtime import parse_range
+
+
+WASM = bytes(range(256)) * 1024
+
+
+@pytest.fixture
+def client(tmp_path: Path) -> TestClient:
+    """Mount a directory holding a runtime file."""
+    (tmp_path / "pyodide.asm.wasm").write_bytes(WASM)
+    runtime_files = RuntimeFiles(directory=tmp_path)
+    return TestClient(Starlette(routes=[Mount("/pyodide", runtime_files)]))
+
+
+@pytest.mark.parametrize(
+    "range_header, expected",
+    [
+        ("bytes=0-99", (0, 99)),
+        ("bytes=100-", (100, 999)),
+        ("bytes=-100", (900, 999)),
+        ("bytes=-5000", (0, 999)),
+        ("bytes=900-5000", (900, 999)),
+        ("bytes=0-1,5-6", None),
+        ("bytes=5-1", None),
+        ("items=0-1", None),
+        ("bytes=x-1", None),
+    ],
+)
+def test_parse_range(range_header: str, expected: tuple[int, int] | None) -> None:
+    """One range is supported, anything else means the whole file."""
+    assert parse_range(range_header, 1000) == expected
+
+
+@pytest.mark.parametrize("range_header", ["bytes=1000-", "bytes=-0"])
+def test_parse_range_unsatisfiable(range_header: str) -> None:
+    """A range past the end cannot be served."""
+    with pytest.raises(ValueError):
+        parse_range(range_header, 1000)
+
+
+def test_media_types() -> None:
+    """The runtime's files get the types browsers insist on."""
+    assert get_media_type("pyodide.asm.wasm") == "application/wasm"
+    assert get_media_type("pyodide.js") == "text/javascript"
+    assert get_media_type("pyodide.asm.data") == "application/octet-stream"
+    assert get_media_type("x/numpy-1.22.4-cp310-cp310-emscripten.whl") == (
+        "application/zip"
+    )
+    assert get_media_type("logo.png") == "image/png"
+    assert get_media_type("unknown.nosuchtype") == "application/octet-stream"
+
+
+def test_full_file(client: TestClient) -> None:
+    """The whole file, marked immutable and as supporting ranges."""
+    response = client.get("/pyodide/pyodide.asm.wasm")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/wasm"
+    assert response.headers["cache-control"] == IMMUTABLE
+    assert response.headers["accept-ranges"] == "bytes"
+    assert response.content == WASM
+
+
+def test_range(client: TestClient) -> None:
+    """A range request gets just those bytes."""
+    response = client.get("/pyodide/pyodide.asm.wasm", headers={"Range": "bytes=10-19"})
+    assert response.status_code == 206
+    assert response.content == WASM[10:20]
+    assert response.headers["content-range"] == f"bytes 10-19/{len(WASM)}"
+    assert response.headers["content-length"] == "10"
+    assert response.headers["content-type"] == "application/wasm"
+    assert response.headers["cache-control"] == IMMUTABLE
+
+
+def test_range_head(tmp_path: Path) -> None:
+    """A HEAD range request gets the headers of the range, no body."""
+    full_path = tmp_path / "pyodide.asm.wasm"
+    full_path.write_bytes(WASM)
+    scope = {"type": "http", "method": "HEAD", "headers": [(b"range", b"bytes=10-19")]}
+    runtime_files = RuntimeFiles(directory=tmp_path)
+    response = runtime_files.file_response(full_path, full_path.stat(), scope)
+    assert response.status_code == 206
+    assert response.body == b""
+    assert response.headers["content-range"] == f"bytes 10-19/{len(WASM)}"
+    assert response.headers["content-length"] == "10"
+    assert response.headers["content-type"] == "application/wasm"
+
+
+def test_range_to_end(client: TestClient) -> None:
+    """Resume a download from an offset, across several chunks."""
+    start = 100_000
+    response = client.get(
+        "/pyodide/pyodide.asm.wasm", headers={"Range": f"bytes={start}-"}
+    )
+    assert response.status_code == 206
+    assert response.content == WASM[start:]
+
+
+def test_range_unsatisfiable(client: TestClient) -> None:
+    """A range past the end is refused, with the size."""
+    response = client.get(
+        "/pyodide/pyodide.asm.wasm", headers={"Range": f"bytes={len(WASM)}-"}
+    )
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(WASM)}"
+
+
+def test_if_range(client: TestClient) -> None:
+    """Resume only when the file is unchanged, else send all of it."""
+    etag = client.get("/pyodide/pyodide.asm.wasm").headers["etag"]
+    url = "/pyodide/pyodide.asm.wasm"
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": etag})
+    assert response.status_code == 206
+    response = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"old"'})
+    assert response.status_code == 200
+    assert response.content == WASM
+
+
+def test_not_modified(client: TestClient) -> None:
+    """Revalidation still works, and keeps the caching headers."""
+    etag = client.get("/pyodide/pyodide.asm.wasm").headers["etag"]
+    response = client.get("/pyodide/pyodide.asm.wasm", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["cache-control"] == IMMUTABLE
@@ -0,0 +1,142 @@
+"""Search the examples through the inverted index."""
+import pytest
+from starlette.testclient import TestClient
+
+from psc.app import app
+from psc.fixtures import PageT
+from psc.resources import Author
+from psc.resources import Example
+from psc.resources import Resources
+from psc.resources import get_resources
+from psc.search import SearchIndex
+from psc.search import build_search_index
+from psc.search import get_terms
+
+
+@pytest.fixture
+def resources() -> Resources:
+    """A fresh set of resources, since some tests change them."""
+    return get_resources()
+
+
+def test_get_terms() -> None:
+    """Markup and single letters are dropped, the rest lowercased."""
+    assert get_terms("<p>The <em>Hello</em> World, a py_script!</p>") == [
+        "the",
+        "hello",
+        "world",
+        "py_script",
+    ]
+
+
+def test_search_ranking(resources: Resources) -> None:
+    """A match in the title outranks one in the subtitle or code."""
+    results = resources.search_index.search("hello")
+    names = [result.name for result in results]
+    assert set(names[:2]) == {"hello_world", "hello_world_py"}
+    assert results[0].title.startswith("Hello World")
+
+
+def test_search_all_terms_first(resources: Resources) -> None:
+    """Examples matching every query term come before partial matches."""
+    results = resources.search_index.search("hello python")
+    assert results[0].name == "hello_world_py"
+
+
+def test_search_author(resources: Resources) -> None:
+    """The author's display name is searchable."""
+    results = resources.search_index.search("Margaret")
+    assert [result.name for result in results] == ["interest_calculator"]
+
+
+def test_search_code(resources: Resources) -> None:
+    """Text only found in a linked file still matches."""
+    results = resources.search_index.search("antigravity")
+    assert results[0].name == "antigravity"
+
+
+def test_search_no_match(resources: Resources) -> None:
+    """Unknown terms, and queries without terms, find nothing."""
+    assert resources.search_index.search("xyzzy") == []
+    assert resources.search_index.search("!") == []
+
+
+def test_remove() -> None:
+    """Removing the last example using a term drops the term."""
+    search_index = build_search_index([Example(name="hello_world")], {})
+    assert "hello" in search_index.postings
+    search_index.remove("hello_world")
+    assert search_index.postings == {}
+    assert search_index.documents == {}
+
+
+def test_to_json(resources: Resources) -> None:
+    """The exported index refers to documents by position."""
+    exported = resources.search_index.to_json()
+    names = [document["name"] for document in exported["documents"]]
+    assert names == list(resources.examples)
+    position, weight = exported["terms"]["margaret"][0]
+    assert names[position] == "interest_calculator"
+    assert weight > 0
+
+
+def test_replace_updates_index(resources: Resources) -> None:
+    """Reloading an example or author swaps in a new index."""
+    old_index = resources.search_index
+    resources.replace(Example(name="hello_world"))
+    assert resources.search_index is not old_index
+    assert resources.search_index.search("hello")
+
+    resources.remove(Example, "hello_world")
+    assert "hello_world" not in resources.search_index.documents
+    assert "hello_world" in old_index.documents
+
+    resources.remove(Author, "meg-1")
+    assert resources.search_index.search("Margaret") == []
+
+
+def test_copy() -> None:
+    """Changing a copy leaves the original alone."""
+    search_index = SearchIndex(postings=dict(a={"x": 1.0}), documents=dict(x={}))
+    copied = search_index.copy()
+    copied.remove("x")
+    assert search_index.postings == dict(a={"x": 1.0})
+
+
+def test_search_page(client_page: PageT) -> None:
+    """The navbar leads to the search page, which shows ranked results."""
+    soup = client_page("/")
+    search_link = soup.select_one("#navbarSearch")
+    assert search_link
+    assert search_link.get("href") == "./search/index.html"
+
+    soup = client_page("/search/index.html?q=Margaret")
+    search_input = soup.select_one("#search_query")
+    assert search_input and search_input.get("value") == "Margaret"
+    links = soup.select("#search_results p.title a")
+    assert [link.text for link in links] == ["Compound Interest Calculator"]
+    assert links[0].get("href") == "../gallery/examples/interest_calculator/"
+
+
+def test_search_page_empty(client_page: PageT) -> None:
+    """Without a query there are no results, with no match a message."""
+    soup = client_page("/search")
+    assert soup.select("#search_results article") == []
+    assert soup.select_one("p.no-results") is None
+    soup = client_page("/search?q=xyzzy")
+    assert soup.select_one("p.no-results")
+
+
+def test_search_index_json(test_client: TestClient) -> None:
+    """The prebuilt index is served for the static site."""
+    response = test_client.get("/search/index.json")
+    assert response.status_code == 200
+    assert response.json()["format"] == 1
+
+
+def test_search_compact(monkeypatch: pytest.MonkeyPatch) -> None:
+    """Compact resources keep the index."""
+    monkeypatch.setattr("psc.settings.COMPACT", True)
+    with TestClient(app) as client:
+        response = client.get("/search?q=antigravity")
+        assert "xkcd Antigravity" in response.text
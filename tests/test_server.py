@@ -0,0 +1,103 @@
+"""Serve in production: preloaded, pre-forked, stopped gracefully."""
+import gc
+import os
+import signal
+import socket
+import subprocess  # noqa: S404, runs this Python's own child
+import sys
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from urllib.error import URLError
+from urllib.request import urlopen
+
+import pytest
+from starlette.testclient import TestClient
+
+from psc.app import app
+from psc.app import configure_app
+from psc.app import templates
+from psc.server import get_config
+from psc.server import preload
+
+
+SERVE = """
+from psc.server import get_config, serve
+serve(get_config(port={port}), workers={workers}, graceful_timeout=5, production=True)
+"""
+
+
+@pytest.fixture
+def preloaded() -> Iterator[None]:
+    """Resources preloaded as for forking, then forgotten."""
+    preload()
+    yield
+    gc.unfreeze()
+    del app.state.preloaded
+
+
+def get_free_port() -> int:
+    """A port nothing is listening on."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port: int = sock.getsockname()[1]
+        return port
+
+
+def test_get_config() -> None:
+    """Keep-alive and the bind address come from the options."""
+    config = get_config("localhost", 8000, keep_alive=30)
+    assert (config.host, config.port) == ("localhost", 8000)
+    assert config.timeout_keep_alive == 30
+    assert not config.server_header
+
+
+def test_configure_app() -> None:
+    """Production turns off tracebacks and template reloading."""
+    configure_app(debug=False)
+    assert (app.debug, templates.env.auto_reload) == (False, False)
+    configure_app(debug=True)
+    assert (app.debug, templates.env.auto_reload) == (True, True)
+
+
+def test_preload(preloaded: None) -> None:
+    """The lifespan uses the preloaded resources, not loading its own."""
+    with TestClient(app) as client:
+        assert client.app.state.resources is app.state.preloaded  # type: ignore
+        assert client.get("/gallery/index.html").status_code == 200
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="Needs os.fork")
+@pytest.mark.parametrize("workers", [1, 2])
+def test_supervisor(tmp_path: Path, workers: int) -> None:
+    """Workers serve on one port, and all stop on SIGTERM."""
+    port = get_free_port()
+    env = {
+        **os.environ,
+        "PYTHONPATH": os.pathsep.join(sys.path),
+        "PSC_CACHE_DIR": str(tmp_path / "cache"),
+        "PSC_SNAPSHOT": str(tmp_path / "resources.snapshot"),
+    }
+    # Forking workers needs a process of its own, running this Python
+    process = subprocess.Popen(  # noqa: S603
+        [sys.executable, "-c", SERVE.format(port=port, workers=workers)],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                # The workers listen on a real socket, out of TestClient's reach
+                url = f"http://127.0.0.1:{port}/gallery/index.html"
+                with urlopen(url) as response:  # noqa: S310
+                    assert response.status == 200
+                    break
+            except URLError:
+                assert time.monotonic() < deadline
+                time.sleep(0.1)
+        process.send_signal(signal.SIGTERM)
+        assert process.wait(timeout=10) == 0
+    finally:
+        process.kill()
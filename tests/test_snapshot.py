@@ -0,0 +1,97 @@
+"""Save and load the fully loaded resources in one file."""
+from pathlib import Path
+
+import pytest
+from starlette.testclient import TestClient
+
+from psc.app import app
+from psc.compact import compact_resources
+from psc.here import HERE
+from psc.resources import Resources
+from psc.snapshot import HEADER
+from psc.snapshot import SnapshotReader
+from psc.snapshot import SnapshotWriter
+from psc.snapshot import load_snapshot
+from psc.snapshot import write_snapshot
+
+
+@pytest.fixture
+def snapshot_path(tmp_path: Path, resources: Resources) -> Path:
+    """A current snapshot of the resources."""
+    path = tmp_path / "resources.snapshot"
+    write_snapshot(resources, path)
+    return path
+
+
+def test_writer_reader() -> None:
+    """Values come back in order, with repeated strings stored once."""
+    writer = SnapshotWriter()
+    writer.texts(["a", "b", "a"])
+    writer.number(42)
+    assert list(writer.strings) == ["a", "b"]
+    reader = SnapshotReader(list(writer.strings), list(writer.numbers), [])
+    assert reader.texts() == ["a", "b", "a"]
+    assert reader.number() == 42
+
+
+def test_round_trip(resources: Resources, snapshot_path: Path) -> None:
+    """The loaded resources match the ones that were saved."""
+    loaded = load_snapshot(snapshot_path)
+    assert loaded == resources
+    assert loaded.search_index == resources.search_index
+    assert loaded.tag_examples == resources.tag_examples
+    assert loaded.author_examples == resources.author_examples
+    hello_world = loaded.examples["hello_world"]
+    assert hello_world.linked_files[1].path == HERE / (
+        "gallery/examples/hello_world/hello_world.css"
+    )
+    assert hello_world.linked_files == resources.examples["hello_world"].linked_files
+
+
+def test_compact_round_trip(resources: Resources, tmp_path: Path) -> None:
+    """Compact resources can be saved too."""
+    path = tmp_path / "resources.snapshot"
+    write_snapshot(compact_resources(resources), path)
+    assert load_snapshot(path) == resources
+
+
+def test_strings_shared(snapshot_path: Path) -> None:
+    """Text repeated across examples is stored once."""
+    loaded = load_snapshot(snapshot_path)
+    assert loaded
+    hello_world = loaded.examples["hello_world"]
+    hello_world_py = loaded.examples["hello_world_py"]
+    assert hello_world.extra_head is hello_world_py.extra_head
+
+
+def test_missing(tmp_path: Path) -> None:
+    """No snapshot, or not a snapshot, means no resources."""
+    assert load_snapshot(tmp_path / "missing.snapshot") is None
+    empty = tmp_path / "empty.snapshot"
+    empty.write_bytes(b"")
+    assert load_snapshot(empty) is None
+    garbage = tmp_path / "garbage.snapshot"
+    garbage.write_bytes(b"x" * HEADER.size)
+    assert load_snapshot(garbage) is None
+
+
+def test_stale(snapshot_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    """A snapshot of other sources is ignored."""
+    monkeypatch.setattr("psc.snapshot.get_snapshot_key", lambda: "0" * 64)
+    assert load_snapshot(snapshot_path) is None
+
+
+def test_app_uses_snapshot(
+    snapshot_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    """The app loads the snapshot instead of parsing the resources."""
+
+    def no_parsing(**kwargs: object) -> Resources:
+        raise AssertionError("Resources were parsed")
+
+    monkeypatch.setattr("psc.settings.SNAPSHOT_PATH", snapshot_path)
+    monkeypatch.setattr("psc.app.get_resources", no_parsing)
+    with TestClient(app) as client:
+        response = client.get("/gallery/examples/hello_world/code.html")
+        assert response.status_code == 200
+        assert "hello_world.css" in response.text